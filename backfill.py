@@ -0,0 +1,98 @@
+# Imported first so that the startup report covers the other imports
+from src.utils.timing import startup  # isort: skip
+
+import argparse
+import logging
+import os
+
+import openai
+from qdrant_client import QdrantClient
+
+from src.agents.backfill import BackfillEngine
+from src.aggregators.aggregator import (
+    EntityCooccurrenceAggregator,
+    KeywordsAggregator,
+    SentimentAggregator,
+)
+from src.aggregators.materialized import MaterializedWindows
+from src.databases.database import MongoDatabase
+from src.enrichers.batch import BatchEnricher
+from src.enrichers.enricher import ENRICHERS
+from src.knowledge.news_knowledge import QdrantNewsKnowledge
+from src.knowledge.stories import StoryClusterer
+from src.telemetry.telemetry import setup_tracing, start_metrics_server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Re-run enrichers over the articles already stored."
+    )
+    parser.add_argument(
+        "--enrichers",
+        nargs="+",
+        choices=list(ENRICHERS),
+        default=list(ENRICHERS),
+        help="enrichers to re-run, in order",
+    )
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--name", default="backfill", help="cursor name")
+    parser.add_argument("--country", help="only reprocess this country, e.g. IT")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--page-size", type=int, default=256)
+    parser.add_argument("--limit", type=int, help="stop after this many articles")
+    parser.add_argument(
+        "--batch", action="store_true", help="use the OpenAI Batch API"
+    )
+    parser.add_argument(
+        "--restart", action="store_true", help="ignore the saved cursor"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO,
+    )
+    startup.mark("imports")
+    setup_tracing("notiziario-backfill")
+    start_metrics_server()
+
+    db = MongoDatabase(
+        host="mongo",
+        db_name="notiziario",
+        username="root",
+        password="example",
+        port=27017,
+        write_buffer_size=500,
+    )
+    qdrant = QdrantClient(host="db", port=6333)
+    knowledge = QdrantNewsKnowledge(
+        db=qdrant,
+        vector_dim=1024,
+        embedding_model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+        sparse_embedding_model_name="Qdrant/bm42-all-minilm-l6-v2-attentions",
+        optimize_onnx=os.getenv("NOTIZIARIO_OPTIMIZE_ONNX") == "1",
+        cold_store=db,
+        clusterer=StoryClusterer(qdrant),
+    )
+    openai_client = openai.OpenAI()
+
+    engine = BackfillEngine(
+        knowledge=knowledge,
+        database=db,
+        enrichers=[ENRICHERS[name](openai_client) for name in args.enrichers],
+        model_name=args.model,
+        aggregators=[
+            KeywordsAggregator(db),
+            SentimentAggregator(db),
+            EntityCooccurrenceAggregator(db),
+        ],
+        views=[MaterializedWindows(db)],
+        name=args.name,
+        metadata={"country": args.country} if args.country else None,
+        workers=args.workers,
+        page_size=args.page_size,
+        batch=BatchEnricher(openai_client, args.model) if args.batch else None,
+    )
+    startup.mark("clients")
+    startup.report()
+    engine.run(restart=args.restart, limit=args.limit)
+    db.flush()
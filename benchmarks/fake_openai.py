@@ -0,0 +1,201 @@
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from uuid import uuid4
+
+WORD = re.compile(r"[A-Za-zÀ-ÿ]{4,}")
+
+
+def _words(text: str) -> list[str]:
+    return WORD.findall(re.sub(r"<[^>]+>", " ", text))
+
+
+def completion_content(system: str, user: str) -> dict:
+    """Plausible enricher output, derived from the article text."""
+    words = _words(user)
+    capitalized = [word for word in words if word[0].isupper()]
+    if '"summary"' in system:
+        return {"summary": " ".join(_words(user.split("\n\n", 1)[-1]))}
+    if '"entities"' in system:
+        return {"entities": capitalized[:5]}
+    if '"sentiment"' in system:
+        score = len(words) % 6
+        sentiment = "negative" if score < 2 else "neutral" if score < 4 else "positive"
+        return {"sentiment": sentiment, "sentiment_score": float(score)}
+    if '"categories"' in system:
+        return {"categories": [word.lower() for word in words[:2]]}
+    return {"keywords": [word.lower() for word in words[-4:]]}
+
+
+class FakeOpenAIServer:
+    """Local stand-in for the chat completions endpoint of the OpenAI API.
+
+    Answers every request after ``latency`` (plus up to ``jitter``) seconds with
+    JSON shaped like the enricher asked for, fails a fraction ``error_rate`` of
+    them with a 500 and rejects a fraction ``rate_limit_rate`` with a 429, which
+    the OpenAI client retries after ``retry_after`` seconds. Without a JSON
+    schema as response format, a fraction ``malformed_rate`` of the answers is
+    fenced and has a trailing comma, as models sometimes do. Prompt caching is
+    mimicked on the system message: once seen, it is reported as cached in
+    128 token steps if it is at least ``min_cached_tokens`` long.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.2,
+        jitter: float = 0.1,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 0.1,
+        malformed_rate: float = 0.0,
+        min_cached_tokens: int = 1024,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.malformed_rate = malformed_rate
+        self.min_cached_tokens = min_cached_tokens
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.malformed = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self._prefixes = set()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _draw(self) -> tuple[float, float, float]:
+        with self._lock:
+            return self.random.random(), self.random.random(), self.random.random()
+
+    def _cached_tokens(self, model: str, system: str) -> int:
+        tokens = len(system) // 4
+        with self._lock:
+            seen = (model, system) in self._prefixes
+            self._prefixes.add((model, system))
+        if not seen or tokens < self.min_cached_tokens:
+            return 0
+        return tokens // 128 * 128
+
+    def _count(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status: int, body: dict, headers: dict = None):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                request = json.loads(self.rfile.read(length))
+                server._count(calls=1)
+                fail, delay, malformed = server._draw()
+                if fail < server.rate_limit_rate:
+                    server._count(rate_limited=1)
+                    return self._reply(
+                        429,
+                        {"error": {"message": "Rate limited", "type": "requests"}},
+                        {"retry-after-ms": str(int(server.retry_after * 1000))},
+                    )
+                time.sleep(server.latency + delay * server.jitter)
+                if fail < server.rate_limit_rate + server.error_rate:
+                    server._count(errors=1)
+                    return self._reply(
+                        500, {"error": {"message": "Injected error", "type": "server"}}
+                    )
+
+                messages = request["messages"]
+                system = " ".join(
+                    m["content"] for m in messages if m["role"] == "system"
+                )
+                user = " ".join(m["content"] for m in messages if m["role"] == "user")
+                content = json.dumps(completion_content(system, user))
+                structured = "response_format" in request
+                if not structured and malformed < server.malformed_rate:
+                    server._count(malformed=1)
+                    content = f"```json\n{content[:-1]},\n}}\n```"
+                prompt_tokens = (len(system) + len(user)) // 4
+                completion_tokens = len(content) // 4
+                cached_tokens = server._cached_tokens(request["model"], system)
+                server._count(
+                    prompt_tokens=prompt_tokens,
+                    completion_tokens=completion_tokens,
+                    cached_tokens=cached_tokens,
+                )
+                self._reply(
+                    200,
+                    {
+                        "id": f"chatcmpl-{uuid4().hex}",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": request["model"],
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {"role": "assistant", "content": content},
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": {
+                            "prompt_tokens": prompt_tokens,
+                            "completion_tokens": completion_tokens,
+                            "total_tokens": prompt_tokens + completion_tokens,
+                            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+                        },
+                    },
+                )
+
+        return Handler
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "rate_limited": self.rate_limited,
+                "malformed": self.malformed,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cached_tokens": self.cached_tokens,
+            }
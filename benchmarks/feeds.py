@@ -0,0 +1,168 @@
+import argparse
+import hashlib
+import os
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+WORDS = (
+    "governo parlamento elezioni economia mercati inflazione energia clima "
+    "government parliament election economy markets inflation energy climate "
+    "football championship transfer stadium science research hospital health "
+    "technology startup investment bank strike protest summit minister court"
+).split()
+NAMES = (
+    "Roma Milano Napoli Europa Washington London Berlin Paris Madrid "
+    "Meloni Mattarella Biden Trump Macron Scholz Sanchez Draghi Lagarde"
+).split()
+PUBLISHERS = ("Corriere", "Repubblica", "Reuters", "AP News", "BBC", "Le Monde")
+
+
+def _sentence(rng: random.Random, length: int) -> str:
+    words = [
+        rng.choice(NAMES) if rng.random() < 0.3 else rng.choice(WORDS)
+        for _ in range(length)
+    ]
+    return " ".join(words).capitalize()
+
+
+def generate_feed(country: str, page: int, items: int, seed: int = 0) -> bytes:
+    """A Google News style RSS feed with ``items`` new entries per page."""
+    rng = random.Random(f"{seed}:{country}:{page}")
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    entries = []
+    for i in range(items):
+        number = page * items + i
+        title = _sentence(rng, rng.randint(6, 12))
+        publisher = rng.choice(PUBLISHERS)
+        link = f"https://news.example.com/{country.lower()}/{number}"
+        related = "".join(
+            f'<li><a href="{link}/{j}" target="_blank">{_sentence(rng, 6)}</a>'
+            f'&nbsp;&nbsp;<font color="#6f6f6f">{rng.choice(PUBLISHERS)}</font></li>'
+            for j in range(rng.randint(1, 4))
+        )
+        published = now - timedelta(minutes=number)
+        entries.append(
+            f"<item><title>{escape(title)} - {publisher}</title>"
+            f"<link>{link}</link>"
+            f'<guid isPermaLink="false">{country}-{seed}-{number}</guid>'
+            f"<pubDate>{format_datetime(published, usegmt=True)}</pubDate>"
+            f"<description>{escape(f'<ol>{related}</ol>')}</description>"
+            f'<source url="https://{publisher.lower().replace(" ", "")}.example">'
+            f"{publisher}</source></item>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+        f"<title>Top stories - {country}</title>{''.join(entries)}</channel></rss>"
+    ).encode()
+
+
+class FeedServer:
+    """Serves RSS feeds to ``FeedFetcher`` from a local HTTP server.
+
+    A feed recorded in ``fixtures_dir`` as ``<COUNTRY>.xml`` is served as is,
+    so only the first cycle finds new articles in it. Other countries get a
+    generated feed with ``items`` new entries on every request. Responses carry
+    an ETag, and a request whose If-None-Match matches the feed gets a 304.
+    """
+
+    def __init__(
+        self,
+        fixtures_dir: str = FIXTURES_DIR,
+        items: int = 20,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.fixtures_dir = fixtures_dir
+        self.items = items
+        self.seed = seed
+        self.requests: dict[str, int] = {}
+        self.not_modified: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def url_template(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/{{country}}.xml"
+
+    def feed(self, country: str) -> bytes:
+        path = os.path.join(self.fixtures_dir or "", f"{country}.xml")
+        if self.fixtures_dir and os.path.exists(path):
+            with open(path, "rb") as f:
+                return f.read()
+        with self._lock:
+            page = self.requests.get(country, 0)
+            self.requests[country] = page + 1
+        return generate_feed(country, page, self.items, self.seed)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                country = self.path.strip("/").split(".")[0].upper()
+                body = server.feed(country)
+                etag = f'"{hashlib.sha1(body).hexdigest()}"'
+                if self.headers.get("If-None-Match") == etag:
+                    with server._lock:
+                        server.not_modified[country] = (
+                            server.not_modified.get(country, 0) + 1
+                        )
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Type", "application/rss+xml")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self) -> "FeedServer":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def record(countries: list[str], fixtures_dir: str = FIXTURES_DIR):
+    """Save the current Google News feeds of the countries as fixtures."""
+    from src.agents.agent import Country
+    from src.feeds.fetcher import GOOGLE_NEWS_URL
+
+    os.makedirs(fixtures_dir, exist_ok=True)
+    for name in countries:
+        country = Country[name]
+        url = GOOGLE_NEWS_URL.format(country=country.name(), lang=country.language())
+        request = Request(url, headers={"User-Agent": "notiziario"})
+        with urlopen(request, timeout=30) as response:
+            body = response.read()
+        path = os.path.join(fixtures_dir, f"{country.name()}.xml")
+        with open(path, "wb") as f:
+            f.write(body)
+        print(f"Recorded {url} to {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record RSS fixtures.")
+    parser.add_argument("countries", nargs="+", help="e.g. ITALY USA")
+    parser.add_argument("--fixtures-dir", default=FIXTURES_DIR)
+    args = parser.parse_args()
+    record(args.countries, args.fixtures_dir)
@@ -0,0 +1,300 @@
+import argparse
+import json
+import logging
+import os
+import random
+import resource
+import subprocess
+import sys
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.feeds import FIXTURES_DIR, FeedServer
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Metrics compared against a baseline and whether higher values are better
+COMPARED_METRICS = {
+    "ingest.articles_per_min": True,
+    "ingest.llm_calls_per_article": False,
+    "search.p50_ms": False,
+    "search.p99_ms": False,
+    "faceted_search.p50_ms": False,
+    "faceted_search.p99_ms": False,
+    "aggregations.p50_ms": False,
+    "aggregations.p99_ms": False,
+    "peak_rss_mb": False,
+}
+# Latency changes smaller than this are noise rather than regressions
+MIN_LATENCY_CHANGE_MS = 1.0
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def latency_stats(latencies: list[float]) -> dict:
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024**2 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def timed(fn, *args, **kwargs) -> float:
+    start = perf_counter()
+    fn(*args, **kwargs)
+    return perf_counter() - start
+
+
+def bench_ingest(agent, server: FakeOpenAIServer, cycles: int) -> dict:
+    articles, new, seconds = 0, 0, 0.0
+    for _ in range(cycles):
+        seconds += timed(agent.run_cycle)
+        for stats in agent.pipeline.stats.values():
+            articles += stats.stored
+            new += stats.new
+    llm = server.stats()
+    return {
+        "cycles": cycles,
+        "articles": articles,
+        "failed": new - articles,
+        "seconds": round(seconds, 2),
+        "articles_per_min": round(articles / seconds * 60, 1) if seconds else 0.0,
+        "llm_calls": llm["calls"],
+        "llm_calls_per_article": (
+            round(llm["calls"] / articles, 2) if articles else None
+        ),
+        "llm_errors": llm["errors"],
+        "llm_rate_limited": llm["rate_limited"],
+        "llm_malformed": llm["malformed"],
+        "prompt_tokens_per_article": (
+            round(llm["prompt_tokens"] / articles, 1) if articles else None
+        ),
+        "cached_prompt_ratio": (
+            round(llm["cached_tokens"] / llm["prompt_tokens"], 3)
+            if llm["prompt_tokens"]
+            else None
+        ),
+    }
+
+
+def bench_search(query_builder, queries: list[str], countries: list[str]) -> dict:
+    search, faceted = [], []
+    for i, query in enumerate(queries):
+        country = countries[i % len(countries)]
+        search.append(timed(query_builder.run, query=query, country=country))
+        faceted.append(timed(query_builder.faceted_search, query=query))
+    return {"search": latency_stats(search), "faceted_search": latency_stats(faceted)}
+
+
+def bench_aggregations(query_builder, repeat: int) -> dict:
+    end = datetime.now() + timedelta(hours=1)
+    start = end - timedelta(days=7)
+    latencies = []
+    for _ in range(repeat):
+        latencies.append(timed(query_builder.get_keywords, start, end, 10))
+        latencies.append(timed(query_builder.get_sentiments, start, end, 10))
+    return latency_stats(latencies)
+
+
+def run(args) -> dict:
+    import openai
+    from qdrant_client import QdrantClient
+
+    from src.agents.agent import Country, PeriodicAgent
+    from src.aggregators.aggregator import (
+        EntityCooccurrenceAggregator,
+        KeywordsAggregator,
+        SentimentAggregator,
+        SentimentScoreAggregator,
+    )
+    from src.databases.database import InMemoryDatabase
+    from src.feeds.fetcher import FeedFetcher
+    from src.knowledge.news_knowledge import QdrantNewsKnowledge
+    from src.knowledge.stories import StoryClusterer
+    from src.query.query_builder import QueryBuilder
+
+    llm = FakeOpenAIServer(
+        latency=args.llm_latency,
+        jitter=args.llm_jitter,
+        error_rate=args.llm_error_rate,
+        rate_limit_rate=args.llm_rate_limit_rate,
+        malformed_rate=args.llm_malformed_rate,
+        min_cached_tokens=args.llm_min_cached_tokens,
+        seed=args.seed,
+    ).start()
+    feeds = FeedServer(
+        fixtures_dir=args.fixtures_dir, items=args.items, seed=args.seed
+    ).start()
+    try:
+        db = InMemoryDatabase()
+        qdrant = QdrantClient(location=args.qdrant_url or ":memory:")
+        knowledge = QdrantNewsKnowledge(
+            db=qdrant,
+            vector_dim=1024,
+            embedding_model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+            sparse_embedding_model_name="Qdrant/bm42-all-minilm-l6-v2-attentions",
+            cold_store=db,
+            clusterer=StoryClusterer(qdrant),
+        )
+        countries = [Country[name] for name in args.countries]
+        agent = PeriodicAgent(
+            period=timedelta(minutes=30),
+            knowledge=knowledge,
+            database=db,
+            countries=countries,
+            aggregators=[
+                KeywordsAggregator(db),
+                SentimentAggregator(db),
+                SentimentScoreAggregator(db),
+                EntityCooccurrenceAggregator(db),
+            ],
+            llm_model=args.llm_model,
+            cheap_llm_model=args.cheap_llm_model,
+            max_per_country=args.items,
+            enrich_workers=args.enrich_workers,
+            feed_fetcher=FeedFetcher(database=db, url_template=feeds.url_template),
+            openai_client=openai.OpenAI(
+                base_url=llm.url, api_key="benchmark", max_retries=args.llm_max_retries
+            ),
+        )
+
+        results = {"ingest": bench_ingest(agent, llm, args.cycles)}
+
+        titles = [payload["title"] for payload in knowledge.iter_payloads(["title"])]
+        queries = random.Random(args.seed).choices(titles, k=args.searches)
+        query_builder = QueryBuilder(knowledge, db)
+        # The first query loads the embedding models
+        results["warm_up_seconds"] = round(timed(query_builder.run, query="warm up"), 2)
+        results.update(
+            bench_search(query_builder, queries, [c.name() for c in countries])
+        )
+        results["aggregations"] = bench_aggregations(query_builder, args.searches)
+        results["peak_rss_mb"] = peak_rss_mb()
+        return results
+    finally:
+        llm.stop()
+        feeds.stop()
+
+
+def flatten(metrics: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in metrics.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(metrics: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Print the compared metrics next to the baseline and return the regressions."""
+    current, previous = flatten(metrics), flatten(baseline)
+    regressions = []
+    print(f"{'metric':<32}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, higher_is_better in COMPARED_METRICS.items():
+        old, new = previous.get(name), current.get(name)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        worse = -change if higher_is_better else change
+        flag = ""
+        if name.endswith("_ms") and abs(new - old) < MIN_LATENCY_CHANGE_MS:
+            worse = 0.0
+        if worse > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<32}{old:>12}{new:>12}{change:>+10.1%}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Offline benchmark of ingestion, search and aggregations."
+    )
+    parser.add_argument("--countries", nargs="+", default=["ITALY", "USA"])
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--items", type=int, default=20, help="articles per feed")
+    parser.add_argument("--searches", type=int, default=200)
+    parser.add_argument("--enrich-workers", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.1, help="seconds")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-rate-limit-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--llm-malformed-rate",
+        type=float,
+        default=0.0,
+        help="answers that are not plain JSON, without structured outputs",
+    )
+    parser.add_argument("--llm-max-retries", type=int, default=2)
+    parser.add_argument("--llm-min-cached-tokens", type=int, default=1024)
+    parser.add_argument("--llm-model", default="gpt-4o-mini")
+    parser.add_argument("--cheap-llm-model")
+    parser.add_argument(
+        "--fixtures-dir",
+        default=FIXTURES_DIR,
+        help="recorded feeds (<COUNTRY>.xml), see benchmarks/feeds.py",
+    )
+    parser.add_argument(
+        "--qdrant-url", help="scratch Qdrant server, in-memory Qdrant by default"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="results file, default in benchmarks/results")
+    parser.add_argument("--baseline", help="results file to compare with")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.1, help="allowed relative regression"
+    )
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO if args.verbose else logging.WARNING,
+    )
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": vars(args),
+        "metrics": run(args),
+    }
+    print(json.dumps(report["metrics"], indent=2))
+
+    output = args.output or os.path.join(
+        RESULTS_DIR,
+        f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{commit or 'unknown'}.json",
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(report["metrics"], baseline["metrics"], args.tolerance):
+            sys.exit(1)
@@ -1,44 +1,94 @@
+# Imported first so that the startup report covers the other imports
+from src.utils.timing import startup  # isort: skip
+
 import logging
+import os
 from datetime import timedelta
 
 from qdrant_client import QdrantClient
 
-from src.agents.agent import Country, PeriodicAgent
-from src.aggregators.aggregator import KeywordsAggregator, SentimentAggregator
+from src.agents.agent import Country, DistributedAgent, PeriodicAgent
+from src.aggregators.aggregator import (
+    EntityCooccurrenceAggregator,
+    KeywordsAggregator,
+    KeywordTrendAggregator,
+    SentimentAggregator,
+    SentimentScoreAggregator,
+)
+from src.aggregators.materialized import MaterializedWindows
 from src.databases.database import MongoDatabase
+from src.databases.job_queue import MongoJobQueue
 from src.knowledge.news_knowledge import QdrantNewsKnowledge
+from src.knowledge.seen import SeenFilter
+from src.knowledge.stories import StoryClusterer
+from src.spool.spool import Spool, SpoolDrainer, SpooledDatabase, SpooledKnowledge
+from src.telemetry.telemetry import setup_tracing, start_metrics_server
 
 if __name__ == "__main__":
     logging.basicConfig(
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
         level=logging.INFO,
     )
+    startup.mark("imports")
+    setup_tracing("notiziario-agent")
+    start_metrics_server()
 
-    knowledge = QdrantNewsKnowledge(
-        db=QdrantClient(host="db", port=6333),
-        vector_dim=1024,
-        embedding_model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
-        sparse_embedding_model_name="Qdrant/bm42-all-minilm-l6-v2-attentions",
-    )
     db = MongoDatabase(
         host="mongo",
         db_name="notiziario",
         username="root",
         password="example",
         port=27017,
+        write_buffer_size=500,
+        write_buffer_interval=30,
     )
-    agent = PeriodicAgent(
+    qdrant = QdrantClient(host="db", port=6333)
+    knowledge = QdrantNewsKnowledge(
+        db=qdrant,
+        vector_dim=1024,
+        embedding_model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+        sparse_embedding_model_name="Qdrant/bm42-all-minilm-l6-v2-attentions",
+        optimize_onnx=os.getenv("NOTIZIARIO_OPTIMIZE_ONNX") == "1",
+        cold_store=db,
+        clusterer=StoryClusterer(qdrant),
+    )
+    # Enriched articles and aggregation deltas are written to the local spool
+    # first and replayed into Qdrant/Mongo in the background
+    spool = Spool("spool")
+    drainer = SpoolDrainer(spool, knowledge=knowledge, database=db)
+    drainer.start()
+    spooled_db = SpooledDatabase(db, spool)
+    startup.mark("clients")
+
+    # With NOTIZIARIO_DISTRIBUTED=1 every replica pulls country/article jobs
+    # from a shared Mongo queue instead of polling all countries itself
+    if os.getenv("NOTIZIARIO_DISTRIBUTED") == "1":
+        agent_class, extra = DistributedAgent, {"job_queue": MongoJobQueue(db)}
+    else:
+        agent_class, extra = PeriodicAgent, {}
+
+    agent = agent_class(
+        **extra,
         period=timedelta(minutes=30),
-        knowledge=knowledge,
+        knowledge=SpooledKnowledge(knowledge, spool),
         countries=[Country.ITALY, Country.USA],
-        llm_model="gpt-4o-mini",
+        llm_model="gpt-4o",
+        cheap_llm_model="gpt-4o-mini",
         max_per_country=15,
         database=db,
+        seen_filter=SeenFilter("spool/seen.bloom"),
         aggregators=[
-            KeywordsAggregator(db),
-            SentimentAggregator(db),
+            KeywordsAggregator(spooled_db),
+            SentimentAggregator(spooled_db),
+            SentimentScoreAggregator(spooled_db),
+            # Reads its own state back, so it writes to Mongo directly
+            KeywordTrendAggregator(db),
+            EntityCooccurrenceAggregator(spooled_db),
         ],
     )
+    agent.aggregator_manager.add_view(MaterializedWindows(db))
+    startup.mark("agent")
+    startup.report()
     logging.info("Starting agent...")
 
     agent.run()
@@ -1,18 +1,24 @@
+import hashlib
 import logging
+import os
+import socket
+import threading
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from enum import Enum
-from time import sleep
-from typing import List
+from time import sleep, time
+from typing import TYPE_CHECKING, List
 from uuid import uuid4
 
-import openai
-from tqdm import tqdm
-
+from src.agents.pipeline import IngestionPipeline
+from src.agents.scheduler import AdaptiveScheduler
 from src.aggregators.aggregator import Aggregator, AggregatorManager
 from src.databases.database import Database
+from src.databases.job_queue import Heartbeat, MongoJobQueue
+from src.dataclasses.enriched_data import EnrichedData
 from src.dataclasses.news import News
-from src.dataclasses.run import RunDetail, RunStatus
+from src.dataclasses.run import ArticleStatus, RunDetail, RunStatus
 from src.enrichers.enricher import (
     CategoryEnricher,
     EnricherManager,
@@ -21,10 +27,19 @@ from src.enrichers.enricher import (
     SentimentEnricher,
     SummaryCleaner,
 )
+from src.feeds.fetcher import FeedFetcher
 from src.knowledge.knowledge import Knowledge
+from src.knowledge.seen import SeenFilter
+from src.telemetry.telemetry import cache_lookup, span
+
+if TYPE_CHECKING:
+    from openai import OpenAI
 
 logger = logging.getLogger(__name__)
 
+# Checkpoints of failed runs that can be finished without calling the LLM again
+RESUMABLE = (ArticleStatus.ENRICHED.value, ArticleStatus.STORED.value)
+
 
 class Country(Enum):
     USA = "us::en"
@@ -51,6 +66,8 @@ class Agent(ABC):
         self.aggregator_manager = AggregatorManager()
         for aggregator in aggregators:
             self.aggregator_manager.add_aggregator(aggregator)
+        # Period the aggregated articles are counted towards, see _aggregate
+        self._period = int(time())
 
     def _init_run(self):
         self._current_run = RunDetail(
@@ -59,12 +76,24 @@ class Agent(ABC):
             start_time=datetime.now(),
             end_time=None,
             retrieved_data_size=0,
+            status=RunStatus.RUNNING,
         )
+        self._save_run()
+
+    def _save_run(self):
+        run = self._current_run
+        self.database.update(id=run._id, data=run.to_dict(), collection="runs")
 
     def _finalize_run(self, error: Exception = None):
         self._current_run.end_time = datetime.now()
         if error:
-            self._current_run.status = RunStatus.FAILURE
+            resumable = any(
+                checkpoint["status"] in RESUMABLE
+                for checkpoint in self._current_run.checkpoints.values()
+            )
+            self._current_run.status = (
+                RunStatus.PARTIAL if resumable else RunStatus.FAILURE
+            )
             self._current_run.message = str(error)
         else:
             self._current_run.status = RunStatus.SUCCESS
@@ -85,15 +114,57 @@ class PeriodicAgent(Agent):
         countries: List[Country],
         aggregators: List[Aggregator] = None,
         llm_model: str = "gpt-4o-mini",
+        cheap_llm_model: str = None,
         max_per_country: int = 1,
+        fetch_workers: int = 4,
+        enrich_workers: int = 4,
+        queue_size: int = 64,
+        write_batch_size: int = 4,
+        checkpoint_batch_size: int = 16,
+        feed_fetcher: FeedFetcher = None,
+        seen_filter: SeenFilter = None,
+        min_period: timedelta = None,
+        max_period: timedelta = None,
+        openai_client: "OpenAI" = None,
     ):
         super().__init__(knowledge, database, aggregators or [])
+        self.feed_fetcher = feed_fetcher or FeedFetcher(database=database)
+        self.seen_filter = seen_filter
         self.period = period
         self.countries = countries
+        self.scheduler = AdaptiveScheduler(
+            countries,
+            base_interval=period,
+            min_interval=min_period,
+            max_interval=max_period,
+        )
         self.enricher_manager = EnricherManager()
-        self._openai_client = openai.OpenAI()
+        if openai_client is None:
+            # Imported here so that importing the agents module stays cheap
+            import openai
+
+            openai_client = openai.OpenAI()
+        self._openai_client = openai_client
         self.llm_model = llm_model
+        # Tried first by every enricher, see OpenAIEnricher
+        self.cheap_llm_model = cheap_llm_model
         self.max_per_country = max_per_country
+        self.checkpoint_batch_size = checkpoint_batch_size
+        self._unsaved_checkpoints = {}
+        self._checkpoint_lock = threading.Lock()
+        self.pipeline = IngestionPipeline(
+            fetch=self._fetch,
+            is_new=self._admit,
+            enrich=self._enrich_checkpointed,
+            store=self._store_checkpointed,
+            aggregate=self._aggregate_checkpointed,
+            on_handled=self._acknowledge,
+            max_per_country=max_per_country,
+            fetch_workers=fetch_workers,
+            enrich_workers=enrich_workers,
+            queue_size=queue_size,
+            write_batch_size=write_batch_size,
+        )
 
         self.enricher_manager = (
             self.enricher_manager.add_enricher(
@@ -109,53 +180,386 @@ class PeriodicAgent(Agent):
     def openai_client(self):
         return self._openai_client
 
-    def run(self) -> bool:
-        from pygooglenews import GoogleNews
+    def _fetch(self, country: Country) -> List[News]:
+        return self.feed_fetcher.fetch(country)
+
+    def _is_new(self, country: Country, article: News) -> bool:
+        if self.seen_filter:
+            stale = self.seen_filter.is_stale(country.name(), article)
+            cache_lookup("seen_filter", hit=stale)
+            if stale:
+                return False
+        if self.knowledge.exists(article.id):
+            if self.seen_filter:
+                self.seen_filter.add(
+                    article.id, country.name(), article.published_parsed
+                )
+            return False
+        return True
+
+    def _acknowledge(self, country: Country, articles: List[News | EnrichedData]):
+        """Mark feed entries as seen, once they are stored or skipped."""
+        self.feed_fetcher.acknowledge(country, articles)
+
+    def _enrich(self, article: News) -> EnrichedData | None:
+        return self.enricher_manager.enrich(
+            article, model_name=self.llm_model, cheap_model_name=self.cheap_llm_model
+        )
+
+    def _store(self, country: Country, batch: List[EnrichedData]):
+        # The ingest time dates the corrections of a later backfill like the
+        # aggregations written now
+        metadata = {"country": country.name(), "ingested_ts": time()}
+        self.knowledge.store(batch, metadata=[dict(metadata) for _ in batch])
+        self._current_run.retrieved_data_size += len(batch)
+        if self.seen_filter:
+            for article in batch:
+                self.seen_filter.add(
+                    article.id, country.name(), article.published_parsed
+                )
+
+    def _aggregate(self, country: Country, enriched: List[EnrichedData]):
+        metadata = {"country": country.name()}
+        # Articles are aggregated in batches, while the keyword trends take a
+        # whole poll as one cycle: they only count the batches, see _close_periods
+        self.aggregator_manager.run(enriched, metadata=metadata, per_cycle=False)
+        for aggregator in self.aggregator_manager.per_cycle():
+            aggregator.add_to_period(enriched, metadata, self._period)
+
+    def _close_periods(self, countries: List[Country], before: int):
+        """Fold the counted periods of the countries into the keyword trends."""
+        for country in countries:
+            for aggregator in self.aggregator_manager.per_cycle():
+                aggregator.close_periods({"country": country.name()}, before)
 
+    def _checkpoint(
+        self, country: Country, articles: List[News], status: ArticleStatus
+    ):
+        """Record the progress of the given articles in the current run document.
+
+        Articles keep their data until they are aggregated, so that an
+        interrupted run can be finished without fetching or enriching them again.
+        Checkpoints are written in batches of ``checkpoint_batch_size``, except
+        for aggregated ones, which are written at once so that an article is
+        never aggregated twice.
+        """
+        done = status == ArticleStatus.AGGREGATED
+        updates = {}
+        for article in articles:
+            checkpoint = {
+                "id": article.id,
+                "country": country.name(),
+                "status": status.value,
+                "data": None if done else article.to_dict(),
+            }
+            # Article ids are urls, which are not valid Mongo field names
+            key = hashlib.sha1(article.id.encode()).hexdigest()
+            self._current_run.checkpoints[key] = checkpoint
+            updates[f"checkpoints.{key}"] = checkpoint
+
+        # Written under the lock, so that an older checkpoint of an article
+        # never overwrites a newer one
+        with self._checkpoint_lock:
+            self._unsaved_checkpoints.update(updates)
+            if not self._unsaved_checkpoints or (
+                not done
+                and len(self._unsaved_checkpoints) < self.checkpoint_batch_size
+            ):
+                return
+            self.database.update(
+                id=self._current_run._id,
+                data=self._unsaved_checkpoints,
+                collection="runs",
+            )
+            self.database.flush(collection="runs")
+            self._unsaved_checkpoints = {}
+
+    def _save_run(self):
+        # The run document includes every checkpoint
+        with self._checkpoint_lock:
+            super()._save_run()
+            self._unsaved_checkpoints = {}
+
+    def _admit(self, country: Country, article: News) -> bool:
+        if not self._is_new(country, article):
+            return False
+        self._checkpoint(country, [article], ArticleStatus.PENDING)
+        return True
+
+    def _enrich_checkpointed(
+        self, country: Country, article: News
+    ) -> EnrichedData | None:
+        enriched = self._enrich(article)
+        if enriched is not None:
+            self._checkpoint(country, [enriched], ArticleStatus.ENRICHED)
+        return enriched
+
+    def _store_checkpointed(self, country: Country, batch: List[EnrichedData]):
+        self._store(country, batch)
+        self._checkpoint(country, batch, ArticleStatus.STORED)
+
+    def _aggregate_checkpointed(self, country: Country, enriched: List[EnrichedData]):
+        self._aggregate(country, enriched)
+        self._checkpoint(country, enriched, ArticleStatus.AGGREGATED)
+
+    def resume(self):
+        """Finish the runs of this agent that were interrupted before completing.
+
+        Pending articles are enriched, enriched ones are stored and stored ones are
+        aggregated; finished articles are skipped. Runs that failed are resumed
+        too, but only for their enriched and stored articles. Assumes a single
+        agent of this class writes to the database.
+        """
+        runs = self.database.query(
+            {
+                "agent_id": self.__class__.__name__,
+                "status": {"$in": [RunStatus.RUNNING.value, RunStatus.PARTIAL.value]},
+            },
+            collection="runs",
+        )
+        for data in runs:
+            self._resume_run(RunDetail.from_dict(data))
+
+    def _resume_run(self, run: RunDetail):
+        logger.info(f"Resuming run {run._id} with {len(run.checkpoints)} articles")
+        self._current_run = run
+        self._period = int(time())
+        countries = {country.name(): country for country in self.countries}
+        pending, enriched, stored = [], {}, {}
+        for checkpoint in run.checkpoints.values():
+            country = countries.get(checkpoint["country"])
+            status = ArticleStatus(checkpoint["status"])
+            if country is None or status == ArticleStatus.AGGREGATED:
+                continue
+            if run.status == RunStatus.PARTIAL and status.value not in RESUMABLE:
+                continue
+            if status == ArticleStatus.PENDING:
+                pending.append((country, News.from_dict(checkpoint["data"])))
+            elif status == ArticleStatus.ENRICHED:
+                enriched.setdefault(country, []).append(
+                    EnrichedData.from_dict(checkpoint["data"])
+                )
+            else:
+                stored.setdefault(country, []).append(
+                    EnrichedData.from_dict(checkpoint["data"])
+                )
+
+        def enrich(item):
+            country, article = item
+            if self.knowledge.exists(article.id):
+                logger.info(f"Skipping {article.id}, already stored")
+                return country, None
+            try:
+                return country, self._enrich_checkpointed(country, article)
+            except Exception as e:
+                logger.error(e)
+                return country, None
+
+        error = None
+        try:
+            with ThreadPoolExecutor(max_workers=self.pipeline.enrich_workers) as pool:
+                for country, data in pool.map(enrich, pending):
+                    if data is not None:
+                        enriched.setdefault(country, []).append(data)
+
+            batch_size = self.pipeline.write_batch_size
+            for country in set(enriched) | set(stored):
+                batch = enriched.get(country, [])
+                for i in range(0, len(batch), batch_size):
+                    self._store_checkpointed(country, batch[i : i + batch_size])
+                self._aggregate_checkpointed(country, stored.get(country, []) + batch)
+            self._close_periods(set(enriched) | set(stored), self._period + 1)
+        except Exception as e:
+            error = e
+            logger.error(e)
+
+        run = self._finalize_run(error)
+        if error is None:
+            run.message = "resumed after interruption"
+        self._save_run()
+        self.aggregator_manager.flush()
+        self.database.flush()
+
+    def run_cycle(self, countries: List[Country] = None) -> RunDetail:
+        if self.seen_filter and self.seen_filter.cold:
+            self.seen_filter.rebuild(self.knowledge)
+        self._init_run()
+        error = None
+        try:
+            self._period = int(time())
+            with span("run_cycle", run_id=self._current_run._id):
+                stats = self.pipeline.run(countries or self.countries)
+            self._close_periods(list(stats), self._period + 1)
+            for country, country_stats in stats.items():
+                logger.info(f"Ingested news from {country.name()}: {country_stats}")
+            if self.pipeline.errors:
+                error = self.pipeline.errors[0]
+        except Exception as e:
+            error = e
+            logger.error(e)
+
+        run = self._finalize_run(error)
+        self._save_run()
+        self.aggregator_manager.flush()
+        self.database.flush()
+        if self.seen_filter:
+            self.seen_filter.save()
+        return run
+
+    def run(self) -> bool:
         # periodic ingestor logic here
+        self.resume()
         while True:
-            self._init_run()
-            error = None
+            due = self.scheduler.due()
+            if due:
+                self.run_cycle(due)
+                for country, stats in self.pipeline.stats.items():
+                    self.scheduler.record(country, stats.new, self.max_per_country)
+
+            wait = self.scheduler.next_due() - datetime.now()
+            sleep(max(wait.total_seconds(), 0))
+
+
+class DistributedAgent(PeriodicAgent):
+    """PeriodicAgent variant that shares the work with other replicas.
+
+    Country polls and single articles are jobs in a Mongo-backed queue. Every
+    replica enqueues the country job for the current period (deduplicated by
+    key), and workers lease jobs atomically: a country job fetches and dedupes
+    the feed and enqueues one job per new article, article jobs are enriched and
+    stored in batches. Article jobs are keyed by article id, so an article is
+    enriched once across the cluster, and points have deterministic ids, so a
+    replayed store overwrites instead of duplicating. Article batches count
+    their keywords towards the current period, and the country job of the next
+    period folds them into the keyword trends, once per period.
+    """
+
+    def __init__(
+        self,
+        job_queue: MongoJobQueue,
+        *args,
+        article_batch_size: int = 16,
+        poll_interval: timedelta = timedelta(seconds=5),
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.job_queue = job_queue
+        self.article_batch_size = article_batch_size
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self._countries = {country.name(): country for country in self.countries}
+
+    def _slot(self) -> int:
+        return int(datetime.now().timestamp() // self.period.total_seconds())
+
+    def _period_start(self, slot: int) -> int:
+        # Periods are timestamps, like the polls of PeriodicAgent
+        return int(slot * self.period.total_seconds())
+
+    def _enqueue_countries(self):
+        slot = self._slot()
+        for country in self.countries:
+            self.job_queue.enqueue(
+                "country",
+                f"{country.name()}::{slot}",
+                {"country": country.name(), "period": self._period_start(slot)},
+            )
+
+    def _handle_country(self, job):
+        country = self._countries[job.payload["country"]]
+        if job.payload.get("period") is not None:
+            # Country jobs run once per period, so the trends get one cycle each
+            self._close_periods([country], before=job.payload["period"])
+        considered, enqueued = [], 0
+        for article in self._fetch(country):
+            if enqueued >= self.max_per_country:
+                break
+            considered.append(article)
+            if self._is_new(country, article):
+                enqueued += self.job_queue.enqueue(
+                    "article",
+                    article.id,
+                    {"country": country.name(), "news": article.to_dict()},
+                    priority=1,
+                )
+        # Enqueued article jobs are retried until done, so the entries can be
+        # acknowledged already
+        self._acknowledge(country, considered)
+        logger.info(f"Enqueued {enqueued} articles from {country.name()}")
+
+    def _acquire_articles(self) -> list:
+        jobs = []
+        while len(jobs) < self.article_batch_size:
+            job = self.job_queue.acquire(self.worker_id, kinds=["article"])
+            if job is None:
+                break
+            jobs.append(job)
+        return jobs
+
+    def _handle_articles(self, jobs: list, heartbeat: Heartbeat):
+        def enrich(job):
             try:
-                for country in self.countries:
-                    total_country = 0
-                    news_provider = GoogleNews(
-                        country=country.name(), lang=country.language()
-                    )
-                    news = news_provider.top_news()["entries"]
-                    news = [News.from_dict(article) for article in news]
-                    enriched_news = []
-                    for article in tqdm(
-                        news, desc=f"Ingesting news from {country.name()}"
-                    ):
-                        if total_country >= self.max_per_country:
-                            logger.info(
-                                "Reached max article per country, skipping other articles"
-                            )
-                            break
-                        if not self.knowledge.exists(
-                            article.id,
-                        ):
-                            enriched = self.enricher_manager.enrich(
-                                article, model_name=self.llm_model
-                            )
-                            enriched_news.append(enriched)
-                            total_country += 1
-
-                    self.knowledge.store(
-                        enriched_news,
-                        metadata=[{"country": country.name()} for _ in enriched_news],
-                    )
-                    self._current_run.retrieved_data_size += total_country
-                    self.aggregator_manager.run(
-                        enriched_news,
-                        metadata={"country": country.name()},
-                    )
+                return self._enrich(News.from_dict(job.payload["news"]))
             except Exception as e:
-                error = e
                 logger.error(e)
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.pipeline.enrich_workers) as pool:
+            enriched = list(pool.map(enrich, jobs))
 
-            run = self._finalize_run(error)
-            self.database.store(id=run._id, data=run.to_dict(), collection="runs")
+        by_country = {}
+        for job, data in zip(jobs, enriched):
+            if data is None:
+                self.job_queue.fail(job, self.worker_id, ValueError("enrichment failed"))
+            elif job._id in heartbeat.lost:
+                # Another worker owns this article now
+                continue
+            else:
+                by_country.setdefault(job.payload["country"], []).append((job, data))
+
+        self._period = self._period_start(self._slot())
+        for name, items in by_country.items():
+            country = self._countries[name]
+            self._store(country, [data for _, data in items])
+            # A job whose lease expired meanwhile is redone, and aggregated, by
+            # the worker that took it over
+            completed = [
+                data
+                for job, data in items
+                if self.job_queue.complete(job, self.worker_id)
+            ]
+            if completed:
+                self._aggregate(country, completed)
+
+    def run(self) -> bool:
+        while True:
+            self._enqueue_countries()
+            self.job_queue.reap()
+
+            jobs = self._acquire_articles()
+            if not jobs:
+                job = self.job_queue.acquire(self.worker_id, kinds=["country"])
+                jobs = [job] if job else []
+            if not jobs:
+                sleep(self.poll_interval.total_seconds())
+                continue
+
+            self._init_run()
+            error = None
+            with Heartbeat(self.job_queue, jobs, self.worker_id) as heartbeat:
+                try:
+                    if jobs[0].kind == "country":
+                        self._handle_country(jobs[0])
+                        self.job_queue.complete(jobs[0], self.worker_id)
+                    else:
+                        self._handle_articles(jobs, heartbeat)
+                except Exception as e:
+                    error = e
+                    logger.error(e)
+                    for job in jobs:
+                        self.job_queue.fail(job, self.worker_id, e)
 
-            sleep(self.period.total_seconds())
+            self._finalize_run(error)
+            self._save_run()
+            self.aggregator_manager.flush()
+            self.database.flush()
@@ -0,0 +1,275 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from datetime import datetime, timedelta
+from time import monotonic
+from typing import List
+
+from src.aggregators.aggregator import Aggregator
+from src.databases.database import Database
+from src.dataclasses.backfill import BackfillCursor
+from src.dataclasses.enriched_data import EnrichedData
+from src.dataclasses.payload import (
+    decode_payload,
+    payload_metadata,
+    published_timestamp,
+)
+from src.enrichers.batch import BatchEnricher
+from src.enrichers.enricher import EnricherManager, OpenAIEnricher, PatchedView
+from src.telemetry.telemetry import span
+
+logger = logging.getLogger(__name__)
+
+
+class BackfillEngine:
+    """Re-runs a subset of enrichers over the articles already in the knowledge base.
+
+    Articles are streamed page by page. After each page the re-enriched articles
+    are upserted, the aggregations and views are corrected with delta documents
+    (new minus old values, dated when the articles were first ingested) and the
+    cursor is saved in ``backfill_cursors``, so an interrupted backfill resumes
+    after the last finished page. Enrichment runs on a thread pool, or through the OpenAI Batch
+    API when a ``BatchEnricher`` is given; then ``batch_pages`` pages are enriched
+    together, so that their batches run concurrently.
+
+    Rewritten points are tagged with the cursor's ``run_id`` and skipped if the
+    scroll meets them again: storing replaces points stored under legacy random
+    ids with points at their deterministic id, which may lie past the cursor.
+
+    Only aggregators with ``supports_delta`` are corrected; the others (sentiment
+    scores, keyword trends) keep the values computed at ingest time.
+    """
+
+    def __init__(
+        self,
+        knowledge,
+        database: Database,
+        enrichers: List[OpenAIEnricher],
+        model_name: str,
+        aggregators: List[Aggregator] = None,
+        views: list = None,
+        name: str = "backfill",
+        metadata: dict = None,
+        workers: int = 32,
+        page_size: int = 256,
+        batch: BatchEnricher = None,
+        batch_pages: int = 200,
+        report_interval: timedelta = timedelta(seconds=30),
+    ):
+        self.knowledge = knowledge
+        self.database = database
+        self.enrichers = enrichers
+        self.enricher_manager = EnricherManager()
+        for enricher in enrichers:
+            self.enricher_manager.add_enricher(enricher)
+        self.model_name = model_name
+        self.name = name
+        self.metadata = metadata or {}
+        self.workers = workers
+        self.page_size = page_size
+        self.batch = batch
+        self.batch_pages = batch_pages
+        self.report_interval = report_interval
+
+        self.views = views or []
+        self.aggregators = []
+        for aggregator in aggregators or []:
+            if not aggregator.supports_delta:
+                logger.warning(
+                    f"{aggregator.__class__.__name__} cannot be corrected "
+                    "incrementally, skipping it"
+                )
+            else:
+                self.aggregators.append(aggregator)
+
+        self._lock = threading.Lock()
+        self._enriched = 0
+
+    def _load_cursor(self, restart: bool) -> BackfillCursor:
+        data = None if restart else self.database.get(self.name, "backfill_cursors")
+        if data:
+            return BackfillCursor.from_dict(data)
+        return BackfillCursor.empty(
+            self.name,
+            enrichers=[enricher.__class__.__name__ for enricher in self.enrichers],
+            model_name=self.model_name,
+        )
+
+    def _save_cursor(self, cursor: BackfillCursor):
+        cursor.updated_at = datetime.now()
+        self.database.update(cursor._id, cursor.to_dict(), "backfill_cursors")
+        self.database.flush(collection="backfill_cursors")
+
+    def _enrich(self, data: EnrichedData) -> EnrichedData | None:
+        data = self.enricher_manager.enrich(data, model_name=self.model_name)
+        with self._lock:
+            self._enriched += 1
+        return data
+
+    def _enrich_batch(self, data: List[EnrichedData]) -> List[EnrichedData | None]:
+        patches = [{} for _ in data]
+        for enricher in self.enrichers:
+            pending = [i for i, patch in enumerate(patches) if patch is not None]
+            views = [PatchedView(data[i], patches[i]) for i in pending]
+            updates = self.batch.enrich(enricher, views)
+            # Retry the requests that failed in the batch with realtime calls
+            retried = iter(
+                self._executor.map(
+                    lambda view: enricher.patch(view, model_name=self.model_name),
+                    [view for view, update in zip(views, updates) if update is None],
+                )
+            )
+            for i, update in zip(pending, updates):
+                if update is None:
+                    update = next(retried)
+                if update is None:
+                    patches[i] = None
+                else:
+                    patches[i].update(update)
+        with self._lock:
+            self._enriched += len(data)
+        return [
+            replace(item, **patch) if patch is not None else None
+            for item, patch in zip(data, patches)
+        ]
+
+    def _apply_deltas(self, items: List[tuple[dict, EnrichedData, EnrichedData]]):
+        groups = {}
+        for payload, old, new in items:
+            # Articles stored before the ingest time was recorded fall back to
+            # their publication time
+            ingested = payload.get("ingested_ts")
+            if ingested is None:
+                ingested = published_timestamp(old.published_parsed)
+            date_time = (
+                datetime.fromtimestamp(ingested)
+                if ingested is not None
+                else datetime.now()
+            )
+            bucket = date_time.replace(second=0, microsecond=0)
+            olds, news = groups.setdefault((payload.get("country"), bucket), ([], []))
+            olds.append(old)
+            news.append(new)
+
+        for (country, bucket), (olds, news) in groups.items():
+            metadata = {"backfill": self.name}
+            if country:
+                metadata["country"] = country
+            results = {
+                aggregator.__class__.__name__: aggregator.run_delta(
+                    olds, news, metadata=metadata, date_time=bucket
+                )
+                for aggregator in self.aggregators
+            }
+            for view in self.views:
+                view.update(results, metadata)
+
+        databases = {id(a.database): a.database for a in self.aggregators}
+        for database in databases.values():
+            database.flush()
+
+    def _process(self, payloads: List[dict], run_id: str) -> tuple[int, int]:
+        """Re-enrich a page and return how many articles were updated and skipped."""
+        old, skipped = [], 0
+        for payload in payloads:
+            if payload.get("backfill_run") == run_id:
+                skipped += 1
+                continue
+            try:
+                old.append((payload, decode_payload(payload)))
+            except (KeyError, TypeError) as e:
+                logger.error(f"Skipping malformed payload {payload.get('id')}")
+                logger.error(e)
+        self.knowledge.hydrate([data for _, data in old])
+
+        # Enrichment returns new articles, so the old ones are kept for the deltas
+        articles = [data for _, data in old]
+        if self.batch:
+            new = self._enrich_batch(articles)
+        else:
+            new = list(self._executor.map(self._enrich, articles))
+
+        items = [
+            (payload, data, enriched)
+            for (payload, data), enriched in zip(old, new)
+            if enriched is not None
+        ]
+        if items:
+            self.knowledge.store(
+                [enriched for _, _, enriched in items],
+                metadata=[
+                    {**payload_metadata(payload), "backfill_run": run_id}
+                    for payload, _, _ in items
+                ],
+            )
+            self._apply_deltas(items)
+        return len(items), skipped
+
+    def _groups(self, pages):
+        """Pages to enrich together, with the offset after the last of them."""
+        size = self.batch_pages if self.batch else 1
+        group = []
+        for payloads, offset in pages:
+            group.extend(payloads)
+            if len(group) >= size * self.page_size or offset is None:
+                yield group, offset
+                group = []
+        if group:
+            yield group, offset
+
+    def _report(self, cursor: BackfillCursor, total: int, started: float):
+        elapsed = monotonic() - started
+        rate = self._enriched / elapsed * 60 if elapsed else 0.0
+        remaining = max(total - cursor.processed, 0)
+        eta = timedelta(minutes=remaining / rate) if rate else None
+        logger.info(
+            f"Backfill {self.name}: {cursor.processed}/{total} articles "
+            f"({cursor.updated} updated, {cursor.failed} failed), "
+            f"{rate:.1f} articles/min, ETA {eta or 'unknown'}"
+        )
+
+    def run(self, restart: bool = False, limit: int = None) -> BackfillCursor:
+        cursor = self._load_cursor(restart)
+        if cursor.done:
+            logger.info(f"Backfill {self.name} already completed")
+            return cursor
+
+        total = self.knowledge.count(self.metadata)
+        started = monotonic()
+        stop = threading.Event()
+
+        def report():
+            while not stop.wait(self.report_interval.total_seconds()):
+                self._report(cursor, total, started)
+
+        reporter = threading.Thread(target=report, daemon=True)
+        reporter.start()
+        processed = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as self._executor:
+                pages = self.knowledge.iter_pages(
+                    metadata=self.metadata,
+                    batch_size=self.page_size,
+                    offset=cursor.offset,
+                )
+                for payloads, offset in self._groups(pages):
+                    with span("backfill_page", self.name, size=len(payloads)):
+                        updated, skipped = self._process(payloads, cursor.run_id)
+                    cursor.processed += len(payloads) - skipped
+                    cursor.updated += updated
+                    cursor.failed += len(payloads) - skipped - updated
+                    cursor.offset = offset
+                    self._save_cursor(cursor)
+
+                    processed += len(payloads)
+                    if limit and processed >= limit and offset is not None:
+                        break
+                else:
+                    cursor.done = True
+                    self._save_cursor(cursor)
+        finally:
+            stop.set()
+            reporter.join()
+            self._report(cursor, total, started)
+        return cursor
@@ -0,0 +1,228 @@
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from queue import Queue
+from typing import Any, Callable, Hashable, List
+
+from src.dataclasses.enriched_data import EnrichedData
+from src.dataclasses.news import News
+from src.telemetry.telemetry import PIPELINE_ERRORS, QUEUE_DEPTH, span
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+@dataclass
+class CountryStats:
+    fetched: int = 0
+    new: int = 0
+    enriched: int = 0
+    stored: int = 0
+
+
+class IngestionPipeline:
+    """One ingestion cycle as concurrent stages linked by bounded queues.
+
+    fetch (one task per country) -> dedupe -> enrich (worker pool) -> batch write
+    -> aggregate. Every stage keeps working on the other countries while one is
+    slow, so a cycle takes about as long as its slowest stage.
+
+    Once all the articles of a country went through the write stage,
+    ``on_handled`` gets the ones that were stored or skipped as not new. Articles
+    whose enrichment or write failed are left out, so that they can be fetched
+    again.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[Hashable], List[News]],
+        is_new: Callable[[Hashable, News], bool],
+        enrich: Callable[[Hashable, News], EnrichedData | None],
+        store: Callable[[Hashable, List[EnrichedData]], Any],
+        aggregate: Callable[[Hashable, List[EnrichedData]], Any],
+        max_per_country: int,
+        on_handled: Callable[[Hashable, List[News]], Any] = None,
+        fetch_workers: int = 4,
+        enrich_workers: int = 4,
+        queue_size: int = 64,
+        write_batch_size: int = 4,
+    ):
+        self.fetch = fetch
+        self.is_new = is_new
+        self.enrich = enrich
+        self.store = store
+        self.aggregate = aggregate
+        self.on_handled = on_handled
+        self.max_per_country = max_per_country
+        self.fetch_workers = fetch_workers
+        self.enrich_workers = enrich_workers
+        self.queue_size = queue_size
+        self.write_batch_size = write_batch_size
+
+    def _record_error(self, stage: str, country: Hashable, error: Exception):
+        logger.error(f"Error in {stage} stage for {country}")
+        logger.error(error)
+        PIPELINE_ERRORS.labels(stage=stage).inc()
+        with self._lock:
+            self.errors.append(error)
+
+    def _fetch_stage(self, countries: List[Hashable]):
+        def fetch(country):
+            try:
+                news = self.fetch(country)
+            except Exception as e:
+                self._record_error("fetch", country, e)
+                news = []
+            self.stats[country].fetched = len(news)
+            self._fetched.put((country, news))
+
+        with ThreadPoolExecutor(
+            max_workers=self.fetch_workers, thread_name_prefix="fetch"
+        ) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, fetch, country)
+                for country in countries
+            ]
+            for future in futures:
+                future.result()
+        self._fetched.put(_DONE)
+
+    def _dedupe_stage(self):
+        while (item := self._fetched.get()) is not _DONE:
+            country, news = item
+            forwarded, skipped = 0, []
+            for article in news:
+                if forwarded >= self.max_per_country:
+                    logger.info(
+                        f"Reached max article per country for {country}, "
+                        "skipping other articles"
+                    )
+                    break
+                try:
+                    if not self.is_new(country, article):
+                        skipped.append(article)
+                        continue
+                except Exception as e:
+                    self._record_error("dedupe", country, e)
+                    continue
+                self._to_enrich.put((country, article))
+                forwarded += 1
+            self.stats[country].new = forwarded
+            self._to_write.put(("expected", country, (forwarded, skipped)))
+
+        for _ in range(self.enrich_workers):
+            self._to_enrich.put(_DONE)
+
+    def _enrich_stage(self):
+        while (item := self._to_enrich.get()) is not _DONE:
+            country, article = item
+            try:
+                with span("enrich_article", article_id=article.id):
+                    enriched = self.enrich(country, article)
+            except Exception as e:
+                self._record_error("enrich", country, e)
+                enriched = None
+            self._to_write.put(("enriched", country, enriched))
+        self._to_write.put(_DONE)
+
+    def _write(self, country: Hashable, batch: List[EnrichedData]):
+        if not batch:
+            return []
+        try:
+            with span("store_batch", size=len(batch)):
+                self.store(country, batch)
+        except Exception as e:
+            self._record_error("write", country, e)
+            return []
+        self.stats[country].stored += len(batch)
+        return batch
+
+    def _handled(self, country: Hashable, articles: List[News | EnrichedData]):
+        if not self.on_handled:
+            return
+        try:
+            self.on_handled(country, articles)
+        except Exception as e:
+            self._record_error("write", country, e)
+
+    def _write_stage(self):
+        expected, received, skipped = {}, {}, {}
+        batches, written = {}, {}
+        running_workers = self.enrich_workers
+
+        while running_workers:
+            item = self._to_write.get()
+            if item is _DONE:
+                running_workers -= 1
+                continue
+
+            kind, country, value = item
+            if kind == "expected":
+                expected[country], skipped[country] = value
+            else:
+                received[country] = received.get(country, 0) + 1
+                if value is not None:
+                    self.stats[country].enriched += 1
+                    batches.setdefault(country, []).append(value)
+                if len(batches.get(country, [])) >= self.write_batch_size:
+                    written.setdefault(country, []).extend(
+                        self._write(country, batches.pop(country))
+                    )
+
+            if country in expected and received.get(country, 0) == expected[country]:
+                written.setdefault(country, []).extend(
+                    self._write(country, batches.pop(country, []))
+                )
+                stored = written.pop(country)
+                self._handled(country, skipped.pop(country) + stored)
+                self._to_aggregate.put((country, stored))
+                del expected[country]
+                received.pop(country, None)
+
+        self._to_aggregate.put(_DONE)
+
+    def _aggregate_stage(self):
+        while (item := self._to_aggregate.get()) is not _DONE:
+            country, enriched = item
+            if not enriched:
+                continue
+            try:
+                with span("aggregate_batch", size=len(enriched)):
+                    self.aggregate(country, enriched)
+            except Exception as e:
+                self._record_error("aggregate", country, e)
+
+    def run(self, countries: List[Hashable]) -> dict[Hashable, CountryStats]:
+        self.stats = {country: CountryStats() for country in countries}
+        self.errors = []
+        self._lock = threading.Lock()
+        self._fetched = Queue(maxsize=self.queue_size)
+        self._to_enrich = Queue(maxsize=self.queue_size)
+        self._to_write = Queue(maxsize=self.queue_size)
+        self._to_aggregate = Queue(maxsize=self.queue_size)
+        for name in ("fetched", "to_enrich", "to_write", "to_aggregate"):
+            QUEUE_DEPTH.labels(queue=name).set_function(
+                getattr(self, f"_{name}").qsize
+            )
+
+        def thread(target, *args):
+            # Stages run in the caller's context, so their spans are its children
+            context = contextvars.copy_context()
+            return threading.Thread(target=context.run, args=(target, *args))
+
+        stages = [
+            thread(self._fetch_stage, countries),
+            thread(self._dedupe_stage),
+            *[thread(self._enrich_stage) for _ in range(self.enrich_workers)],
+            thread(self._write_stage),
+            thread(self._aggregate_stage),
+        ]
+        for stage in stages:
+            stage.start()
+        for stage in stages:
+            stage.join()
+
+        return self.stats
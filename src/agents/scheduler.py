@@ -0,0 +1,100 @@
+import logging
+import math
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Hashable, List
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CountrySchedule:
+    country: Hashable
+    interval: timedelta
+    next_run: datetime
+    # next_run without the jitter, a multiple of the interval since the epoch
+    slot: datetime = None
+
+
+class AdaptiveScheduler:
+    """Per-country polling intervals driven by the observed novelty rate.
+
+    After every poll the interval shrinks when most of the article budget was new
+    and grows when the feed was quiet, within [min_interval, max_interval]. Polls
+    are due at multiples of the interval since the epoch (plus a random jitter so
+    that countries do not bunch together): every country is polled at start, then
+    at the next interval boundary, then one interval after the previous slot
+    rather than after the poll finished, so the cadence does not drift with
+    cycle duration. After an interval change, or a poll that overran its next
+    slot, the next poll is at the next boundary of the interval.
+    """
+
+    def __init__(
+        self,
+        countries: List[Hashable],
+        base_interval: timedelta,
+        min_interval: timedelta = None,
+        max_interval: timedelta = None,
+        high_novelty: float = 0.5,
+        low_novelty: float = 0.1,
+        speedup: float = 0.5,
+        backoff: float = 1.5,
+        jitter: float = 0.1,
+    ):
+        self.min_interval = min_interval or base_interval / 4
+        self.max_interval = max_interval or base_interval * 4
+        self.high_novelty = high_novelty
+        self.low_novelty = low_novelty
+        self.speedup = speedup
+        self.backoff = backoff
+        self.jitter = jitter
+
+        now = datetime.now()
+        self.schedules = {
+            country: CountrySchedule(country, base_interval, now)
+            for country in countries
+        }
+
+    @staticmethod
+    def _boundary(now: datetime, interval: timedelta) -> datetime:
+        """The first multiple of the interval since the epoch after now."""
+        seconds = interval.total_seconds()
+        return datetime.fromtimestamp(
+            (math.floor(now.timestamp() / seconds) + 1) * seconds
+        )
+
+    def _advance(self, schedule: CountrySchedule, now: datetime, realign: bool):
+        slot = None
+        if schedule.slot is not None and not realign:
+            slot = schedule.slot + schedule.interval
+        if slot is None or slot <= now:
+            slot = self._boundary(now, schedule.interval)
+        schedule.slot = slot
+        schedule.next_run = slot + schedule.interval * random.uniform(0, self.jitter)
+
+    def due(self, now: datetime = None) -> List[Hashable]:
+        now = now or datetime.now()
+        return [s.country for s in self.schedules.values() if s.next_run <= now]
+
+    def next_due(self) -> datetime:
+        return min(s.next_run for s in self.schedules.values())
+
+    def record(self, country: Hashable, new: int, capacity: int, now: datetime = None):
+        schedule = self.schedules[country]
+        novelty = new / capacity if capacity else 0.0
+        if novelty >= self.high_novelty:
+            interval = schedule.interval * self.speedup
+        elif novelty <= self.low_novelty:
+            interval = schedule.interval * self.backoff
+        else:
+            interval = schedule.interval
+
+        interval = min(max(interval, self.min_interval), self.max_interval)
+        realign = interval != schedule.interval
+        schedule.interval = interval
+        self._advance(schedule, now or datetime.now(), realign)
+        logger.info(
+            f"Next poll for {country} at {schedule.next_run:%H:%M:%S} "
+            f"(novelty {novelty:.2f}, interval {schedule.interval})"
+        )
@@ -1,29 +1,76 @@
+import math
 from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import datetime, timedelta
 from typing import Any, List
 
 from src.databases.database import Database
-from src.dataclasses.aggregators import KeywordsAggregation, SentimentAggregation
+from src.dataclasses.aggregators import (
+    ARTICLES_NODE,
+    EntityGraph,
+    KeywordsAggregation,
+    KeywordTrend,
+    KeywordTrends,
+    SentimentAggregation,
+    SentimentScoreAggregation,
+    escape_key,
+    unescape_key,
+)
 from src.dataclasses.enriched_data import EnrichedData
+from src.telemetry.telemetry import span
+
+# Keyword counts of the periods not folded into the trends yet
+PERIOD_COUNTS_COLLECTION = "keyword_period_counts"
 
 
 class Aggregator(ABC):
-    def __init__(self, database: Database):
+    # Whether run_delta can correct the stored aggregations after a backfill
+    supports_delta = False
+    # Whether every run is one cycle, so that a cycle's articles must be passed
+    # at once; see KeywordTrendAggregator.add_to_period
+    per_cycle = False
+
+    def __init__(self, database: Database, per_story: bool = False):
         super().__init__()
         self.database = database
+        # Counts each story once, by its first article, instead of every article
+        self.per_story = per_story
+
+    def _counted(self, data: List[EnrichedData]) -> List[EnrichedData]:
+        if not self.per_story:
+            return data
+        return [item for item in data if item.story_id in (None, item.id)]
 
     @abstractmethod
     def run(self, *args, **kwargs):
         pass
 
+    def run_delta(
+        self,
+        old: List[EnrichedData],
+        new: List[EnrichedData],
+        metadata: dict,
+        date_time: datetime,
+        *args,
+        **kwargs,
+    ):
+        """Correct the stored aggregations after ``old`` was re-enriched as ``new``.
+
+        Only called on aggregators with ``supports_delta`` set.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not support deltas")
+
 
 class KeywordsAggregator(Aggregator):
-    def __init__(self, database):
-        super().__init__(database)
+    supports_delta = True
+
+    def __init__(self, database, per_story: bool = False):
+        super().__init__(database, per_story)
 
     def run(self, data: List[EnrichedData], metadata: dict, *args, **kwargs):
         keywords_aggregation = KeywordsAggregation.empty(metadata=metadata)
 
-        for enriched_data in data:
+        for enriched_data in self._counted(data):
             for keyword in enriched_data.keywords:
                 keywords_aggregation.add_keyword(keyword)
 
@@ -34,15 +81,29 @@ class KeywordsAggregator(Aggregator):
         )
         return keywords_aggregation
 
+    def run_delta(self, old, new, metadata, date_time, *args, **kwargs):
+        old, new = self._counted(old), self._counted(new)
+        counts = Counter(keyword for data in new for keyword in data.keywords or [])
+        counts.subtract(keyword for data in old for keyword in data.keywords or [])
+        delta = KeywordsAggregation.empty(date_time=date_time, metadata=metadata)
+        delta.keywords = {keyword: count for keyword, count in counts.items() if count}
+        if delta.keywords:
+            self.database.store(
+                id=delta._id, data=delta.to_dict(), collection="keywords_aggregations"
+            )
+        return delta
+
 
 class SentimentAggregator(Aggregator):
-    def __init__(self, database):
-        super().__init__(database)
+    supports_delta = True
+
+    def __init__(self, database, per_story: bool = False):
+        super().__init__(database, per_story)
 
     def run(self, data: List[EnrichedData], metadata: dict, *args, **kwargs):
         sentiment_aggregation = SentimentAggregation.empty(metadata=metadata)
 
-        for enriched_data in data:
+        for enriched_data in self._counted(data):
             sentiment_aggregation.add_sentiment(enriched_data.sentiment)
 
         self.database.store(
@@ -52,15 +113,325 @@ class SentimentAggregator(Aggregator):
         )
         return sentiment_aggregation
 
+    def run_delta(self, old, new, metadata, date_time, *args, **kwargs):
+        old, new = self._counted(old), self._counted(new)
+        counts = Counter(data.sentiment for data in new)
+        counts.subtract(data.sentiment for data in old)
+        delta = SentimentAggregation.empty(date_time=date_time, metadata=metadata)
+        delta.sentiment = {
+            sentiment: count for sentiment, count in counts.items() if count
+        }
+        if delta.sentiment:
+            self.database.store(
+                id=delta._id, data=delta.to_dict(), collection="sentiment_aggregations"
+            )
+        return delta
+
+
+class SentimentScoreAggregator(Aggregator):
+    def __init__(self, database, per_story: bool = False):
+        super().__init__(database, per_story)
+
+    def run(self, data: List[EnrichedData], metadata: dict, *args, **kwargs):
+        score_aggregation = SentimentScoreAggregation.empty(metadata=metadata)
+
+        for enriched_data in self._counted(data):
+            if enriched_data.sentiment_score is None:
+                continue
+            try:
+                score_aggregation.add_score(float(enriched_data.sentiment_score))
+            except (TypeError, ValueError):
+                continue
+
+        self.database.store(
+            id=score_aggregation._id,
+            data=score_aggregation.to_dict(),
+            collection="sentiment_score_aggregations",
+        )
+        return score_aggregation
+
+
+class KeywordTrendAggregator(Aggregator):
+    """Flags keyword bursts against per-country EWMA baselines.
+
+    Only the keywords seen in the current batch are touched: cycles in which a
+    keyword was absent are folded into its baseline lazily, as zero counts,
+    the next time it shows up. Callers that see a cycle's articles in several
+    batches count them with ``add_to_period`` and fold the period once with
+    ``close_periods``.
+    """
+
+    per_cycle = True
+
+    def __init__(
+        self,
+        database,
+        alpha: float = 0.3,
+        threshold: float = 3.0,
+        min_count: int = 2,
+        min_variance: float = 1.0,
+        warmup_cycles: int = 3,
+        top_k: int = 50,
+        per_story: bool = False,
+    ):
+        super().__init__(database, per_story)
+        self.alpha = alpha
+        self.threshold = threshold
+        self.min_count = min_count
+        self.min_variance = min_variance
+        self.warmup_cycles = warmup_cycles
+        self.top_k = top_k
+
+    def _decay(self, mean: float, variance: float, missed_cycles: int):
+        # EWMA update with a zero observation, repeated for each missed cycle
+        for _ in range(min(missed_cycles, 200)):
+            variance = (1 - self.alpha) * (variance + self.alpha * mean**2)
+            mean = (1 - self.alpha) * mean
+        return mean, variance
+
+    def _fold(self, state: dict | None, count: int, cycle: int):
+        """Baseline before the cycle, and the state once the count is folded in."""
+        if state:
+            mean, variance = self._decay(
+                state["mean"], state["variance"], cycle - state["cycle"] - 1
+            )
+        else:
+            mean, variance = 0.0, 0.0
+        diff = count - mean
+        increment = self.alpha * diff
+        folded = {
+            "mean": mean + increment,
+            "variance": (1 - self.alpha) * (variance + diff * increment),
+            "cycle": max(cycle, state["cycle"]) if state else cycle,
+        }
+        return mean, variance, folded
+
+    def _states(self, ids: List[str]) -> dict[str, dict | None]:
+        states = {
+            state["_id"]: state
+            for state in self.database.query(
+                query={"_id": {"$in": ids}}, collection="keyword_trend_state"
+            )
+        }
+        return {id: states.get(id) for id in ids}
+
+    def _counts(self, data: List[EnrichedData]) -> Counter:
+        return Counter(
+            keyword
+            for enriched_data in self._counted(data)
+            for keyword in enriched_data.keywords or []
+        )
+
+    def run(self, data: List[EnrichedData], metadata: dict, *args, **kwargs):
+        return self._fold_cycle(self._counts(data), metadata)
+
+    def add_to_period(self, data: List[EnrichedData], metadata: dict, period: int):
+        """Count the articles towards ``period``, to be folded by ``close_periods``.
+
+        Periods are increasing numbers, e.g. the start timestamp of the poll.
+        """
+        counts = self._counts(data)
+        if not counts:
+            return
+        country = metadata.get("country", "all")
+        id = f"{country}::{period}"
+        self.database.bulk_increment(
+            {id: {f"keywords.{escape_key(k)}": n for k, n in counts.items()}},
+            collection=PERIOD_COUNTS_COLLECTION,
+            defaults={id: {"country": country, "period": period}},
+        )
+
+    def close_periods(self, metadata: dict, before: int) -> KeywordTrends | None:
+        """Fold every period of the country before ``before`` as one cycle each.
+
+        A period folded already, e.g. by a retried job, is not folded again.
+        """
+        country = metadata.get("country", "all")
+        trends = None
+        for data in self.database.query(
+            query={"country": country, "period": {"$lt": before}},
+            collection=PERIOD_COUNTS_COLLECTION,
+            sort_by="period",
+        ):
+            counts = Counter(
+                {unescape_key(k): n for k, n in data.get("keywords", {}).items()}
+            )
+            trends = self._fold_cycle(counts, metadata, period=data["period"])
+            self.database.delete(data["_id"], collection=PERIOD_COUNTS_COLLECTION)
+        return trends
+
+    def _fold_cycle(
+        self, counts: Counter, metadata: dict, period: int = None
+    ) -> KeywordTrends:
+        country = metadata.get("country", "all")
+        if period is not None:
+            metadata = {**metadata, "period": period}
+        state_ids = {f"{country}::{keyword}": keyword for keyword in counts}
+
+        # Replicas may aggregate the same country at the same time: the cycle is
+        # claimed with a versioned write of the trends document, and so are the
+        # keyword states, recomputed from the current document on conflict
+        while True:
+            previous = self.database.get(country, collection="keyword_trends")
+            folded = (previous or {}).get("metadata", {}).get("period")
+            if period is not None and folded is not None and folded >= period:
+                return KeywordTrends.from_dict(previous)
+            cycle = (previous["cycle"] if previous else 0) + 1
+            states = self._states(list(state_ids))
+
+            trending = []
+            for state_id, keyword in state_ids.items():
+                count = counts[keyword]
+                mean, variance, _ = self._fold(states[state_id], count, cycle)
+                zscore = (count - mean) / math.sqrt(variance + self.min_variance)
+                if (
+                    cycle > self.warmup_cycles
+                    and count >= self.min_count
+                    and zscore >= self.threshold
+                ):
+                    trending.append(
+                        KeywordTrend(
+                            keyword=keyword, count=count, baseline=mean, zscore=zscore
+                        )
+                    )
+
+            trends = KeywordTrends(
+                _id=country,
+                date_time=datetime.now(),
+                cycle=cycle,
+                trending=sorted(trending, key=lambda t: t.zscore, reverse=True)[
+                    : self.top_k
+                ],
+                metadata=metadata,
+            )
+            version = previous.get("version") if previous else None
+            if not self.database.bulk_compare_and_set(
+                {trends._id: (trends.to_dict(), version)}, collection="keyword_trends"
+            ):
+                break
+
+        pending = list(state_ids)
+        while pending:
+            updates = {}
+            for state_id in pending:
+                state = states[state_id]
+                keyword = state_ids[state_id]
+                _, _, folded = self._fold(state, counts[keyword], cycle)
+                updates[state_id] = (
+                    {"country": country, "keyword": keyword, **folded},
+                    state.get("version") if state else None,
+                )
+            pending = self.database.bulk_compare_and_set(
+                updates, collection="keyword_trend_state"
+            )
+            if pending:
+                states.update(self._states(pending))
+        return trends
+
+
+class EntityCooccurrenceAggregator(Aggregator):
+    supports_delta = True
+
+    def __init__(
+        self,
+        database,
+        bucket_size: timedelta = timedelta(hours=1),
+        max_entities: int = 30,
+        per_story: bool = False,
+    ):
+        super().__init__(database, per_story)
+        self.bucket_size = bucket_size
+        self.max_entities = max_entities
+
+    def _bucket(self, date_time: datetime) -> datetime:
+        return datetime.min + (date_time - datetime.min) // self.bucket_size * (
+            self.bucket_size
+        )
+
+    def _graph(self, data: List[EnrichedData]) -> EntityGraph:
+        graph = EntityGraph()
+        for enriched_data in self._counted(data):
+            if enriched_data.entities:
+                graph.add_entities(enriched_data.entities[: self.max_entities])
+        return graph
+
+    def run(self, data: List[EnrichedData], metadata: dict, *args, **kwargs):
+        graph = self._graph(data)
+        self._increment(graph.to_increments, graph.counts, metadata, datetime.now())
+        return graph
+
+    def run_delta(self, old, new, metadata, date_time, *args, **kwargs):
+        new_graph, old_graph = self._graph(new), self._graph(old)
+
+        def delta(prefix):
+            increments = new_graph.to_increments(prefix)
+            for id, fields in old_graph.to_increments(prefix).items():
+                current = increments.setdefault(id, {})
+                for field, value in fields.items():
+                    current[field] = current.get(field, 0) - value
+            return {
+                id: {field: value for field, value in fields.items() if value}
+                for id, fields in increments.items()
+                if any(fields.values())
+            }
+
+        entities = {**old_graph.counts, **new_graph.counts}
+        self._increment(delta, entities, metadata, date_time)
+        return new_graph
+
+    def _increment(self, to_increments, entities, metadata, date_time):
+        country = metadata.get("country", "all")
+        bucket = self._bucket(date_time)
+        prefix = f"{country}::{bucket:%Y%m%d%H%M}"
+        increments = to_increments(prefix)
+        if not increments:
+            return
+        defaults = {
+            f"{prefix}::{escape_key(entity)}": {
+                "entity": entity,
+                "country": country,
+                "bucket": bucket,
+            }
+            for entity in [ARTICLES_NODE, *entities]
+        }
+        self.database.bulk_increment(
+            increments, collection="entity_cooccurrences", defaults=defaults
+        )
+
 
 class AggregatorManager:
     def __init__(self):
         self.aggregators = {}
+        self.views = []
 
     def add_aggregator(self, aggregator: Aggregator):
         self.aggregators[aggregator.__class__.__name__] = aggregator
 
-    def run(self, data: Any, metadata: dict, *args, **kwargs):
-        for aggregator in self.aggregators.values():
-            aggregator.run(data, metadata, *args, **kwargs)
+    def add_view(self, view):
+        self.views.append(view)
+
+    def per_cycle(self) -> list[Aggregator]:
+        return [a for a in self.aggregators.values() if a.per_cycle]
+
+    def run(self, data: Any, metadata: dict, *args, per_cycle: bool = True, **kwargs):
+        """Run the aggregators, then update the views with their results.
+
+        With ``per_cycle`` False, the aggregators that fold every run as one
+        cycle are skipped, for callers that count periods with them instead.
+        """
+        results = {}
+        for name, aggregator in self.aggregators.items():
+            if aggregator.per_cycle and not per_cycle:
+                continue
+            with span("aggregator_run", name):
+                results[name] = aggregator.run(data, metadata, *args, **kwargs)
+        for view in self.views:
+            with span("view_update", view.__class__.__name__):
+                view.update(results, metadata)
         return True
+
+    def flush(self):
+        databases = {id(a.database): a.database for a in self.aggregators.values()}
+        databases.update({id(v.database): v.database for v in self.views})
+        for database in databases.values():
+            database.flush()
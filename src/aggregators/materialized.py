@@ -0,0 +1,168 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+from src.databases.database import Database
+from src.dataclasses.aggregators import (
+    KeywordsAggregation,
+    SentimentAggregation,
+    WindowAggregation,
+    escape_key,
+    unescape_key,
+)
+
+DEFAULT_WINDOWS = {
+    "24h": timedelta(hours=24),
+    "7d": timedelta(days=7),
+}
+
+WINDOWS_COLLECTION = "materialized_windows"
+BUCKETS_COLLECTION = "materialized_window_buckets"
+
+
+def expire_op(bucket_id: str) -> str:
+    return f"expire::{bucket_id}"
+
+
+def bucket_counts(database: Database, buckets: list[dict]) -> tuple[Counter, Counter]:
+    """Keyword and sentiment counts of the buckets, read from their aggregations."""
+    keywords, sentiment = Counter(), Counter()
+    keywords_ids = [b["keywords_id"] for b in buckets if b.get("keywords_id")]
+    for data in database.query(
+        query={"_id": {"$in": keywords_ids}}, collection="keywords_aggregations"
+    ):
+        keywords.update(data["keywords"])
+    sentiment_ids = [b["sentiment_id"] for b in buckets if b.get("sentiment_id")]
+    for data in database.query(
+        query={"_id": {"$in": sentiment_ids}}, collection="sentiment_aggregations"
+    ):
+        sentiment.update(data["sentiment"])
+    return keywords, sentiment
+
+
+def _positive(counts: dict) -> dict:
+    return {unescape_key(key): count for key, count in counts.items() if count > 0}
+
+
+def window_id(window: str, country: str) -> str:
+    return f"{window}::{country}"
+
+
+def load_window(database: Database, window: str, country: str) -> WindowAggregation:
+    """Current totals of a window, read from its single document."""
+    id = window_id(window, country)
+    data = database.get(id, collection=WINDOWS_COLLECTION)
+    return parse_window(window, country, data)
+
+
+def parse_window(window: str, country: str, data: dict | None) -> WindowAggregation:
+    """Window totals from its document, as read by ``load_window``."""
+    id = window_id(window, country)
+    if not data:
+        return WindowAggregation.empty(window, country)
+    return WindowAggregation(
+        _id=id,
+        window=window,
+        country=country,
+        updated_at=data.get("updated_at"),
+        keywords=_positive(data.get("keywords", {})),
+        sentiment=_positive(data.get("sentiment", {})),
+        buckets=[],
+    )
+
+
+def _increments(keywords: dict, sentiment: dict, sign: int = 1) -> dict:
+    increments = {
+        f"keywords.{escape_key(keyword)}": sign * count
+        for keyword, count in keywords.items()
+        if count
+    }
+    increments.update(
+        {
+            f"sentiment.{escape_key(label)}": sign * count
+            for label, count in sentiment.items()
+            if count
+        }
+    )
+    return increments
+
+
+class MaterializedWindows:
+    """Rolling keyword/sentiment totals for a fixed set of windows.
+
+    Every aggregation run is added to the window totals with an atomic
+    increment and recorded as a bucket; buckets that fell out of a window are
+    subtracted again by re-reading their stored aggregation, so a window is never
+    recomputed from scratch and a read is a single document lookup. Every update
+    expires the buckets of all the countries, so quiet countries are trimmed too.
+    Increments carry the bucket id as op id, so several replicas can update and
+    expire the same windows concurrently.
+    """
+
+    collection = WINDOWS_COLLECTION
+
+    def __init__(self, database: Database, windows: dict[str, timedelta] = None):
+        self.database = database
+        self.windows = windows or DEFAULT_WINDOWS
+
+    def expire(self, now: datetime = None):
+        """Subtract the buckets that fell out of their window and drop them."""
+        now = now or datetime.now()
+        for window, length in self.windows.items():
+            for bucket in self.database.query(
+                query={"window": window, "date_time": {"$lt": now - length}},
+                collection=BUCKETS_COLLECTION,
+            ):
+                keywords, sentiment = bucket_counts(self.database, [bucket])
+                increments = _increments(keywords, sentiment, sign=-1)
+                if increments:
+                    self.database.bulk_increment(
+                        {f"{window}::{bucket['country']}": increments},
+                        collection=self.collection,
+                        op_id=expire_op(bucket["_id"]),
+                    )
+                self.database.delete(bucket["_id"], collection=BUCKETS_COLLECTION)
+
+    def update(self, results: dict, metadata: dict):
+        keywords = next(
+            (r for r in results.values() if isinstance(r, KeywordsAggregation)), None
+        )
+        sentiment = next(
+            (r for r in results.values() if isinstance(r, SentimentAggregation)), None
+        )
+        if keywords is None and sentiment is None:
+            return
+
+        now = datetime.now()
+        bucket = {
+            "date_time": (keywords or sentiment).date_time,
+            "keywords_id": keywords._id if keywords else None,
+            "sentiment_id": sentiment._id if sentiment else None,
+        }
+        increments = _increments(
+            keywords.keywords if keywords else {},
+            sentiment.sentiment if sentiment else {},
+        )
+
+        country = metadata.get("country", "all")
+        for window in self.windows:
+            for scope in {country, "all"}:
+                id = f"{window}::{scope}"
+                bucket_id = f"{id}::{(keywords or sentiment)._id}"
+                if increments:
+                    self.database.bulk_increment(
+                        {id: increments},
+                        collection=self.collection,
+                        defaults={id: {"window": window, "country": scope}},
+                        op_id=bucket_id,
+                    )
+                self.database.update(
+                    id=bucket_id,
+                    data={**bucket, "window": window, "country": scope},
+                    collection=BUCKETS_COLLECTION,
+                )
+                self.database.update(
+                    id=id,
+                    data={"window": window, "country": scope, "updated_at": now},
+                    collection=self.collection,
+                )
+        self.expire(now)
@@ -1,7 +1,32 @@
+import os
+import pickle
+import threading
 from abc import ABC, abstractmethod
+from time import monotonic
 from typing import Any
 
-from pymongo import MongoClient
+from pymongo import (
+    ASCENDING,
+    DESCENDING,
+    AsyncMongoClient,
+    InsertOne,
+    MongoClient,
+    UpdateOne,
+)
+from pymongo.errors import BulkWriteError, CollectionInvalid
+
+from src.databases.memory import INDEX_TYPES, MemoryCollection
+
+_INDEX_KINDS = {index_type: kind for kind, index_type in INDEX_TYPES.items()}
+
+
+def _without_id(data: dict) -> dict:
+    # "_id" is immutable in Mongo, it must not appear inside a $set
+    return {key: value for key, value in data.items() if key != "_id"}
+
+
+# Op ids of the last increments kept on each document to skip replays
+APPLIED_OPS = 64
 
 
 class Database(ABC):
@@ -25,10 +50,108 @@ class Database(ABC):
     def query(self, query: Any, *args, **kwargs):
         pass
 
+    def bulk_update(self, updates: dict[str, Any], *args, **kwargs):
+        for id, data in updates.items():
+            self.update(id, data, *args, **kwargs)
+
+    def bulk_increment(
+        self,
+        increments: dict[str, dict],
+        *args,
+        defaults: dict[str, dict] = None,
+        op_id: str = None,
+        **kwargs
+    ):
+        """Add the amounts to the fields, creating missing documents from defaults.
+
+        Documents remember the last ``APPLIED_OPS`` op ids they applied, so an
+        increment replayed with the same ``op_id`` is applied only once.
+        """
+        for id, fields in increments.items():
+            current = self.get(id, *args, **kwargs)
+            if current is None:
+                current = dict((defaults or {}).get(id, {}))
+            if op_id is not None and op_id in current.get("_ops", []):
+                continue
+            for path, amount in fields.items():
+                node = current
+                *parents, leaf = path.split(".")
+                for parent in parents:
+                    node = node.setdefault(parent, {})
+                node[leaf] = node.get(leaf, 0) + amount
+            if op_id is not None:
+                current["_ops"] = [*current.get("_ops", []), op_id][-APPLIED_OPS:]
+            self.update(id, current, *args, **kwargs)
+
+    def bulk_compare_and_set(
+        self, updates: dict[str, tuple[dict, int | None]], *args, **kwargs
+    ) -> list[str]:
+        """Set each document whose ``version`` is still the given one.
+
+        ``updates`` maps ids to ``(data, version)``, where a None version expects
+        a document without one (or no document). Written documents get the next
+        version; returns the ids of those that changed in the meantime.
+        """
+        conflicts = []
+        for id, (data, version) in updates.items():
+            current = self.get(id, *args, **kwargs)
+            if (current or {}).get("version") != version:
+                conflicts.append(id)
+                continue
+            self.update(id, {**data, "version": (version or 0) + 1}, *args, **kwargs)
+        return conflicts
+
+    def flush(self, *args, **kwargs):
+        pass
+
+
+AGGREGATION_INDEXES = [
+    [("date_time", ASCENDING)],
+    [("metadata.country", ASCENDING), ("date_time", ASCENDING)],
+]
+
+DEFAULT_INDEXES = {
+    "keywords_aggregations": AGGREGATION_INDEXES,
+    "sentiment_aggregations": AGGREGATION_INDEXES,
+    "sentiment_score_aggregations": AGGREGATION_INDEXES,
+    "entity_cooccurrences": [
+        [("entity", ASCENDING), ("bucket", ASCENDING)],
+        [("country", ASCENDING), ("entity", ASCENDING), ("bucket", ASCENDING)],
+    ],
+    "materialized_window_buckets": [[("window", ASCENDING), ("date_time", ASCENDING)]],
+    "runs": [[("agent_id", ASCENDING), ("start_time", DESCENDING)]],
+    "jobs": [
+        [
+            ("kind", ASCENDING),
+            ("status", ASCENDING),
+            ("priority", DESCENDING),
+            ("available_at", ASCENDING),
+        ],
+        [("status", ASCENDING), ("lease_until", ASCENDING)],
+    ],
+    "keyword_period_counts": [[("country", ASCENDING), ("period", ASCENDING)]],
+}
+
 
 class MongoDatabase(Database):
+    # Collections known to exist and collections whose indexes were ensured by
+    # this process, shared by every instance and keyed by server/database.
+    _known_collections: dict[str, set[str]] = {}
+    _indexed_collections: dict[str, set[str]] = {}
+    _registry_lock = threading.Lock()
+
     def __init__(
-        self, host: str, db_name: str, username: str, password: str, port: int = 27017
+        self,
+        host: str,
+        db_name: str,
+        username: str,
+        password: str,
+        port: int = 27017,
+        max_pool_size: int = 100,
+        min_pool_size: int = 0,
+        write_buffer_size: int = 0,
+        write_buffer_interval: float = None,
+        indexes: dict[str, list] = None,
     ):
         super().__init__()
         self._client = MongoClient(
@@ -37,28 +160,215 @@ class MongoDatabase(Database):
             username=username,
             password=password,
             authSource="admin",
+            maxPoolSize=max_pool_size,
+            minPoolSize=min_pool_size,
         )
 
         self.db = self._client.get_database(db_name)
+        self.indexes = DEFAULT_INDEXES if indexes is None else indexes
+        self.write_buffer_size = write_buffer_size
+        self.write_buffer_interval = write_buffer_interval
+        self._registry_key = f"{host}:{port}/{db_name}"
+        self._buffer: dict[str, list] = {}
+        self._buffer_lock = threading.Lock()
+        self._last_flush = monotonic()
 
     def _maybe_create_collection(self, collection: str):
-        if collection not in self.db.list_collection_names():
-            self.db.create_collection(collection)
+        known = self._known_collections.get(self._registry_key)
+        indexed = self._indexed_collections.get(self._registry_key)
+        if known is not None and collection in known and collection in indexed:
+            return
+
+        with self._registry_lock:
+            if known is None:
+                known = self._known_collections.setdefault(
+                    self._registry_key, set(self.db.list_collection_names())
+                )
+            indexed = self._indexed_collections.setdefault(self._registry_key, set())
+            if collection not in known:
+                try:
+                    self.db.create_collection(collection)
+                except CollectionInvalid:
+                    # Created concurrently by another process
+                    pass
+                known.add(collection)
+            if collection not in indexed:
+                # Also for existing collections, which may predate the indexes;
+                # create_index is a no-op when the index exists
+                for keys in self.indexes.get(collection, []):
+                    self.db[collection].create_index(keys)
+                indexed.add(collection)
+
+    def collection(self, name: str):
+        """Raw pymongo collection, for operations outside the Database interface."""
+        self._maybe_create_collection(name)
+        self._read_your_writes(name)
+        return self.db[name]
+
+    def _buffered(self, collection: str, operations: list) -> bool:
+        if not self.write_buffer_size:
+            return False
+
+        with self._buffer_lock:
+            pending = self._buffer.setdefault(collection, [])
+            pending.extend(operations)
+            size = sum(len(ops) for ops in self._buffer.values())
+        expired = (
+            self.write_buffer_interval is not None
+            and monotonic() - self._last_flush >= self.write_buffer_interval
+        )
+        if size >= self.write_buffer_size or expired:
+            self.flush()
+        return True
+
+    def flush(self, collection: str = None):
+        with self._buffer_lock:
+            if collection is None:
+                buffer, self._buffer = self._buffer, {}
+                self._last_flush = monotonic()
+            else:
+                buffer = {collection: self._buffer.pop(collection, [])}
+
+        for name, operations in buffer.items():
+            if not operations:
+                continue
+            try:
+                self._maybe_create_collection(name)
+                self.db[name].bulk_write(operations, ordered=True)
+            except BulkWriteError as e:
+                # Ordered writes stop at the first error: the operations before
+                # it were applied and the failing one would fail again
+                failed = e.details["writeErrors"][0]["index"]
+                self._requeue(name, operations[failed + 1 :])
+                raise
+            except Exception:
+                self._requeue(name, operations)
+                raise
+
+    def _requeue(self, collection: str, operations: list):
+        with self._buffer_lock:
+            self._buffer[collection] = operations + self._buffer.get(collection, [])
+
+    def _read_your_writes(self, collection: str):
+        if self._buffer.get(collection):
+            self.flush(collection)
 
     def get(self, id: str, collection: str, *args, **kwargs):
         self._maybe_create_collection(collection)
+        self._read_your_writes(collection)
         return self.db[collection].find_one({"_id": id})
 
     def store(self, id: str, data: Any, collection: str, *args, **kwargs):
+        if self._buffered(collection, [InsertOne({"_id": id, **data})]):
+            return None
         self._maybe_create_collection(collection)
         return self.db[collection].insert_one({"_id": id, **data})
 
-    def update(self, id: str, data: Any, collection: str, *args, **kwargs):
+    def update(
+        self, id: str, data: Any, collection: str, upsert: bool = True, *args, **kwargs
+    ):
+        operation = UpdateOne({"_id": id}, {"$set": _without_id(data)}, upsert=upsert)
+        if self._buffered(collection, [operation]):
+            return None
+        self._maybe_create_collection(collection)
+        return self.db[collection].update_one(
+            {"_id": id}, {"$set": _without_id(data)}, upsert=upsert
+        )
+
+    def bulk_update(
+        self,
+        updates: dict[str, Any],
+        collection: str,
+        upsert: bool = True,
+        *args,
+        **kwargs
+    ):
+        if not updates:
+            return None
+        operations = [
+            UpdateOne({"_id": id}, {"$set": _without_id(data)}, upsert=upsert)
+            for id, data in updates.items()
+        ]
+        if self._buffered(collection, operations):
+            return None
+        self._maybe_create_collection(collection)
+        return self.db[collection].bulk_write(operations, ordered=False)
+
+    def bulk_increment(
+        self,
+        increments: dict[str, dict],
+        collection: str,
+        defaults: dict[str, dict] = None,
+        op_id: str = None,
+        *args,
+        **kwargs
+    ):
+        if not increments:
+            return None
+        defaults = defaults or {}
+        operations = []
+        for id, fields in increments.items():
+            update = {"$inc": fields}
+            if defaults.get(id):
+                update["$setOnInsert"] = _without_id(defaults[id])
+            if op_id is None:
+                operations.append(UpdateOne({"_id": id}, update, upsert=True))
+                continue
+            # Documents that already applied the op do not match, and the upsert
+            # then fails with a duplicate key error instead of inserting
+            update["$push"] = {"_ops": {"$each": [op_id], "$slice": -APPLIED_OPS}}
+            operations.append(
+                UpdateOne({"_id": id, "_ops": {"$ne": op_id}}, update, upsert=True)
+            )
+        if op_id is None and self._buffered(collection, operations):
+            return None
+
+        # Guarded increments are not buffered: a replayed one would fail an
+        # ordered flush. Earlier buffered writes go first to keep the order.
+        self.flush(collection)
+        self._maybe_create_collection(collection)
+        try:
+            return self.db[collection].bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if op_id is None or any(error["code"] != 11000 for error in errors):
+                raise
+            return None
+
+    def bulk_compare_and_set(
+        self,
+        updates: dict[str, tuple[dict, int | None]],
+        collection: str,
+        *args,
+        **kwargs
+    ) -> list[str]:
+        if not updates:
+            return []
+        ids = list(updates)
+        # A document with another version does not match, and the upsert then
+        # fails with a duplicate key error instead of inserting
+        operations = [
+            UpdateOne(
+                {"_id": id, "version": version},
+                {"$set": {**_without_id(data), "version": (version or 0) + 1}},
+                upsert=True,
+            )
+            for id, (data, version) in updates.items()
+        ]
+        self.flush(collection)
         self._maybe_create_collection(collection)
-        return self.db[collection].update_one({"_id": id, **data})
+        try:
+            self.db[collection].bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error["code"] != 11000 for error in errors):
+                raise
+            return [ids[error["index"]] for error in errors]
+        return []
 
     def delete(self, id: str, collection: str, *args, **kwargs):
         self._maybe_create_collection(collection)
+        self._read_your_writes(collection)
         return self.db[collection].delete_one({"_id": id})
 
     def query(
@@ -72,6 +382,7 @@ class MongoDatabase(Database):
         **kwargs
     ):
         self._maybe_create_collection(collection)
+        self._read_your_writes(collection)
 
         result = self.db[collection].find(query)
         if sort_by:
@@ -83,22 +394,296 @@ class MongoDatabase(Database):
         return list(result)
 
 
+class AsyncDatabase(ABC):
+    @abstractmethod
+    async def get(self, id: str, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    async def store(self, id: str, data: Any, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    async def update(self, id: str, data: Any, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    async def delete(self, id: str, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    async def query(self, query: Any, *args, **kwargs):
+        pass
+
+    async def bulk_update(self, updates: dict[str, Any], *args, **kwargs):
+        for id, data in updates.items():
+            await self.update(id, data, *args, **kwargs)
+
+    async def flush(self, *args, **kwargs):
+        pass
+
+    async def close(self):
+        pass
+
+
+class AsyncMongoDatabase(AsyncDatabase):
+    # One client (and therefore one connection pool) per server and credentials,
+    # shared by every instance in the process.
+    _clients: dict[tuple, AsyncMongoClient] = {}
+    _known_collections: dict[str, set[str]] = {}
+    _indexed_collections: dict[str, set[str]] = {}
+
+    def __init__(
+        self,
+        host: str,
+        db_name: str,
+        username: str,
+        password: str,
+        port: int = 27017,
+        max_pool_size: int = 100,
+        min_pool_size: int = 0,
+        indexes: dict[str, list] = None,
+    ):
+        super().__init__()
+        key = (host, port, username, max_pool_size, min_pool_size)
+        if key not in self._clients:
+            self._clients[key] = AsyncMongoClient(
+                host=host,
+                port=port,
+                username=username,
+                password=password,
+                authSource="admin",
+                maxPoolSize=max_pool_size,
+                minPoolSize=min_pool_size,
+            )
+        self._client_key = key
+        self._client = self._clients[key]
+        self.db = self._client.get_database(db_name)
+        self.indexes = DEFAULT_INDEXES if indexes is None else indexes
+        self._registry_key = f"{host}:{port}/{db_name}"
+
+    async def _maybe_create_collection(self, collection: str):
+        known = self._known_collections.get(self._registry_key)
+        if known is None:
+            known = self._known_collections.setdefault(
+                self._registry_key, set(await self.db.list_collection_names())
+            )
+        indexed = self._indexed_collections.setdefault(self._registry_key, set())
+        if collection not in known:
+            try:
+                await self.db.create_collection(collection)
+            except CollectionInvalid:
+                pass
+            known.add(collection)
+        if collection not in indexed:
+            for keys in self.indexes.get(collection, []):
+                await self.db[collection].create_index(keys)
+            indexed.add(collection)
+
+    async def get(self, id: str, collection: str, *args, **kwargs):
+        await self._maybe_create_collection(collection)
+        return await self.db[collection].find_one({"_id": id})
+
+    async def store(self, id: str, data: Any, collection: str, *args, **kwargs):
+        await self._maybe_create_collection(collection)
+        return await self.db[collection].insert_one({"_id": id, **data})
+
+    async def update(
+        self, id: str, data: Any, collection: str, upsert: bool = True, *args, **kwargs
+    ):
+        await self._maybe_create_collection(collection)
+        return await self.db[collection].update_one(
+            {"_id": id}, {"$set": _without_id(data)}, upsert=upsert
+        )
+
+    async def bulk_update(
+        self,
+        updates: dict[str, Any],
+        collection: str,
+        upsert: bool = True,
+        *args,
+        **kwargs
+    ):
+        if not updates:
+            return None
+        await self._maybe_create_collection(collection)
+        return await self.db[collection].bulk_write(
+            [
+                UpdateOne({"_id": id}, {"$set": _without_id(data)}, upsert=upsert)
+                for id, data in updates.items()
+            ],
+            ordered=False,
+        )
+
+    async def delete(self, id: str, collection: str, *args, **kwargs):
+        await self._maybe_create_collection(collection)
+        return await self.db[collection].delete_one({"_id": id})
+
+    async def query(
+        self,
+        query: dict,
+        collection: str,
+        sort_by: str = None,
+        limit: int = None,
+        ascending: bool = True,
+        *args,
+        **kwargs
+    ):
+        await self._maybe_create_collection(collection)
+
+        result = self.db[collection].find(query)
+        if sort_by:
+            result = result.sort(sort_by, 1 if ascending else -1)
+
+        if limit:
+            result = result.limit(limit)
+
+        return await result.to_list()
+
+    async def close(self):
+        """Close the client, shared by every instance for the same server."""
+        if self._clients.pop(self._client_key, None) is not None:
+            await self._client.close()
+
+
+DEFAULT_MEMORY_INDEXES = (
+    ("date_time", "sorted"),
+    ("metadata.country", "hash"),
+)
+
+
 class InMemoryDatabase(Database):
-    def __init__(self):
+    """Process-local stand-in for MongoDatabase.
+
+    Collections are separate namespaces supporting a subset of the Mongo filter
+    language, with optional sorted/hash secondary indexes. When a snapshot path
+    is given the whole store is pickled there on flush and reloaded on start.
+    """
+
+    def __init__(
+        self,
+        default_indexes: tuple[tuple[str, str], ...] = DEFAULT_MEMORY_INDEXES,
+        snapshot_path: str = None,
+    ):
         super().__init__()
-        self.data = {}
+        self.default_indexes = default_indexes
+        self.snapshot_path = snapshot_path
+        self.collections: dict[str, MemoryCollection] = {}
+        self._lock = threading.RLock()
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load()
 
-    def get(self, id: str, *args, **kwargs):
-        return self.data.get(id)
+    def _collection(self, collection: str) -> MemoryCollection:
+        if collection not in self.collections:
+            self.collections[collection] = MemoryCollection(self.default_indexes)
+        return self.collections[collection]
 
-    def store(self, id: str, data: Any, *args, **kwargs):
-        self.data[id] = data
+    def create_index(self, collection: str, field: str, kind: str = "sorted"):
+        with self._lock:
+            self._collection(collection).create_index(field, kind)
 
-    def update(self, id: str, data: Any, *args, **kwargs):
-        self.data[id] = data
+    def get(self, id: str, collection: str = "default", *args, **kwargs):
+        return self._collection(collection).get(id)
 
-    def delete(self, id: str, *args, **kwargs):
-        del self.data[id]
+    def store(self, id: str, data: Any, collection: str = "default", *args, **kwargs):
+        with self._lock:
+            self._collection(collection).insert(id, data)
 
-    def query(self, query: Any, *args, **kwargs):
-        return [v for k, v in self.data.items() if query in k]
+    def update(
+        self,
+        id: str,
+        data: Any,
+        collection: str = "default",
+        upsert: bool = True,
+        *args,
+        **kwargs
+    ):
+        with self._lock:
+            target = self._collection(collection)
+            if upsert or target.get(id) is not None:
+                target.modify(id, data)
+
+    def bulk_increment(
+        self,
+        increments: dict[str, dict],
+        collection: str = "default",
+        defaults: dict[str, dict] = None,
+        op_id: str = None,
+        *args,
+        **kwargs
+    ):
+        with self._lock:
+            target = self._collection(collection)
+            for id, fields in increments.items():
+                applied = (target.get(id) or {}).get("_ops", [])
+                if op_id is not None and op_id in applied:
+                    continue
+                target.modify(
+                    id, fields, increment=True, defaults=(defaults or {}).get(id)
+                )
+                if op_id is not None:
+                    target.modify(id, {"_ops": [*applied, op_id][-APPLIED_OPS:]})
+
+    def bulk_compare_and_set(
+        self,
+        updates: dict[str, tuple[dict, int | None]],
+        collection: str = "default",
+        *args,
+        **kwargs
+    ) -> list[str]:
+        with self._lock:
+            return super().bulk_compare_and_set(updates, collection, *args, **kwargs)
+
+    def delete(self, id: str, collection: str = "default", *args, **kwargs):
+        with self._lock:
+            self._collection(collection).remove(id)
+
+    def query(
+        self,
+        query: dict,
+        collection: str = "default",
+        sort_by: str = None,
+        limit: int = None,
+        ascending: bool = True,
+        *args,
+        **kwargs
+    ):
+        with self._lock:
+            return self._collection(collection).find(
+                query, sort_by=sort_by, limit=limit, ascending=ascending
+            )
+
+    def flush(self, *args, **kwargs):
+        if self.snapshot_path:
+            self.snapshot()
+
+    def snapshot(self, path: str = None):
+        path = path or self.snapshot_path
+        with self._lock:
+            state = {
+                name: (
+                    collection.documents,
+                    [
+                        (field, _INDEX_KINDS[type(index)])
+                        for field, index in collection.indexes.items()
+                    ],
+                )
+                for name, collection in self.collections.items()
+            }
+            with open(f"{path}.tmp", "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{path}.tmp", path)
+
+    def load(self, path: str = None):
+        path = path or self.snapshot_path
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        with self._lock:
+            self.collections = {}
+            for name, (documents, indexes) in state.items():
+                collection = MemoryCollection(indexes)
+                for id, document in documents.items():
+                    collection.documents[id] = document
+                    for index in collection.indexes.values():
+                        index.add(id, document)
+                self.collections[name] = collection
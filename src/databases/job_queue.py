@@ -0,0 +1,178 @@
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+
+from src.databases.database import MongoDatabase
+from src.dataclasses.jobs import Job, JobStatus
+
+logger = logging.getLogger(__name__)
+
+
+class MongoJobQueue:
+    """Job queue with atomic, expiring leases on top of a Mongo collection.
+
+    Jobs are keyed by ``kind::key`` so enqueueing the same work twice is a no-op.
+    A worker owns a job while its lease is valid; every state change is
+    conditioned on the owner, so a worker whose lease expired and was requeued
+    cannot complete the job anymore. Done jobs are removed by a TTL index after
+    ``retention``, which must be longer than the period of the country jobs:
+    until then they keep their key from being enqueued again. Dead jobs are
+    kept, to be inspected.
+    """
+
+    def __init__(
+        self,
+        database: MongoDatabase,
+        collection: str = "jobs",
+        lease: timedelta = timedelta(minutes=5),
+        max_attempts: int = 3,
+        retry_delay: timedelta = timedelta(seconds=30),
+        retention: timedelta = timedelta(days=1),
+    ):
+        self.database = database
+        self.collection = collection
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retention = retention
+        # Documents expire at their own expires_at, which only done jobs have
+        self.jobs.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+
+    @property
+    def jobs(self):
+        return self.database.collection(self.collection)
+
+    def enqueue(
+        self, kind: str, key: str, payload: dict, priority: int = 0
+    ) -> bool:
+        now = datetime.now()
+        job = Job(
+            _id=f"{kind}::{key}",
+            kind=kind,
+            key=key,
+            payload=payload,
+            priority=priority,
+            available_at=now,
+            created_at=now,
+        )
+        result = self.jobs.update_one(
+            {"_id": job._id}, {"$setOnInsert": job.to_dict()}, upsert=True
+        )
+        return result.upserted_id is not None
+
+    def acquire(self, worker_id: str, kinds: List[str]) -> Job | None:
+        now = datetime.now()
+        data = self.jobs.find_one_and_update(
+            {
+                "kind": {"$in": kinds},
+                "available_at": {"$lte": now},
+                "attempts": {"$lt": self.max_attempts},
+                "$or": [
+                    {"status": JobStatus.PENDING.value},
+                    {"status": JobStatus.LEASED.value, "lease_until": {"$lt": now}},
+                ],
+            },
+            {
+                "$set": {
+                    "status": JobStatus.LEASED.value,
+                    "worker_id": worker_id,
+                    "lease_until": now + self.lease,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", DESCENDING), ("available_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+        return Job.from_dict(data) if data else None
+
+    def _owned(self, job: Job, worker_id: str) -> dict:
+        return {
+            "_id": job._id,
+            "worker_id": worker_id,
+            "status": JobStatus.LEASED.value,
+        }
+
+    def heartbeat(self, job: Job, worker_id: str) -> bool:
+        result = self.jobs.update_one(
+            self._owned(job, worker_id),
+            {"$set": {"lease_until": datetime.now() + self.lease}},
+        )
+        return result.modified_count == 1
+
+    def complete(self, job: Job, worker_id: str) -> bool:
+        result = self.jobs.update_one(
+            self._owned(job, worker_id),
+            {
+                "$set": {
+                    "status": JobStatus.DONE.value,
+                    "lease_until": None,
+                    # TTL indexes compare with the UTC time
+                    "expires_at": datetime.now(timezone.utc) + self.retention,
+                }
+            },
+        )
+        return result.modified_count == 1
+
+    def fail(self, job: Job, worker_id: str, error: Exception) -> bool:
+        dead = job.attempts >= self.max_attempts
+        result = self.jobs.update_one(
+            self._owned(job, worker_id),
+            {
+                "$set": {
+                    "status": (JobStatus.DEAD if dead else JobStatus.PENDING).value,
+                    "lease_until": None,
+                    "available_at": datetime.now() + self.retry_delay,
+                    "message": str(error),
+                }
+            },
+        )
+        return result.modified_count == 1
+
+    def reap(self) -> int:
+        """Mark jobs whose last allowed attempt expired as dead."""
+        result = self.jobs.update_many(
+            {
+                "status": JobStatus.LEASED.value,
+                "lease_until": {"$lt": datetime.now()},
+                "attempts": {"$gte": self.max_attempts},
+            },
+            {"$set": {"status": JobStatus.DEAD.value, "message": "lease expired"}},
+        )
+        return result.modified_count
+
+
+class Heartbeat:
+    """Keeps the leases of the given jobs alive while the block runs."""
+
+    def __init__(self, queue: MongoJobQueue, jobs: List[Job], worker_id: str):
+        self.queue = queue
+        self.jobs = jobs
+        self.worker_id = worker_id
+        self.lost: set[str] = set()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        interval = self.queue.lease.total_seconds() / 3
+        while not self._stop_event.wait(interval):
+            for job in self.jobs:
+                if job._id in self.lost:
+                    continue
+                try:
+                    if not self.queue.heartbeat(job, self.worker_id):
+                        logger.warning(f"Lost lease on job {job._id}")
+                        self.lost.add(job._id)
+                except Exception as e:
+                    logger.error(f"Heartbeat failed for job {job._id}")
+                    logger.error(e)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop_event.set()
+        self._thread.join()
@@ -0,0 +1,348 @@
+from bisect import bisect_left, bisect_right
+from copy import deepcopy
+from typing import Any, Iterable
+
+_MISSING = object()
+
+
+def get_path(document: dict, path: str):
+    node = document
+    for part in path.split("."):
+        if isinstance(node, dict) and part in node:
+            node = node[part]
+        else:
+            return _MISSING
+    return node
+
+
+def set_path(document: dict, path: str, value: Any):
+    node = document
+    *parents, leaf = path.split(".")
+    for part in parents:
+        node = node.setdefault(part, {})
+    node[leaf] = value
+
+
+def _compare(operator, value, target) -> bool:
+    if value is _MISSING:
+        return False
+    if isinstance(value, list):
+        return any(_compare(operator, item, target) for item in value)
+    try:
+        return operator(value, target)
+    except TypeError:
+        return False
+
+
+def _equals(value, target) -> bool:
+    if value is _MISSING:
+        return target is None
+    if isinstance(value, list) and not isinstance(target, list):
+        return target in value
+    return value == target
+
+
+_OPERATORS = {
+    "$eq": _equals,
+    "$ne": lambda value, target: not _equals(value, target),
+    "$gt": lambda value, target: _compare(lambda a, b: a > b, value, target),
+    "$gte": lambda value, target: _compare(lambda a, b: a >= b, value, target),
+    "$lt": lambda value, target: _compare(lambda a, b: a < b, value, target),
+    "$lte": lambda value, target: _compare(lambda a, b: a <= b, value, target),
+    "$in": lambda value, targets: any(_equals(value, t) for t in targets),
+    "$nin": lambda value, targets: not any(_equals(value, t) for t in targets),
+    "$exists": lambda value, exists: (value is not _MISSING) == bool(exists),
+}
+
+
+def _is_operator_condition(condition) -> bool:
+    return (
+        isinstance(condition, dict)
+        and bool(condition)
+        and all(key.startswith("$") for key in condition)
+    )
+
+
+def match(document: dict, query: dict) -> bool:
+    """Evaluate the supported subset of the Mongo filter language."""
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(match(document, q) for q in condition):
+                return False
+        elif key == "$or":
+            if not any(match(document, q) for q in condition):
+                return False
+        elif key == "$nor":
+            if any(match(document, q) for q in condition):
+                return False
+        else:
+            value = get_path(document, key)
+            if _is_operator_condition(condition):
+                for operator, target in condition.items():
+                    if operator not in _OPERATORS:
+                        raise ValueError(f"Unsupported operator: {operator}")
+                    if not _OPERATORS[operator](value, target):
+                        return False
+            elif not _equals(value, condition):
+                return False
+    return True
+
+
+def _index_values(value) -> list:
+    if value is _MISSING:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+class HashIndex:
+    def __init__(self, field: str):
+        self.field = field
+        self.entries: dict[Any, set[str]] = {}
+
+    def add(self, id: str, document: dict):
+        for value in _index_values(get_path(document, self.field)):
+            try:
+                self.entries.setdefault(value, set()).add(id)
+            except TypeError:
+                continue
+
+    def remove(self, id: str, document: dict):
+        for value in _index_values(get_path(document, self.field)):
+            try:
+                ids = self.entries.get(value)
+            except TypeError:
+                continue
+            if ids:
+                ids.discard(id)
+                if not ids:
+                    del self.entries[value]
+
+    def lookup(self, condition) -> list[str] | None:
+        if _is_operator_condition(condition):
+            if set(condition) == {"$eq"}:
+                targets = [condition["$eq"]]
+            elif set(condition) == {"$in"}:
+                targets = condition["$in"]
+            else:
+                return None
+        else:
+            targets = [condition]
+
+        ids = set()
+        for target in targets:
+            if target is None:
+                return None
+            try:
+                ids.update(self.entries.get(target, ()))
+            except TypeError:
+                return None
+        return list(ids)
+
+
+class SortedIndex:
+    def __init__(self, field: str):
+        self.field = field
+        self.values: list = []
+        self.ids: list[str] = []
+        # Documents without a comparable value; range queries never match them,
+        # but sorted scans still have to return them.
+        self.unindexed: set[str] = set()
+
+    def add(self, id: str, document: dict):
+        indexed = False
+        for value in _index_values(get_path(document, self.field)):
+            try:
+                position = bisect_right(self.values, value)
+            except TypeError:
+                continue
+            self.values.insert(position, value)
+            self.ids.insert(position, id)
+            indexed = True
+        if not indexed:
+            self.unindexed.add(id)
+
+    def scan(self, ascending: bool = True) -> list[str]:
+        if ascending:
+            return [*self.unindexed, *self.ids]
+        return [*reversed(self.ids), *self.unindexed]
+
+    def remove(self, id: str, document: dict):
+        self.unindexed.discard(id)
+        for value in _index_values(get_path(document, self.field)):
+            try:
+                start = bisect_left(self.values, value)
+                end = bisect_right(self.values, value)
+            except TypeError:
+                continue
+            for position in range(start, end):
+                if self.ids[position] == id:
+                    del self.values[position]
+                    del self.ids[position]
+                    break
+
+    def lookup(self, condition) -> list[str] | None:
+        if not _is_operator_condition(condition):
+            condition = {"$eq": condition}
+        if condition.get("$eq", 0) is None:
+            return None
+        if not set(condition) <= {"$eq", "$gt", "$gte", "$lt", "$lte", "$in"}:
+            return None
+
+        try:
+            if "$in" in condition:
+                ids = []
+                for target in sorted(condition["$in"]):
+                    ids.extend(self.lookup({"$eq": target}) or [])
+                return ids
+
+            start, end = 0, len(self.values)
+            if "$eq" in condition:
+                start = bisect_left(self.values, condition["$eq"])
+                end = bisect_right(self.values, condition["$eq"])
+            if "$gte" in condition:
+                start = max(start, bisect_left(self.values, condition["$gte"]))
+            if "$gt" in condition:
+                start = max(start, bisect_right(self.values, condition["$gt"]))
+            if "$lt" in condition:
+                end = min(end, bisect_left(self.values, condition["$lt"]))
+            if "$lte" in condition:
+                end = min(end, bisect_right(self.values, condition["$lte"]))
+        except TypeError:
+            return None
+
+        return self.ids[start:end]
+
+
+INDEX_TYPES = {
+    "hash": HashIndex,
+    "sorted": SortedIndex,
+}
+
+
+class MemoryCollection:
+    def __init__(self, indexes: Iterable[tuple[str, str]] = ()):
+        self.documents: dict[str, dict] = {}
+        self.indexes: dict[str, HashIndex | SortedIndex] = {}
+        for field, kind in indexes:
+            self.create_index(field, kind)
+
+    def create_index(self, field: str, kind: str = "sorted"):
+        index = INDEX_TYPES[kind](field)
+        for id, document in self.documents.items():
+            index.add(id, document)
+        self.indexes[field] = index
+
+    def get(self, id: str):
+        return self.documents.get(id)
+
+    def insert(self, id: str, document: dict):
+        self.remove(id)
+        document = {"_id": id, **deepcopy(document)}
+        self.documents[id] = document
+        for index in self.indexes.values():
+            index.add(id, document)
+
+    def remove(self, id: str):
+        document = self.documents.pop(id, None)
+        if document is not None:
+            for index in self.indexes.values():
+                index.remove(id, document)
+        return document
+
+    def modify(self, id: str, fields: dict, increment: bool = False, defaults=None):
+        document = self.documents.get(id)
+        if document is None:
+            document = {"_id": id, **deepcopy(defaults or {})}
+        else:
+            for index in self.indexes.values():
+                index.remove(id, document)
+
+        for path, value in fields.items():
+            if path == "_id":
+                continue
+            if increment:
+                current = get_path(document, path)
+                value = value + (0 if current is _MISSING else current)
+            set_path(document, path, deepcopy(value))
+
+        self.documents[id] = document
+        for index in self.indexes.values():
+            index.add(id, document)
+
+    def _plan(self, query: dict) -> tuple[list[str] | None, str | None]:
+        """Pick the most selective usable index.
+
+        Returns the candidate ids and, when they come from a sorted index and so
+        are in that field's order, the field they are ordered by.
+        """
+        best, ordered_by = None, None
+        for field, condition in query.items():
+            if field.startswith("$"):
+                continue
+            if field == "_id":
+                ids = self._lookup_ids(condition)
+            elif field in self.indexes:
+                ids = self.indexes[field].lookup(condition)
+            else:
+                continue
+            if ids is not None and (best is None or len(ids) < len(best)):
+                best = ids
+                # Hash lookups and "_id" lookups follow the order of the query
+                sorted_index = isinstance(self.indexes.get(field), SortedIndex)
+                ordered_by = field if sorted_index and field != "_id" else None
+        return best, ordered_by
+
+    def _lookup_ids(self, condition) -> list[str] | None:
+        if _is_operator_condition(condition):
+            if set(condition) == {"$in"}:
+                return [id for id in condition["$in"] if id in self.documents]
+            if set(condition) == {"$eq"}:
+                condition = condition["$eq"]
+            else:
+                return None
+        try:
+            return [condition] if condition in self.documents else []
+        except TypeError:
+            return None
+
+    def find(
+        self,
+        query: dict,
+        sort_by: str = None,
+        limit: int = None,
+        ascending: bool = True,
+    ) -> list[dict]:
+        candidates, ordered_by = self._plan(query)
+        presorted = sort_by is not None and ordered_by == sort_by
+        if presorted and not ascending:
+            candidates = reversed(candidates)
+        elif candidates is None:
+            index = self.indexes.get(sort_by)
+            if isinstance(index, SortedIndex):
+                # Walk the sort index so that limit can stop early
+                candidates, presorted = index.scan(ascending), True
+            else:
+                candidates = list(self.documents)
+
+        result, seen = [], set()
+        for id in candidates:
+            if id in seen:
+                continue
+            seen.add(id)
+            document = self.documents[id]
+            if match(document, query):
+                result.append(document)
+                if presorted and limit and len(result) >= limit:
+                    break
+
+        if sort_by and not presorted:
+            present = [d for d in result if get_path(d, sort_by) is not _MISSING]
+            missing = [d for d in result if get_path(d, sort_by) is _MISSING]
+            present.sort(key=lambda d: get_path(d, sort_by), reverse=not ascending)
+            result = missing + present if ascending else present + missing
+
+        if limit:
+            result = result[:limit]
+        return result
@@ -1,7 +1,11 @@
-from dataclasses import dataclass
+import math
+from dataclasses import dataclass, field
 from datetime import datetime
+from itertools import combinations
 from uuid import uuid4
 
+from src.dataclasses.sketches import TDigest
+
 
 @dataclass
 class KeywordsAggregation:
@@ -141,3 +145,306 @@ class SentimentAggregation:
             sorted(self.sentiment.items(), key=lambda x: x[1], reverse=reverse)
         )
         return self
+
+
+@dataclass
+class SentimentScoreAggregation:
+    _id: str
+    date_time: datetime
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    min: float = None
+    max: float = None
+    digest: TDigest = field(default_factory=TDigest)
+    metadata: dict = None
+
+    def __post_init__(self):
+        if self.metadata is None:
+            self.metadata = {}
+
+    def to_dict(self):
+        return {
+            "_id": self._id,
+            "date_time": self.date_time,
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "min": self.min,
+            "max": self.max,
+            "digest": self.digest.to_dict(),
+            "metadata": self.metadata,
+        }
+
+    @classmethod
+    def empty(cls, date_time: datetime = None, metadata: dict = None):
+        return cls(
+            _id=uuid4().hex,
+            date_time=date_time or datetime.now(),
+            metadata=metadata or {},
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            _id=data["_id"],
+            date_time=data["date_time"],
+            count=data["count"],
+            mean=data["mean"],
+            m2=data["m2"],
+            min=data["min"],
+            max=data["max"],
+            digest=TDigest.from_dict(data["digest"]),
+            metadata=data["metadata"],
+        )
+
+    def add_score(self, score: float):
+        # Welford's online update
+        self.count += 1
+        delta = score - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (score - self.mean)
+        self.min = score if self.min is None else min(self.min, score)
+        self.max = score if self.max is None else max(self.max, score)
+        self.digest.add(score)
+        return self.count
+
+    def merge(self, other: "SentimentScoreAggregation"):
+        # Chan et al. parallel combination of the Welford moments
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.digest.merge(other.digest)
+        return self
+
+    @property
+    def variance(self) -> float:
+        if self.count < 2:
+            return 0.0
+        return self.m2 / (self.count - 1)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    def quantile(self, q: float) -> float | None:
+        return self.digest.quantile(q)
+
+
+@dataclass
+class KeywordTrend:
+    keyword: str
+    count: int
+    baseline: float
+    zscore: float
+
+    def to_dict(self):
+        return {
+            "keyword": self.keyword,
+            "count": self.count,
+            "baseline": self.baseline,
+            "zscore": self.zscore,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            keyword=data["keyword"],
+            count=data["count"],
+            baseline=data["baseline"],
+            zscore=data["zscore"],
+        )
+
+
+@dataclass
+class KeywordTrends:
+    _id: str
+    date_time: datetime
+    cycle: int
+    trending: list[KeywordTrend]
+    metadata: dict = None
+
+    def __post_init__(self):
+        if self.metadata is None:
+            self.metadata = {}
+
+    def to_dict(self):
+        return {
+            "_id": self._id,
+            "date_time": self.date_time,
+            "cycle": self.cycle,
+            "trending": [trend.to_dict() for trend in self.trending],
+            "metadata": self.metadata,
+        }
+
+    @classmethod
+    def empty(cls, id: str, date_time: datetime = None, metadata: dict = None):
+        return cls(
+            _id=id,
+            date_time=date_time or datetime.now(),
+            cycle=0,
+            trending=[],
+            metadata=metadata or {},
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            _id=data["_id"],
+            date_time=data["date_time"],
+            cycle=data["cycle"],
+            trending=[KeywordTrend.from_dict(trend) for trend in data["trending"]],
+            metadata=data["metadata"],
+        )
+
+    def limit(self, top_k: int):
+        self.trending = self.trending[:top_k]
+        return self
+
+
+ARTICLES_NODE = "__articles__"
+
+
+def escape_key(key: str) -> str:
+    # Mongo field names cannot contain "." nor start with "$"
+    key = key.replace(".", "\uff0e")
+    if key.startswith("$"):
+        key = "\uff04" + key[1:]
+    return key
+
+
+def unescape_key(key: str) -> str:
+    key = key.replace("\uff0e", ".")
+    if key.startswith("\uff04"):
+        key = "$" + key[1:]
+    return key
+
+
+@dataclass
+class EntityGraph:
+    """Sparse, symmetric entity co-occurrence counts."""
+
+    counts: dict[str, int] = field(default_factory=dict)
+    neighbors: dict[str, dict[str, int]] = field(default_factory=dict)
+    articles: int = 0
+
+    def add_entities(self, entities: list[str]):
+        entities = sorted(set(entities))
+        self.articles += 1
+        for entity in entities:
+            self.counts[entity] = self.counts.get(entity, 0) + 1
+        for a, b in combinations(entities, 2):
+            self._add_pair(a, b, 1)
+            self._add_pair(b, a, 1)
+        return self
+
+    def _add_pair(self, a: str, b: str, count: int):
+        adjacency = self.neighbors.setdefault(a, {})
+        adjacency[b] = adjacency.get(b, 0) + count
+
+    def add_document(self, data: dict):
+        entity = data["entity"]
+        if entity == ARTICLES_NODE:
+            self.articles += data["count"]
+            return self
+        self.counts[entity] = self.counts.get(entity, 0) + data["count"]
+        for neighbor, count in data.get("neighbors", {}).items():
+            self._add_pair(entity, unescape_key(neighbor), count)
+        return self
+
+    def to_increments(self, prefix: str) -> dict[str, dict]:
+        increments = {f"{prefix}::{ARTICLES_NODE}": {"count": self.articles}}
+        for entity, count in self.counts.items():
+            fields = {"count": count}
+            for neighbor, pair_count in self.neighbors.get(entity, {}).items():
+                fields[f"neighbors.{escape_key(neighbor)}"] = pair_count
+            increments[f"{prefix}::{escape_key(entity)}"] = fields
+        return increments
+
+    def top_neighbors(self, entity: str, top_k: int = 10) -> list[tuple[str, int]]:
+        return sorted(
+            self.neighbors.get(entity, {}).items(), key=lambda x: x[1], reverse=True
+        )[:top_k]
+
+    def pmi(self, a: str, b: str) -> float | None:
+        pair = self.neighbors.get(a, {}).get(b, 0)
+        if not pair or not self.articles:
+            return None
+        return math.log(pair * self.articles / (self.counts[a] * self.counts[b]))
+
+    def top_pmi(
+        self, entity: str, top_k: int = 10, min_count: int = 2
+    ) -> list[tuple[str, float]]:
+        scores = [
+            (neighbor, self.pmi(entity, neighbor))
+            for neighbor, count in self.neighbors.get(entity, {}).items()
+            if count >= min_count and neighbor in self.counts
+        ]
+        return sorted(scores, key=lambda x: x[1], reverse=True)[:top_k]
+
+
+@dataclass
+class WindowAggregation:
+    _id: str
+    window: str
+    country: str
+    updated_at: datetime
+    keywords: dict[str, int]
+    sentiment: dict[str, int]
+    buckets: list[dict]
+
+    def to_dict(self):
+        return {
+            "_id": self._id,
+            "window": self.window,
+            "country": self.country,
+            "updated_at": self.updated_at,
+            "keywords": self.keywords,
+            "sentiment": self.sentiment,
+            "buckets": self.buckets,
+        }
+
+    @classmethod
+    def empty(cls, window: str, country: str):
+        return cls(
+            _id=f"{window}::{country}",
+            window=window,
+            country=country,
+            updated_at=None,
+            keywords={},
+            sentiment={},
+            buckets=[],
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            _id=data["_id"],
+            window=data["window"],
+            country=data["country"],
+            updated_at=data["updated_at"],
+            keywords=data["keywords"],
+            sentiment=data["sentiment"],
+            buckets=data["buckets"],
+        )
+
+    @staticmethod
+    def _apply(target: dict[str, int], counts: dict[str, int], sign: int):
+        for key, count in counts.items():
+            target[key] = target.get(key, 0) + sign * count
+            if target[key] <= 0:
+                del target[key]
+
+    def add_keywords(self, keywords: dict[str, int], sign: int = 1):
+        self._apply(self.keywords, keywords, sign)
+        return self
+
+    def add_sentiment(self, sentiment: dict[str, int], sign: int = 1):
+        self._apply(self.sentiment, sentiment, sign)
+        return self
@@ -0,0 +1,63 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+from uuid import uuid4
+
+
+@dataclass
+class BackfillCursor:
+    _id: str
+    enrichers: list[str]
+    model_name: str
+    offset: Any = None
+    processed: int = 0
+    updated: int = 0
+    failed: int = 0
+    done: bool = False
+    started_at: datetime = None
+    updated_at: datetime = None
+    # Marks the points rewritten by this pass, so that they are not processed again
+    run_id: str = None
+
+    def to_dict(self):
+        return {
+            "_id": self._id,
+            "enrichers": self.enrichers,
+            "model_name": self.model_name,
+            "offset": self.offset,
+            "processed": self.processed,
+            "updated": self.updated,
+            "failed": self.failed,
+            "done": self.done,
+            "started_at": self.started_at,
+            "updated_at": self.updated_at,
+            "run_id": self.run_id,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            _id=data["_id"],
+            enrichers=data["enrichers"],
+            model_name=data["model_name"],
+            offset=data["offset"],
+            processed=data["processed"],
+            updated=data["updated"],
+            failed=data["failed"],
+            done=data["done"],
+            started_at=data["started_at"],
+            updated_at=data["updated_at"],
+            run_id=data.get("run_id") or uuid4().hex,
+        )
+
+    @classmethod
+    def empty(cls, id: str, enrichers: list[str], model_name: str):
+        now = datetime.now()
+        return cls(
+            _id=id,
+            enrichers=enrichers,
+            model_name=model_name,
+            started_at=now,
+            updated_at=now,
+            run_id=uuid4().hex,
+        )
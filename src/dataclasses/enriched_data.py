@@ -3,53 +3,49 @@ from dataclasses import dataclass
 from src.dataclasses.news import News
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class EnrichedData(News):
     entities: str
     sentiment: str
     sentiment_score: float
     categories: str
     keywords: str
+    # Id of the first article of the story, set when the article is stored
+    story_id: str | None = None
 
     def to_dict(self):
+        # Zero-argument super() does not work in slotted dataclasses
         return {
-            "title": self.title,
-            "link": self.link,
-            "id": self.id,
-            "guidislink": self.guidislink,
-            "published": self.published,
-            "published_parsed": self.published_parsed,
-            "summary": self.summary,
-            "source": self.source,
-            "sub_articles": self.sub_articles,
-            "title_detail": self.title_detail,
-            "links": self.links,
+            **News.to_dict(self),
             "sentiment": self.sentiment,
             "sentiment_score": self.sentiment_score,
             "entities": self.entities,
             "categories": self.categories,
             "keywords": self.keywords,
+            "story_id": self.story_id,
         }
 
     @classmethod
     def from_dict(cls, data):
+        news = News.from_dict(data)
         return cls(
-            title=data["title"],
-            link=data["link"],
-            id=data["id"],
-            guidislink=data["guidislink"],
-            published=data["published"],
-            published_parsed=data["published_parsed"],
-            summary=data["summary"],
-            source=data["source"],
-            sub_articles=data["sub_articles"],
-            title_detail=data["title_detail"],
-            links=data["links"],
+            title=news.title,
+            link=news.link,
+            id=news.id,
+            guidislink=news.guidislink,
+            published=news.published,
+            published_parsed=news.published_parsed,
+            summary=news.summary,
+            source=news.source,
+            sub_articles=news.sub_articles,
+            title_detail=news.title_detail,
+            links=news.links,
             sentiment=data["sentiment"],
             sentiment_score=data["sentiment_score"],
             entities=data["entities"],
             categories=data["categories"],
             keywords=data["keywords"],
+            story_id=data.get("story_id"),
         )
 
     @classmethod
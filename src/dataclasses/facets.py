@@ -0,0 +1,17 @@
+from dataclasses import dataclass, field
+
+from src.dataclasses.enriched_data import EnrichedData
+
+
+@dataclass
+class FacetedResults:
+    hits: list[EnrichedData]
+    total: int
+    facets: dict[str, dict[str, int]] = field(default_factory=dict)
+
+    def to_dict(self):
+        return {
+            "hits": [hit.to_dict() for hit in self.hits],
+            "total": self.total,
+            "facets": self.facets,
+        }
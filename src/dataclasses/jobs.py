@@ -0,0 +1,63 @@
+import enum
+from dataclasses import dataclass
+from datetime import datetime
+
+
+class JobStatus(enum.Enum):
+    PENDING = "PENDING"
+    LEASED = "LEASED"
+    DONE = "DONE"
+    DEAD = "DEAD"
+
+
+@dataclass
+class Job:
+    _id: str
+    kind: str
+    key: str
+    payload: dict
+    status: JobStatus = JobStatus.PENDING
+    priority: int = 0
+    attempts: int = 0
+    worker_id: str = None
+    lease_until: datetime = None
+    available_at: datetime = None
+    created_at: datetime = None
+    message: str = None
+    # Set once the job is done, for the TTL index of MongoJobQueue
+    expires_at: datetime = None
+
+    def to_dict(self):
+        return {
+            "_id": self._id,
+            "kind": self.kind,
+            "key": self.key,
+            "payload": self.payload,
+            "status": self.status.value,
+            "priority": self.priority,
+            "attempts": self.attempts,
+            "worker_id": self.worker_id,
+            "lease_until": self.lease_until,
+            "available_at": self.available_at,
+            "created_at": self.created_at,
+            "message": self.message,
+            "expires_at": self.expires_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            _id=data["_id"],
+            kind=data["kind"],
+            key=data["key"],
+            payload=data["payload"],
+            status=JobStatus(data["status"]),
+            priority=data["priority"],
+            attempts=data["attempts"],
+            worker_id=data["worker_id"],
+            lease_until=data["lease_until"],
+            available_at=data["available_at"],
+            created_at=data["created_at"],
+            message=data["message"],
+            expires_at=data.get("expires_at"),
+        )
@@ -1,32 +1,32 @@
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class Source:
     href: str
     title: str
 
 
-@dataclass
+@dataclass(slots=True)
 class SubArticle:
     url: str
     title: str
     publisher: str
 
 
-@dataclass
+@dataclass(slots=True)
 class TitleDetail:
     type: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Link:
     rel: str
     type: str
     href: str
 
 
-@dataclass
+@dataclass(slots=True)
 class News:
     title: str
     link: str
@@ -0,0 +1,146 @@
+import calendar
+import time
+
+from src.dataclasses.enriched_data import EnrichedData
+from src.dataclasses.news import Link, Source, SubArticle, TitleDetail
+
+PAYLOAD_VERSION = 2
+
+# Keys of the compact payload; the summary is the "document" stored by Qdrant
+PAYLOAD_KEYS = {
+    "v",
+    "document",
+    "id",
+    "title",
+    "link",
+    "published",
+    "published_ts",
+    "source_title",
+    "source_href",
+    "sentiment",
+    "sentiment_score",
+    "entities",
+    "categories",
+    "keywords",
+    "story_id",
+}
+# Keys of the full, unversioned payload written before the compact layout
+LEGACY_PAYLOAD_KEYS = {
+    "document",
+    "title",
+    "link",
+    "id",
+    "guidislink",
+    "published",
+    "published_parsed",
+    "summary",
+    "source",
+    "sub_articles",
+    "title_detail",
+    "links",
+    "sentiment",
+    "sentiment_score",
+    "entities",
+    "categories",
+    "keywords",
+    "story_id",
+}
+
+
+def published_timestamp(published_parsed) -> float | None:
+    if not published_parsed:
+        return None
+    try:
+        return float(calendar.timegm(tuple(published_parsed)[:6]))
+    except (TypeError, ValueError):
+        return None
+
+
+def published_parsed(published_ts: float | None) -> list | None:
+    if published_ts is None:
+        return None
+    return list(time.gmtime(published_ts))
+
+
+def payload_metadata(payload: dict) -> dict:
+    """The keys of a stored payload that were added as metadata (e.g. country)."""
+    keys = PAYLOAD_KEYS if payload.get("v") == PAYLOAD_VERSION else LEGACY_PAYLOAD_KEYS
+    return {key: value for key, value in payload.items() if key not in keys}
+
+
+def encode_payload(data: EnrichedData) -> tuple[dict, dict]:
+    """Split an article into its compact Qdrant payload and its cold fields."""
+    payload = {
+        "v": PAYLOAD_VERSION,
+        "id": data.id,
+        "title": data.title,
+        "link": data.link,
+        "published": data.published,
+        "published_ts": published_timestamp(data.published_parsed),
+        "source_title": data.source.title,
+        "source_href": data.source.href,
+        "sentiment": data.sentiment,
+        "sentiment_score": data.sentiment_score,
+        "entities": data.entities,
+        "categories": data.categories,
+        "keywords": data.keywords,
+        "story_id": data.story_id,
+    }
+    cold = {
+        "guidislink": data.guidislink,
+        "sub_articles": [
+            {"url": article.url, "title": article.title, "publisher": article.publisher}
+            for article in data.sub_articles
+        ],
+        "title_detail": {"type": data.title_detail.type},
+        "links": [
+            {"rel": link.rel, "type": link.type, "href": link.href}
+            for link in data.links
+        ],
+    }
+    return payload, cold
+
+
+def decode_payload(payload: dict) -> EnrichedData:
+    """Build an article from a stored payload of any version.
+
+    Cold fields of compact payloads are left empty, see ``apply_cold``.
+    """
+    if payload.get("v") != PAYLOAD_VERSION:
+        return EnrichedData.from_dict(payload)
+
+    return EnrichedData(
+        title=payload["title"],
+        link=payload["link"],
+        id=payload["id"],
+        guidislink=False,
+        published=payload["published"],
+        published_parsed=published_parsed(payload["published_ts"]),
+        summary=payload.get("document", ""),
+        source=Source(href=payload["source_href"], title=payload["source_title"]),
+        sub_articles=[],
+        title_detail=TitleDetail(type="text/plain"),
+        links=[],
+        sentiment=payload["sentiment"],
+        sentiment_score=payload["sentiment_score"],
+        entities=payload["entities"],
+        categories=payload["categories"],
+        keywords=payload["keywords"],
+        story_id=payload.get("story_id"),
+    )
+
+
+def apply_cold(data: EnrichedData, cold: dict) -> EnrichedData:
+    data.guidislink = cold["guidislink"]
+    data.sub_articles = [
+        SubArticle(
+            url=article["url"], title=article["title"], publisher=article["publisher"]
+        )
+        for article in cold["sub_articles"]
+    ]
+    data.title_detail = TitleDetail(type=cold["title_detail"]["type"])
+    data.links = [
+        Link(rel=link["rel"], type=link["type"], href=link["href"])
+        for link in cold["links"]
+    ]
+    return data
@@ -8,6 +8,15 @@ class RunStatus(enum.Enum):
     RUNNING = "RUNNING"
     SUCCESS = "SUCCESS"
     FAILURE = "FAILURE"
+    # Failed with enriched or stored articles left to store and aggregate
+    PARTIAL = "PARTIAL"
+
+
+class ArticleStatus(enum.Enum):
+    PENDING = "PENDING"
+    ENRICHED = "ENRICHED"
+    STORED = "STORED"
+    AGGREGATED = "AGGREGATED"
 
 
 @dataclass
@@ -20,10 +29,13 @@ class RunDetail:
     status: RunStatus = RunStatus.PENDING
     message: str = None
     metadata: dict = None
+    checkpoints: dict = None
 
     def __post_init__(self):
         if self.metadata is None:
             self.metadata = {}
+        if self.checkpoints is None:
+            self.checkpoints = {}
 
     def to_dict(self):
         return {
@@ -35,6 +47,7 @@ class RunDetail:
             "status": self.status.value,
             "message": self.message,
             "metadata": self.metadata,
+            "checkpoints": self.checkpoints,
         }
 
     @classmethod
@@ -48,4 +61,5 @@ class RunDetail:
             status=RunStatus(data["status"]),
             message=data["message"],
             metadata=data["metadata"],
+            checkpoints=data.get("checkpoints", {}),
         )
@@ -0,0 +1,113 @@
+import math
+from dataclasses import dataclass, field
+
+
+@dataclass
+class TDigest:
+    """Mergeable quantile sketch (merging t-digest with the k1 scale function)."""
+
+    compression: float = 100.0
+    centroids: list[list[float]] = field(default_factory=list)
+    min: float = None
+    max: float = None
+    _buffer: list[list[float]] = field(default_factory=list, repr=False)
+
+    def to_dict(self):
+        self._compress()
+        return {
+            "compression": self.compression,
+            "centroids": self.centroids,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            compression=data["compression"],
+            centroids=[list(c) for c in data["centroids"]],
+            min=data["min"],
+            max=data["max"],
+        )
+
+    @property
+    def count(self) -> float:
+        return sum(w for _, w in self.centroids) + sum(w for _, w in self._buffer)
+
+    def add(self, value: float, weight: float = 1.0):
+        self._buffer.append([value, weight])
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self._buffer) > 5 * self.compression:
+            self._compress()
+        return self
+
+    def merge(self, other: "TDigest"):
+        other._compress()
+        if not other.centroids:
+            return self
+        self._buffer.extend([list(c) for c in other.centroids])
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress()
+        return self
+
+    def quantile(self, q: float) -> float | None:
+        self._compress()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+
+        total = sum(w for _, w in self.centroids)
+        target = q * total
+        cumulative = 0.0
+        previous_mean, previous_center = self.min, 0.0
+        for mean, weight in self.centroids:
+            center = cumulative + weight / 2
+            if target < center:
+                if center == previous_center:
+                    return mean
+                ratio = (target - previous_center) / (center - previous_center)
+                return previous_mean + ratio * (mean - previous_mean)
+            cumulative += weight
+            previous_mean, previous_center = mean, center
+
+        if total == previous_center:
+            return self.max
+        ratio = (target - previous_center) / (total - previous_center)
+        return previous_mean + ratio * (self.max - previous_mean)
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _k_inverse(self, k: float) -> float:
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _q_limit(self, q: float) -> float:
+        k = self._k(q) + 1
+        if k >= self.compression / 4:
+            return 1.0
+        return self._k_inverse(k)
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = sorted(self.centroids + self._buffer, key=lambda c: c[0])
+        self._buffer = []
+
+        total = sum(w for _, w in points)
+        merged = [list(points[0])]
+        q0 = 0.0
+        q_limit = self._q_limit(q0)
+        for mean, weight in points[1:]:
+            current = merged[-1]
+            if q0 + (current[1] + weight) / total <= q_limit:
+                current[0] += (mean - current[0]) * weight / (current[1] + weight)
+                current[1] += weight
+            else:
+                q0 += current[1] / total
+                q_limit = self._q_limit(q0)
+                merged.append([mean, weight])
+
+        self.centroids = merged
@@ -0,0 +1,111 @@
+import io
+import json
+import logging
+from time import sleep
+from typing import TYPE_CHECKING, List
+
+from src.dataclasses.enriched_data import EnrichedData
+from src.enrichers.enricher import OpenAIEnricher
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchEnricher:
+    """Runs one enricher over many articles through the OpenAI Batch API.
+
+    Batch requests are billed at a discount and do not count against the
+    realtime rate limits, at the price of latency. Like ``Enricher.patch`` it
+    returns the fields set for each article, or ``None`` where the request
+    failed or could not be parsed. Articles are split into batches of at most
+    ``max_requests``, which are all submitted before waiting for any of them.
+    """
+
+    def __init__(
+        self,
+        openai_client: "OpenAI",
+        model_name: str,
+        poll_interval: float = 30.0,
+        completion_window: str = "24h",
+        max_requests: int = 10_000,
+    ):
+        self.openai_client = openai_client
+        self.model_name = model_name
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.max_requests = max_requests
+
+    def _submit(self, enricher: OpenAIEnricher, data: List[EnrichedData]) -> str:
+        lines = [
+            json.dumps(
+                {
+                    "custom_id": str(i),
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": enricher.request(item, self.model_name),
+                }
+            )
+            for i, item in enumerate(data)
+        ]
+        input_file = self.openai_client.files.create(
+            file=("batch.jsonl", io.BytesIO("\n".join(lines).encode())),
+            purpose="batch",
+        )
+        batch = self.openai_client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window,
+        )
+        return batch.id
+
+    def _wait(self, batch_id: str):
+        while True:
+            batch = self.openai_client.batches.retrieve(batch_id)
+            if batch.status in FINAL_STATUSES:
+                return batch
+            logger.info(
+                f"Batch {batch_id} is {batch.status} "
+                f"({batch.request_counts.completed}/{batch.request_counts.total})"
+            )
+            sleep(self.poll_interval)
+
+    def enrich(
+        self, enricher: OpenAIEnricher, data: List[EnrichedData]
+    ) -> List[dict | None]:
+        if not data:
+            return []
+        chunks = [
+            data[start : start + self.max_requests]
+            for start in range(0, len(data), self.max_requests)
+        ]
+        batch_ids = [self._submit(enricher, chunk) for chunk in chunks]
+        results = []
+        for chunk, batch_id in zip(chunks, batch_ids):
+            results.extend(self._results(enricher, chunk, self._wait(batch_id)))
+        return results
+
+    def _results(
+        self, enricher: OpenAIEnricher, data: List[EnrichedData], batch
+    ) -> List[dict | None]:
+        results = [None] * len(data)
+        if batch.status != "completed" or not batch.output_file_id:
+            logger.error(f"Batch {batch.id} ended with status {batch.status}")
+            return results
+
+        output = self.openai_client.files.content(batch.output_file_id).text
+        for line in output.splitlines():
+            if not line:
+                continue
+            response = json.loads(line)
+            i = int(response["custom_id"])
+            try:
+                body = response["response"]["body"]
+                content = body["choices"][0]["message"]["content"]
+                results[i] = enricher.decode(data[i], content or "")
+            except (TypeError, KeyError, ValueError) as e:
+                logger.warning(f"Invalid batch response for {data[i]}: {e}")
+        return results
@@ -1,234 +1,415 @@
 import json
 import logging
+import re
 from abc import ABC, abstractmethod
-from copy import deepcopy
-
-from openai import OpenAI
+from dataclasses import replace
+from typing import TYPE_CHECKING
 
 from src.dataclasses.enriched_data import EnrichedData
 from src.dataclasses.news import News
+from src.enrichers.json_repair import repair_json
+from src.enrichers.schema import InvalidOutput, strict, string_list, validate
+from src.telemetry.telemetry import (
+    LLM_TOKENS,
+    MODEL_ROUTES,
+    OUTPUT_REPAIRS,
+    RETRIES,
+    span,
+)
+
+if TYPE_CHECKING:
+    from openai import OpenAI
 
 logger = logging.getLogger(__name__)
 
+# Models that accept a JSON schema as response format, by exact name. Dated
+# snapshots (e.g. gpt-4o-2024-08-06) match their model, while o1-mini and
+# o1-preview, which reject it, do not match o1.
+STRUCTURED_OUTPUT_MODELS = (
+    "gpt-4o",
+    "gpt-4o-mini",
+    "gpt-4.1",
+    "gpt-4.1-mini",
+    "gpt-4.1-nano",
+    "gpt-5",
+    "gpt-5-mini",
+    "gpt-5-nano",
+    "o1",
+    "o3",
+    "o3-mini",
+    "o4-mini",
+)
+# Snapshots that predate structured outputs
+UNSUPPORTED_SNAPSHOTS = ("gpt-4o-2024-05-13",)
+SNAPSHOT_SUFFIX = re.compile(r"-\d{4}-\d{2}-\d{2}$")
+
+
+def supports_structured_outputs(model_name: str) -> bool:
+    if model_name in UNSUPPORTED_SNAPSHOTS:
+        return False
+    return SNAPSHOT_SUFFIX.sub("", model_name) in STRUCTURED_OUTPUT_MODELS
+
+
+class PatchedView:
+    """Read-only view of an article with the fields of a patch on top.
+
+    Lets each enricher see the fields set by the previous ones (e.g. the cleaned
+    summary) without copying or mutating the article.
+    """
+
+    __slots__ = ("_base", "_patch")
+
+    def __init__(self, base: News | EnrichedData, patch: dict):
+        object.__setattr__(self, "_base", base)
+        object.__setattr__(self, "_patch", patch)
+
+    def __getattr__(self, name: str):
+        if name in self._patch:
+            return self._patch[name]
+        return getattr(self._base, name)
+
+    def __setattr__(self, name: str, value):
+        raise AttributeError(f"{self.__class__.__name__} is read-only")
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(id={self._base.id!r}, patch={self._patch})"
+
 
 class Enricher(ABC):
+    """Computes some fields of an article.
+
+    Enrichers never modify the article they are given: ``patch`` returns the
+    fields they set and ``enrich`` returns a new ``EnrichedData`` with them.
+    """
+
+    # Outputs are repaired locally first, so another call is rarely needed
+    max_attempts = 2
+
     def __init__(self):
         super().__init__()
 
     @abstractmethod
-    def _enrich(self, data: EnrichedData, *args, **kwargs) -> EnrichedData:
+    def _enrich(self, data: News | EnrichedData, *args, **kwargs) -> dict:
         pass
 
-    def _retry_if_json_error(self, data: EnrichedData, *args, **kwargs) -> EnrichedData:
-        for _ in range(5):
+    def _retry_if_invalid(self, data: News | EnrichedData, *args, **kwargs) -> dict:
+        for _ in range(self.max_attempts):
             try:
-                enriched = self._enrich(data, *args, **kwargs)
-                return enriched
-            except json.JSONDecodeError:
+                patch = self._enrich(data, *args, **kwargs)
+                return patch
+            except (json.JSONDecodeError, InvalidOutput) as e:
+                RETRIES.labels(
+                    operation="enrich",
+                    component=self.__class__.__name__,
+                    reason=(
+                        "invalid_json"
+                        if isinstance(e, json.JSONDecodeError)
+                        else "invalid_output"
+                    ),
+                ).inc()
                 logger.warning(
-                    f"Error enriching data: {data} with enricher: {self}. Retrying..."
+                    f"Error enriching data: {data} with enricher: {self}: {e}. "
+                    "Retrying..."
                 )
                 continue
         return None
 
-    def enrich(self, data: News | EnrichedData, *args, **kwargs) -> EnrichedData:
-        if not isinstance(data, EnrichedData):
-            data = EnrichedData.from_news(data)
-
+    def patch(self, data: News | EnrichedData, *args, **kwargs) -> dict | None:
         logger.info(f"Enriching data: {data} with enricher: {self}")
         try:
-            enriched = self._retry_if_json_error(data, *args, **kwargs)
+            patch = self._retry_if_invalid(data, *args, **kwargs)
             logger.info(f"Done with enricher: {self}")
-            return enriched
+            return patch
         except Exception as e:
             logger.error(f"Error enriching data: {data} with enricher: {self}")
             logger.error(e)
             return None
 
+    def enrich(self, data: News | EnrichedData, *args, **kwargs) -> EnrichedData:
+        if not isinstance(data, EnrichedData):
+            data = EnrichedData.from_news(data)
+
+        patch = self.patch(data, *args, **kwargs)
+        if patch is None:
+            return None
+        return replace(data, **patch)
+
 
 class OpenAIEnricher(Enricher):
-    def __init__(self, openai_client: OpenAI):
+    """Enricher backed by a chat completion.
+
+    The output must match ``schema``, which is also sent to the models that
+    support structured outputs. Outputs that are not plain JSON are repaired
+    locally, and the call is repeated only if that fails.
+
+    When a ``cheap_model_name`` is given the article goes to that model once,
+    and to ``model_name`` only if the answer does not validate or the summary is
+    longer than ``cheap_max_words``. Only ``model_name`` calls are retried.
+    """
+
+    schema: dict
+    cheap_max_words = 400
+
+    def __init__(self, openai_client: "OpenAI"):
         super().__init__()
         self.openai_client = openai_client
         if not self.openai_client:
+            from openai import OpenAI
+
             self.openai_client = OpenAI()
 
     @abstractmethod
-    def prompt(self, data: EnrichedData, *args, **kwargs) -> str:
+    def prompt(self) -> str:
+        """Instructions for the model, the same for every article.
+
+        The article is sent after them so that requests share the prompt prefix.
+        Providers only cache prefixes of at least 1024 tokens, so the current
+        prompts (about 100 tokens) are not cached.
+        """
         pass
 
     @abstractmethod
-    def _enrich(
-        self, data: EnrichedData, model_name: str, *args, **kwargs
-    ) -> EnrichedData:
-        return super()._enrich(data, *args, **kwargs)
+    def parse(self, data: EnrichedData, parsed_out: dict) -> dict:
+        """The fields set by the enricher, from the parsed model output."""
+        pass
+
+    def messages(self, data: EnrichedData) -> list[dict]:
+        return [
+            {"role": "system", "content": self.prompt()},
+            {"role": "user", "content": f"Title: {data.title}\n\n{data.summary}"},
+        ]
+
+    def request(self, data: EnrichedData, model_name: str) -> dict:
+        """The body of the chat completion request for an article."""
+        request = {"model": model_name, "messages": self.messages(data)}
+        if supports_structured_outputs(model_name):
+            request["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": self.__class__.__name__,
+                    "schema": strict(self.schema),
+                    "strict": True,
+                },
+            }
+        return request
+
+    def decode(self, data: EnrichedData, content: str) -> dict:
+        """The fields set by the enricher, from the content of a completion."""
+        name = self.__class__.__name__
+        try:
+            parsed_out = json.loads(content)
+        except json.JSONDecodeError:
+            try:
+                parsed_out = repair_json(content)
+            except json.JSONDecodeError:
+                OUTPUT_REPAIRS.labels(component=name, result="failed").inc()
+                raise
+            OUTPUT_REPAIRS.labels(component=name, result="repaired").inc()
+
+        errors = validate(parsed_out, self.schema)
+        if errors:
+            raise InvalidOutput(f"{name} output is invalid: {', '.join(errors)}")
+        return self.parse(data, parsed_out)
+
+    def _complete(self, data: EnrichedData, model_name: str) -> dict:
+        name = self.__class__.__name__
+        with span("llm_call", name, model=model_name):
+            # The raw response tells how many times the client retried
+            response = self.openai_client.chat.completions.with_raw_response.create(
+                **self.request(data, model_name)
+            )
+        if response.retries_taken:
+            RETRIES.labels(operation="llm_call", component=name, reason="http").inc(
+                response.retries_taken
+            )
+        out = response.parse()
+        if out.usage:
+            tokens = LLM_TOKENS.labels(component=name, kind="prompt")
+            tokens.inc(out.usage.prompt_tokens)
+            tokens = LLM_TOKENS.labels(component=name, kind="completion")
+            tokens.inc(out.usage.completion_tokens)
+            if out.usage.prompt_tokens_details:
+                tokens = LLM_TOKENS.labels(component=name, kind="cached")
+                tokens.inc(out.usage.prompt_tokens_details.cached_tokens or 0)
+
+        return self.decode(data, out.choices[0].message.content or "")
+
+    def _enrich(self, data: EnrichedData, model_name: str, *args, **kwargs) -> dict:
+        return self._complete(data, model_name)
+
+    def _retry_if_invalid(
+        self,
+        data: EnrichedData,
+        model_name: str,
+        cheap_model_name: str = None,
+        *args,
+        **kwargs,
+    ) -> dict:
+        name = self.__class__.__name__
+        if cheap_model_name and len(data.summary.split()) <= self.cheap_max_words:
+            # A single attempt: an invalid answer escalates instead of retrying
+            try:
+                patch = self._complete(data, cheap_model_name)
+                MODEL_ROUTES.labels(component=name, route="cheap").inc()
+                return patch
+            except (json.JSONDecodeError, InvalidOutput) as e:
+                logger.info(f"{name} output of {cheap_model_name} is invalid: {e}")
+            MODEL_ROUTES.labels(component=name, route="escalated").inc()
+        else:
+            MODEL_ROUTES.labels(component=name, route="direct").inc()
+        return super()._retry_if_invalid(data, model_name, *args, **kwargs)
+
+    def patch(self, data: News | EnrichedData, model_name: str, *args, **kwargs):
+        return super().patch(data, model_name, *args, **kwargs)
 
     def enrich(self, data: News | EnrichedData, model_name: str, *args, **kwargs):
         return super().enrich(data, model_name, *args, **kwargs)
 
 
 class SummaryCleaner(OpenAIEnricher):
-    def __init__(self, openai_client: OpenAI):
+    schema = {
+        "type": "object",
+        "properties": {"summary": {"type": "string"}},
+        "required": ["summary"],
+        "additionalProperties": False,
+    }
+
+    def __init__(self, openai_client: "OpenAI"):
         super().__init__(openai_client)
 
-    def prompt(self, data: EnrichedData) -> str:
-        return f"""
-        The following is a news article about {data.title}.
+    def prompt(self) -> str:
+        return """
+        You will be given a news article as its title and summary.
 
         Clean the summary of the article from HTML tags, special characters, and other noise.
         Return the cleaned summary using the following JSON format:
-        {{
+        {
             "summary": "cleaned summary"
-        }}
+        }
         No other comments or introduction are needed. Answer with the JSON only.
         """
 
-    def _enrich(self, data: EnrichedData, model_name: str) -> EnrichedData:
-        out = self.openai_client.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": self.prompt(data)},
-                {"role": "user", "content": data.summary},
-            ],
-        )
-
-        parsed_out = json.loads(out.choices[0].message.content)
-        data.summary = parsed_out["summary"]
-        return data
+    def parse(self, data: EnrichedData, parsed_out: dict) -> dict:
+        return {"summary": parsed_out["summary"]}
 
 
 class EntityEnricher(OpenAIEnricher):
-    def __init__(self, openai_client: OpenAI):
+    schema = string_list("entities")
+
+    def __init__(self, openai_client: "OpenAI"):
         super().__init__(openai_client)
 
-    def prompt(self, data: EnrichedData) -> str:
-        return f"""
-        The following is a news article about {data.title}.
+    def prompt(self) -> str:
+        return """
+        You will be given a news article as its title and summary.
 
         Extract the entities like people, organizations, locations, ecc...
         Return the entities using the following JSON format:
-        {{
+        {
             "entities": [
                 "entity1",
                 "entity2",
                 "entity3"
             ]
-        }}
+        }
         No other comments or introduction are needed. Answer with the JSON only.
         """
 
-    def _enrich(self, data: EnrichedData, model_name: str) -> EnrichedData:
-        out = self.openai_client.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": self.prompt(data)},
-                {"role": "user", "content": data.summary},
-            ],
-        )
-
-        parsed_out = json.loads(out.choices[0].message.content)
-        data.entities = sorted(list(set([e for e in parsed_out["entities"]])))
-        return data
+    def parse(self, data: EnrichedData, parsed_out: dict) -> dict:
+        return {"entities": sorted(list(set([e for e in parsed_out["entities"]])))}
 
 
 class SentimentEnricher(OpenAIEnricher):
-    def __init__(self, openai_client: OpenAI):
+    schema = {
+        "type": "object",
+        "properties": {
+            "sentiment": {
+                "type": "string",
+                "enum": ["positive", "neutral", "negative"],
+            },
+            "sentiment_score": {"type": "number", "minimum": 0, "maximum": 5},
+        },
+        "required": ["sentiment", "sentiment_score"],
+        "additionalProperties": False,
+    }
+
+    def __init__(self, openai_client: "OpenAI"):
         super().__init__(openai_client)
 
-    def prompt(self, data: EnrichedData) -> str:
-        return f"""
-        The following is a news article about {data.title}.
+    def prompt(self) -> str:
+        return """
+        You will be given a news article as its title and summary.
 
         Extract the sentiment of the article using a scale from 0 to 5,
         Return the sentiment using the following JSON format:
-        {{
+        {
             "sentiment": "positive" | "neutral" | "negative",
             "sentiment_score": 2.5 (float)
-        }}
+        }
         No other comments or introduction are needed. Answer with the JSON only.
         """
 
-    def _enrich(self, data: EnrichedData, model_name: str) -> EnrichedData:
-        out = self.openai_client.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": self.prompt(data)},
-                {"role": "user", "content": data.summary},
-            ],
-        )
-
-        parsed_out = json.loads(out.choices[0].message.content)
-        data.sentiment = parsed_out["sentiment"]
-        data.sentiment_score = parsed_out["sentiment_score"]
-        return data
+    def parse(self, data: EnrichedData, parsed_out: dict) -> dict:
+        return {
+            "sentiment": parsed_out["sentiment"],
+            "sentiment_score": parsed_out["sentiment_score"],
+        }
 
 
 class CategoryEnricher(OpenAIEnricher):
-    def __init__(self, openai_client: OpenAI):
+    schema = string_list("categories")
+
+    def __init__(self, openai_client: "OpenAI"):
         super().__init__(openai_client)
 
-    def prompt(self, data: EnrichedData) -> str:
-        return f"""
-        The following is a news article about {data.title}.
+    def prompt(self) -> str:
+        return """
+        You will be given a news article as its title and summary.
 
         Extract the categories of the article,
         Return the categories using the following JSON format:
-        {{
+        {
             "categories": [
                 "category1",
                 "category2",
                 "category3"
             ]
-        }}
+        }
         No other comments or introduction are needed. Answer with the JSON only.
         """
 
-    def _enrich(self, data: EnrichedData, model_name: str) -> EnrichedData:
-        out = self.openai_client.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": self.prompt(data)},
-                {"role": "user", "content": data.summary},
-            ],
-        )
-
-        parsed_out = json.loads(out.choices[0].message.content)
-        data.categories = sorted(list(set([e.lower() for e in parsed_out["categories"]])))
-        return data
+    def parse(self, data: EnrichedData, parsed_out: dict) -> dict:
+        return {
+            "categories": sorted(
+                list(set([e.lower() for e in parsed_out["categories"]]))
+            )
+        }
 
 
 class KeywordEnricher(OpenAIEnricher):
-    def __init__(self, openai_client: OpenAI):
+    schema = string_list("keywords")
+
+    def __init__(self, openai_client: "OpenAI"):
         super().__init__(openai_client)
 
-    def prompt(self, data: EnrichedData) -> str:
-        return f"""
-        The following is a news article about {data.title}.
+    def prompt(self) -> str:
+        return """
+        You will be given a news article as its title and summary.
 
         Extract the keywords of the article,
         Return the keywords using the following JSON format:
-        {{
+        {
             "keywords": [
                 "keyword1",
                 "keyword2",
                 "keyword3"
             ]
-        }}
+        }
         No other comments or introduction are needed. Answer with the JSON only.
         """
 
-    def _enrich(self, data: EnrichedData, model_name: str) -> EnrichedData:
-        out = self.openai_client.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": self.prompt(data)},
-                {"role": "user", "content": data.summary},
-            ],
-        )
-
-        parsed_out = json.loads(out.choices[0].message.content)
-        data.keywords = sorted(list(set([e for e in parsed_out["keywords"]])))
-        return data
+    def parse(self, data: EnrichedData, parsed_out: dict) -> dict:
+        return {"keywords": sorted(list(set([e for e in parsed_out["keywords"]])))}
 
 
 class EnricherManager:
@@ -239,10 +420,33 @@ class EnricherManager:
         self.enrichers.append(enricher)
         return self
 
-    def enrich(self, data: News | EnrichedData, *args, **kwargs) -> EnrichedData:
-        enriched_data = deepcopy(data)
+    def patch(self, data: News | EnrichedData, *args, **kwargs) -> dict | None:
+        """The fields set by all the enrichers, each seeing the previous ones."""
+        patch = {}
+        view = PatchedView(data, patch)
         for enricher in self.enrichers:
-            enriched_data = enricher.enrich(enriched_data, *args, **kwargs)
-            if not enriched_data:
+            update = enricher.patch(view, *args, **kwargs)
+            if update is None:
                 return None
-        return enriched_data
+            patch.update(update)
+        return patch
+
+    def enrich(self, data: News | EnrichedData, *args, **kwargs) -> EnrichedData:
+        if not isinstance(data, EnrichedData):
+            data = EnrichedData.from_news(data)
+
+        # The article is never modified, so the result shares its unchanged
+        # fields instead of copying them
+        patch = self.patch(data, *args, **kwargs)
+        if patch is None:
+            return None
+        return replace(data, **patch)
+
+
+ENRICHERS = {
+    "summary": SummaryCleaner,
+    "entities": EntityEnricher,
+    "sentiment": SentimentEnricher,
+    "categories": CategoryEnricher,
+    "keywords": KeywordEnricher,
+}
@@ -0,0 +1,55 @@
+import json
+import re
+from typing import Any
+
+CODE_FENCE = re.compile(r"```[a-zA-Z]*\s*(.*?)\s*```", re.DOTALL)
+TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+
+def strip_code_fences(text: str) -> str:
+    match = CODE_FENCE.search(text)
+    return match.group(1) if match else text
+
+
+def extract_object(text: str) -> str:
+    """The first balanced JSON object in the text, ignoring braces in strings."""
+    start = text.find("{")
+    if start < 0:
+        return text
+    depth, in_string, escaped = 0, False, False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start : i + 1]
+    return text[start:]
+
+
+def remove_trailing_commas(text: str) -> str:
+    # Only safe outside of strings, which is where models put them
+    return TRAILING_COMMA.sub(r"\1", text)
+
+
+def repair_json(text: str) -> Any:
+    """Parse model output that is not plain JSON.
+
+    Handles code fences, text around the object and trailing commas. Raises
+    ``json.JSONDecodeError`` when the output still does not parse.
+    """
+    text = extract_object(strip_code_fences(text))
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return json.loads(remove_trailing_commas(text))
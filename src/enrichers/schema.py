@@ -0,0 +1,65 @@
+from typing import Any
+
+TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "number": (int, float),
+    "integer": int,
+    "boolean": bool,
+}
+# Checked locally but not accepted by strict structured outputs
+LOCAL_KEYWORDS = ("minimum", "maximum")
+
+
+class InvalidOutput(ValueError):
+    """Model output that does not match the enricher's schema."""
+
+
+def validate(value: Any, schema: dict, path: str = "$") -> list[str]:
+    """Errors of a value against the subset of JSON Schema the enrichers use."""
+    expected = TYPES[schema["type"]]
+    if not isinstance(value, expected) or (
+        isinstance(value, bool) and schema["type"] != "boolean"
+    ):
+        return [f"{path} should be of type {schema['type']}"]
+
+    errors = []
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path} should be one of {schema['enum']}")
+    if "minimum" in schema and value < schema["minimum"]:
+        errors.append(f"{path} should be at least {schema['minimum']}")
+    if "maximum" in schema and value > schema["maximum"]:
+        errors.append(f"{path} should be at most {schema['maximum']}")
+    if schema["type"] == "array":
+        for i, item in enumerate(value):
+            errors.extend(validate(item, schema["items"], f"{path}[{i}]"))
+    if schema["type"] == "object":
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}.{key} is missing")
+        for key, item in value.items():
+            if key in schema["properties"]:
+                errors.extend(
+                    validate(item, schema["properties"][key], f"{path}.{key}")
+                )
+    return errors
+
+
+def strict(schema: dict) -> dict:
+    """The schema without the keywords strict structured outputs reject."""
+    schema = {k: v for k, v in schema.items() if k not in LOCAL_KEYWORDS}
+    if "items" in schema:
+        schema["items"] = strict(schema["items"])
+    if "properties" in schema:
+        schema["properties"] = {k: strict(v) for k, v in schema["properties"].items()}
+    return schema
+
+
+def string_list(key: str) -> dict:
+    return {
+        "type": "object",
+        "properties": {key: {"type": "array", "items": {"type": "string"}}},
+        "required": [key],
+        "additionalProperties": False,
+    }
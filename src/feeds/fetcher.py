@@ -0,0 +1,175 @@
+import gzip
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import List
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from src.databases.database import Database
+from src.dataclasses.news import News
+from src.telemetry.telemetry import cache_lookup, span
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_NEWS_URL = "https://news.google.com/rss?ceid={country}:{lang}&hl={lang}&gl={country}"
+
+
+def entry_key(id: str, title: str, link: str) -> str:
+    return hashlib.sha1(f"{id}\x00{title}\x00{link}".encode()).hexdigest()
+
+
+def sub_articles(summary: str) -> list[dict]:
+    """Extract the related articles listed in a Google News entry summary."""
+    from bs4 import BeautifulSoup
+
+    articles = []
+    for li in BeautifulSoup(summary, "html.parser").find_all("li"):
+        try:
+            articles.append(
+                {"url": li.a["href"], "title": li.a.text, "publisher": li.font.text}
+            )
+        except (AttributeError, KeyError, TypeError):
+            continue
+    return articles
+
+
+@dataclass
+class FeedState:
+    _id: str
+    etag: str = None
+    last_modified: str = None
+    seen: list[str] = field(default_factory=list)
+
+    def to_dict(self):
+        return {
+            "_id": self._id,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "seen": self.seen,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            _id=data["_id"],
+            etag=data["etag"],
+            last_modified=data["last_modified"],
+            seen=data["seen"],
+        )
+
+
+class FeedFetcher:
+    """Conditional RSS fetching with entry-level diffing.
+
+    ETag/Last-Modified are sent on every request, so an unchanged feed costs a
+    304. Changed feeds are diffed against the entries already acknowledged and
+    only new ones are returned. Validators are only kept once every new entry
+    has been acknowledged, otherwise a 304 would hide the leftovers.
+    """
+
+    collection = "feed_state"
+
+    def __init__(
+        self,
+        database: Database = None,
+        url_template: str = GOOGLE_NEWS_URL,
+        timeout: float = 30,
+        max_seen: int = 2000,
+    ):
+        self.database = database
+        self.url_template = url_template
+        self.timeout = timeout
+        self.max_seen = max_seen
+        self._states: dict[str, FeedState] = {}
+        self._pending: dict[str, tuple[str, str, set[str]]] = {}
+        self._lock = threading.Lock()
+
+    def url(self, country) -> str:
+        return self.url_template.format(
+            country=country.name(), lang=country.language()
+        )
+
+    def _state(self, url: str) -> FeedState:
+        if url not in self._states:
+            data = None
+            if self.database:
+                data = self.database.get(url, collection=self.collection)
+            self._states[url] = FeedState.from_dict(data) if data else FeedState(url)
+        return self._states[url]
+
+    def _save(self, state: FeedState):
+        if self.database:
+            self.database.update(
+                id=state._id, data=state.to_dict(), collection=self.collection
+            )
+
+    def _request(self, url: str, state: FeedState) -> tuple[bytes | None, dict]:
+        headers = {"User-Agent": "notiziario", "Accept-Encoding": "gzip"}
+        if state.etag:
+            headers["If-None-Match"] = state.etag
+        if state.last_modified:
+            headers["If-Modified-Since"] = state.last_modified
+
+        try:
+            with urlopen(Request(url, headers=headers), timeout=self.timeout) as r:
+                body = r.read()
+                if r.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                return body, r.headers
+        except HTTPError as e:
+            if e.code == 304:
+                return None, e.headers
+            raise
+
+    def fetch(self, country) -> List[News]:
+        import feedparser
+
+        url = self.url(country)
+        with self._lock:
+            state = self._state(url)
+        with span("feed_fetch", country.name(), url=url):
+            body, headers = self._request(url, state)
+        cache_lookup("feed", hit=body is None)
+        if body is None:
+            logger.info(f"Feed not modified: {url}")
+            return []
+
+        seen = set(state.seen)
+        news, keys = [], set()
+        for entry in feedparser.parse(body).entries:
+            key = entry_key(entry.get("id"), entry.get("title"), entry.get("link"))
+            if key in seen or key in keys:
+                continue
+            keys.add(key)
+            entry["sub_articles"] = sub_articles(entry.get("summary", ""))
+            news.append(News.from_dict(entry))
+
+        with self._lock:
+            self._pending[url] = (
+                headers.get("ETag"),
+                headers.get("Last-Modified"),
+                keys,
+            )
+        return news
+
+    def acknowledge(self, country, articles: List[News]):
+        """Mark articles as handled and persist the feed state."""
+        url = self.url(country)
+        with self._lock:
+            if url not in self._pending:
+                # Nothing was fetched (e.g. 304), the state is unchanged
+                return
+            state = self._state(url)
+            etag, last_modified, pending = self._pending.pop(url)
+            acknowledged = [
+                entry_key(article.id, article.title, article.link)
+                for article in articles
+            ]
+            pending.difference_update(acknowledged)
+
+            state.seen = (state.seen + acknowledged)[-self.max_seen :]
+            state.etag = None if pending else etag
+            state.last_modified = None if pending else last_modified
+            self._save(state)
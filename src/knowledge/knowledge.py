@@ -38,3 +38,46 @@ class Knowledge(ABC):
     @abstractmethod
     def count(self, metadata: dict, *args, **kwargs):
         pass
+
+
+class AsyncKnowledge(ABC):
+    def __init__(self, db: Any):
+        super().__init__()
+        self.db = db
+
+    @abstractmethod
+    async def exists(self, id: str, metadata: dict, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    async def retrieve(
+        self, query: Any, metadata: dict, top_k: int = 10, *args, **kwargs
+    ):
+        pass
+
+    @abstractmethod
+    async def store(self, data: List[Any], metadata: List[dict], *args, **kwargs):
+        pass
+
+    @abstractmethod
+    async def update(self, data: Any, metadata: dict, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    async def delete(self, id: str, metadata: dict, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    async def search(self, query: str, metadata: dict, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    async def list(self, metadata: dict, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    async def count(self, metadata: dict, *args, **kwargs):
+        pass
+
+    async def close(self):
+        pass
@@ -1,17 +1,154 @@
+import asyncio
+import logging
+import os
+import threading
 from abc import abstractmethod
-from typing import List
+from time import perf_counter
+from typing import TYPE_CHECKING, List
+from uuid import NAMESPACE_URL, uuid5
 
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from qdrant_client.models import (
     FieldCondition,
     Filter,
     FilterSelector,
+    Fusion,
+    FusionQuery,
     MatchValue,
+    PayloadSchemaType,
+    PointStruct,
+    Prefetch,
     QueryResponse,
+    SparseVector,
 )
 
 from src.dataclasses.enriched_data import EnrichedData
-from src.knowledge.knowledge import Knowledge
+from src.dataclasses.payload import apply_cold, decode_payload, encode_payload
+from src.knowledge.knowledge import AsyncKnowledge, Knowledge
+from src.telemetry.telemetry import span
+
+if TYPE_CHECKING:
+    from src.databases.database import AsyncDatabase, Database
+    from src.knowledge.stories import StoryClusterer
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = "news_collection"
+# Mongo collection with the article fields left out of the compact payload
+COLD_COLLECTION_NAME = "news_cold"
+# Payload fields with a keyword index, used for filtering and facet counts
+INDEXED_FIELDS = (
+    "id",
+    "country",
+    "sentiment",
+    "categories",
+    "keywords",
+    "story_id",
+)
+# Hits fetched per result when returning one result per story
+STORY_OVERFETCH = 3
+# Pinned location of the downloaded fastembed models, instead of a temp dir
+MODEL_CACHE_DIR = os.getenv("NOTIZIARIO_MODEL_CACHE", "model_cache")
+
+
+def build_filter(metadata: dict) -> Filter:
+    """Construct a Qdrant filter object based on metadata."""
+    conditions = [
+        FieldCondition(key=key, match=MatchValue(value=value))
+        for key, value in metadata.items()
+    ]
+
+    return Filter(must=conditions)
+
+
+def point_id(id: str) -> str:
+    """Deterministic Qdrant point id for an article, so re-stores overwrite it."""
+    return str(uuid5(NAMESPACE_URL, id))
+
+
+def id_filter(id: str) -> Filter:
+    return Filter(must=[FieldCondition(key="id", match=MatchValue(value=id))])
+
+
+def build_payloads(
+    data: List[EnrichedData], metadata: List[dict], compact: bool
+) -> tuple[List[dict], dict[str, dict]]:
+    """Qdrant payloads for the articles and, if compact, their cold fields by id."""
+    if not compact:
+        return [{**item.to_dict(), **meta} for item, meta in zip(data, metadata)], {}
+
+    payloads, cold = [], {}
+    for item, meta in zip(data, metadata):
+        payload, cold[item.id] = encode_payload(item)
+        payloads.append({**payload, **meta})
+    return payloads, cold
+
+
+def one_per_story(data: List[EnrichedData]) -> List[EnrichedData]:
+    """The first article of each story, in order; unclustered ones are kept."""
+    seen = set()
+    results = []
+    for item in data:
+        story = item.story_id or item.id
+        if story not in seen:
+            seen.add(story)
+            results.append(item)
+    return results
+
+
+class LazyModels:
+    """Sets the client embedding models on first use instead of at construction.
+
+    Loading the ONNX models takes seconds, and many processes (existence checks,
+    scrolls, counts) never embed anything.
+    """
+
+    def __init__(
+        self,
+        db,
+        embedding_model_name: str,
+        sparse_embedding_model_name: str,
+        cache_dir: str = MODEL_CACHE_DIR,
+        optimize_onnx: bool = False,
+    ):
+        self.db = db
+        self.embedding_model_name = embedding_model_name
+        self.sparse_embedding_model_name = sparse_embedding_model_name
+        self.cache_dir = cache_dir
+        self.optimize_onnx = optimize_onnx
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def ensure(self):
+        if self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                return
+            start = perf_counter()
+            # Optimized models are swapped in before fastembed creates a session
+            kwargs = {"lazy_load": True} if self.optimize_onnx else {}
+            with span("model_load"):
+                self.db.set_model(
+                    self.embedding_model_name, cache_dir=self.cache_dir, **kwargs
+                )
+                self.db.set_sparse_model(
+                    self.sparse_embedding_model_name, cache_dir=self.cache_dir, **kwargs
+                )
+                if self.optimize_onnx:
+                    from src.utils.onnx import use_optimized_models
+
+                    use_optimized_models(
+                        self.cache_dir,
+                        [
+                            self.db.embedding_models.get(self.embedding_model_name),
+                            self.db.sparse_embedding_models.get(
+                                self.sparse_embedding_model_name
+                            ),
+                        ],
+                    )
+            logger.info(f"Loaded embedding models in {perf_counter() - start:.2f}s")
+            self.loaded = True
 
 
 class NewsKnowledge(Knowledge):
@@ -54,6 +191,10 @@ class NewsKnowledge(Knowledge):
     def count(self, metadata: dict, *args, **kwargs) -> int:
         pass
 
+    def assign_stories(self, data: List[EnrichedData]):
+        """Set ``story_id`` on articles before they are stored, if supported."""
+        pass
+
 
 class QdrantNewsKnowledge(NewsKnowledge):
     def __init__(
@@ -62,58 +203,201 @@ class QdrantNewsKnowledge(NewsKnowledge):
         embedding_model_name: str,
         sparse_embedding_model_name: str,
         vector_dim: int = 1024,
+        cache_dir: str = MODEL_CACHE_DIR,
+        optimize_onnx: bool = False,
+        cold_store: "Database" = None,
+        clusterer: "StoryClusterer" = None,
     ):
         super().__init__(db)
-        self.collection_name = "news_collection"
+        self.collection_name = COLLECTION_NAME
         self.embedding_model_name = embedding_model_name
         self.db: QdrantClient = db
         self.vector_dim = vector_dim
-
-        # Set the embedding model
-        self.db.set_model(embedding_model_name)
-        self.db.set_sparse_model(sparse_embedding_model_name)
+        # With a cold store, points get the compact payload and the remaining
+        # fields are kept in Mongo; without one the full article is stored
+        self.cold_store = cold_store
+        # Assigns the stored articles to stories, see StoryClusterer
+        self.clusterer = clusterer
+
+        # The embedding models are set on first use
+        self.models = LazyModels(
+            db,
+            embedding_model_name,
+            sparse_embedding_model_name,
+            cache_dir=cache_dir,
+            optimize_onnx=optimize_onnx,
+        )
+        self._indexed = False
+
+    def _ensure_payload_indexes(self):
+        if self._indexed or not self.db.collection_exists(self.collection_name):
+            return
+        for field in INDEXED_FIELDS:
+            self.db.create_payload_index(
+                collection_name=self.collection_name,
+                field_name=field,
+                field_schema=PayloadSchemaType.KEYWORD,
+            )
+        self._indexed = True
 
     def exists(self, id: str, metadata: dict | None = None, *args, **kwargs) -> bool:
-        if not self.db.collection_exists(self.collection_name):
-            return False
-        if len(self.search("", metadata={"id": id}, top_k=1)):
-            return True
-
-        return False
+        with span("knowledge_exists"):
+            if not self.db.collection_exists(self.collection_name):
+                return False
+            count = self.db.count(
+                collection_name=self.collection_name,
+                count_filter=id_filter(id),
+                exact=True,
+            )
+        return count.count > 0
 
     def retrieve(
-        self, query: str, metadata: dict | None = None, top_k=10, *args, **kwargs
+        self,
+        query: str,
+        metadata: dict | None = None,
+        top_k=10,
+        per_story: bool = False,
+        *args,
+        **kwargs,
     ) -> List[EnrichedData]:
         if metadata is None:
             metadata = {}
         query_filter = self._build_filter(metadata)
-
-        hits = self.db.query(
-            collection_name=self.collection_name,
-            query_text=query,
-            query_filter=query_filter,
-            limit=top_k,
-        )
-
-        return [self._convert_to_enriched_data(hit) for hit in hits]
+        limit = top_k * STORY_OVERFETCH if per_story else top_k
+
+        self.models.ensure()
+        # fastembed embeds inside the client call, so the span covers both
+        with span("qdrant_query", "embed_and_search", top_k=limit):
+            hits = self.db.query(
+                collection_name=self.collection_name,
+                query_text=query,
+                query_filter=query_filter,
+                limit=limit,
+            )
+
+        results = [self._convert_to_enriched_data(hit) for hit in hits]
+        if per_story:
+            results = one_per_story(results)[:top_k]
+        return results
 
     def store(
         self, data: List[EnrichedData], metadata: List[dict], *args, **kwargs
     ) -> bool:
+        """Store the articles, replacing those with the same id.
+
+        With a clusterer, ``story_id`` is set on the given articles: the story
+        they already had, or the one they are assigned to once stored.
+        """
+        if self.clusterer is not None:
+            # Re-stored articles (spool replays, resumed runs, updates) keep their
+            # story, which the delete below would drop from the payload
+            self._keep_stories(data)
         for doc in data:
             self.delete(doc.id)
         documents = [item.summary for item in data]
-        combined_metadata = [
-            {**item.to_dict(), **meta} for item, meta in zip(data, metadata)
-        ]
+        combined_metadata, cold = build_payloads(
+            data, metadata, compact=self.cold_store is not None
+        )
+        if cold:
+            self.cold_store.bulk_update(cold, collection=COLD_COLLECTION_NAME)
+
+        self.models.ensure()
+        with span("qdrant_add", "embed_and_upsert", documents=len(documents)):
+            self.db.add(
+                collection_name=self.collection_name,
+                documents=documents,
+                metadata=combined_metadata,
+                ids=[point_id(item.id) for item in data],
+            )
+        self._ensure_payload_indexes()
+        if self.clusterer is not None:
+            self._assign_stories([item for item in data if item.story_id is None])
 
-        self.db.add(
+        return True
+
+    def _keep_stories(self, data: List[EnrichedData]):
+        """Set the story id already stored for the articles that have none."""
+        missing = [item for item in data if item.story_id is None]
+        if not missing or not self.db.collection_exists(self.collection_name):
+            return
+        points = self.db.retrieve(
             collection_name=self.collection_name,
-            documents=documents,
-            metadata=combined_metadata,
+            ids=[point_id(item.id) for item in missing],
+            with_payload=["id", "story_id"],
+        )
+        stories = {
+            point.payload["id"]: point.payload.get("story_id") for point in points
+        }
+        for item in missing:
+            item.story_id = stories.get(item.id)
+
+    def _assign_stories(self, data: List[EnrichedData]):
+        """Cluster the stored articles by their dense vectors and save the ids.
+
+        Articles that already have a story (e.g. set by another replica since
+        they were read) keep it and are not added to the clusters again.
+        """
+        if not data:
+            return
+        vector_name = self.db.get_vector_field_name()
+        points = self.db.retrieve(
+            collection_name=self.collection_name,
+            ids=[point_id(item.id) for item in data],
+            with_payload=["id", "story_id"],
+            with_vectors=[vector_name],
+        )
+        existing = {
+            point.payload["id"]: point.payload["story_id"]
+            for point in points
+            if point.payload.get("story_id") is not None
+        }
+        stories = self.clusterer.assign(
+            {
+                point.payload["id"]: point.vector[vector_name]
+                for point in points
+                if point.payload["id"] not in existing
+            }
         )
 
-        return True
+        members = {}
+        for item in data:
+            if item.id in existing:
+                item.story_id = existing[item.id]
+                continue
+            item.story_id = stories.get(item.id)
+            if item.story_id is not None:
+                members.setdefault(item.story_id, []).append(point_id(item.id))
+        for story_id, ids in members.items():
+            self.db.set_payload(
+                collection_name=self.collection_name,
+                payload={"story_id": story_id},
+                points=ids,
+            )
+
+    def assign_stories(self, data: List[EnrichedData]):
+        """Set ``story_id`` on articles that are not stored yet.
+
+        Used when the articles are written later, e.g. through the spool, so that
+        the aggregators running meanwhile see their stories. The vectors are
+        computed from the summaries as ``store`` embeds them, and ``store`` keeps
+        the ids set. Articles stored before keep their story.
+        """
+        if self.clusterer is None:
+            return
+        self._keep_stories(data)
+        missing = [item for item in data if item.story_id is None]
+        if not missing:
+            return
+        self.models.ensure()
+        model = self.db.embedding_models[self.models.embedding_model_name]
+        with span("story_assign", "embed", documents=len(missing)):
+            vectors = model.passage_embed([item.summary for item in missing])
+            vectors = {
+                item.id: vector.tolist() for item, vector in zip(missing, vectors)
+            }
+        stories = self.clusterer.assign(vectors)
+        for item in missing:
+            item.story_id = stories.get(item.id)
 
     def update(self, data: EnrichedData, metadata: dict, *args, **kwargs) -> bool:
         # Update by storing the updated document (overwrite if ID exists)
@@ -126,9 +410,7 @@ class QdrantNewsKnowledge(NewsKnowledge):
 
         result = self.db.delete(
             collection_name=self.collection_name,
-            points_selector=FilterSelector(
-                filter=Filter(must=[FieldCondition(key="id", match=MatchValue(value=id))])
-            ),
+            points_selector=FilterSelector(filter=id_filter(id)),
         )
 
         return result is not None
@@ -140,31 +422,373 @@ class QdrantNewsKnowledge(NewsKnowledge):
 
     def list(self, metadata: dict, *args, **kwargs) -> List[EnrichedData]:
         query_filter = self._build_filter(metadata)
-        hits = self.db.scroll(
+        points, _ = self.db.scroll(
             collection_name=self.collection_name,
-            query_filter=query_filter,
+            scroll_filter=query_filter,
             limit=100,  # Fetch in batches
         )
 
-        return [self._convert_to_enriched_data(hit) for hit in hits]
-
-    def count(self, metadata: dict, *args, **kwargs) -> int:
+        return [decode_payload(point.payload) for point in points]
+
+    def hydrate(self, data: List[EnrichedData]) -> List[EnrichedData]:
+        """Load the cold fields of articles read from compact payloads.
+
+        Needed before storing such articles again, or their cold fields would be
+        overwritten with empty values.
+        """
+        if self.cold_store is None or not data:
+            return data
+        cold = {
+            doc["_id"]: doc
+            for doc in self.cold_store.query(
+                {"_id": {"$in": [item.id for item in data]}},
+                collection=COLD_COLLECTION_NAME,
+            )
+        }
+        for item in data:
+            if item.id in cold:
+                apply_cold(item, cold[item.id])
+        return data
+
+    def count(self, metadata: dict, exact: bool = True, *args, **kwargs) -> int:
+        if not self.db.collection_exists(self.collection_name):
+            return 0
         query_filter = self._build_filter(metadata)
         count = self.db.count(
-            collection_name=self.collection_name, query_filter=query_filter
+            collection_name=self.collection_name,
+            count_filter=query_filter,
+            exact=exact,
         )
 
-        return count
+        return count.count
 
-    def _build_filter(self, metadata: dict) -> Filter:
-        """Construct a Qdrant filter object based on metadata."""
-        conditions = [
-            FieldCondition(key=key, match=MatchValue(value=value))
-            for key, value in metadata.items()
-        ]
+    def facet(
+        self, key: str, metadata: dict = None, limit: int = 10
+    ) -> dict[str, int]:
+        """Most frequent values of a payload field among the matching points."""
+        if not self.db.collection_exists(self.collection_name):
+            return {}
+        self._ensure_payload_indexes()
+        result = self.db.facet(
+            collection_name=self.collection_name,
+            key=key,
+            facet_filter=build_filter(metadata or {}),
+            limit=limit,
+        )
+        return {hit.value: hit.count for hit in result.hits}
 
-        return Filter(must=conditions)
+    def iter_pages(
+        self,
+        fields: List[str] = None,
+        metadata: dict = None,
+        batch_size: int = 1000,
+        offset=None,
+    ):
+        """Stream stored payloads as ``(payloads, next_offset)`` pages.
+
+        Passing ``next_offset`` back resumes the scan after that page; it is None
+        on the last page.
+        """
+        if not self.db.collection_exists(self.collection_name):
+            return
+        while True:
+            points, offset = self.db.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=build_filter(metadata or {}),
+                limit=batch_size,
+                offset=offset,
+                with_payload=fields if fields else True,
+                with_vectors=False,
+            )
+            yield [point.payload for point in points], offset
+            if offset is None:
+                break
+
+    def iter_payloads(
+        self, fields: List[str] = None, metadata: dict = None, batch_size: int = 1000
+    ):
+        """Stream stored payloads (optionally only some fields) page by page."""
+        for payloads, _ in self.iter_pages(fields, metadata, batch_size):
+            yield from payloads
+
+    def _build_filter(self, metadata: dict) -> Filter:
+        return build_filter(metadata)
 
     def _convert_to_enriched_data(self, hit: QueryResponse) -> EnrichedData:
         """Convert a Qdrant hit into an EnrichedData object."""
-        return EnrichedData.from_dict(hit.metadata)
+        return decode_payload(hit.metadata)
+
+
+class AsyncNewsKnowledge(AsyncKnowledge):
+    def __init__(self, db):
+        super().__init__(db)
+
+    @abstractmethod
+    async def retrieve(
+        self, query: str, metadata: dict, top_k=10, *args, **kwargs
+    ) -> List[EnrichedData]:
+        pass
+
+    @abstractmethod
+    async def exists(self, id: str, metadata: dict | None = None, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    async def store(
+        self, data: List[EnrichedData], metadata: List[dict], *args, **kwargs
+    ) -> bool:
+        pass
+
+    @abstractmethod
+    async def update(
+        self, data: EnrichedData, metadata: dict, *args, **kwargs
+    ) -> bool:
+        pass
+
+    @abstractmethod
+    async def delete(self, id: str, *args, **kwargs) -> bool:
+        pass
+
+    @abstractmethod
+    async def search(
+        self, query: str, metadata: dict, *args, **kwargs
+    ) -> List[EnrichedData]:
+        pass
+
+    @abstractmethod
+    async def list(self, metadata: dict, *args, **kwargs) -> List[EnrichedData]:
+        pass
+
+    @abstractmethod
+    async def count(self, metadata: dict, *args, **kwargs) -> int:
+        pass
+
+
+class AsyncQdrantNewsKnowledge(AsyncNewsKnowledge):
+    """Async counterpart of QdrantNewsKnowledge.
+
+    The AsyncQdrantClient keeps its own HTTP/gRPC connection pool, so a single
+    client instance should be shared by every knowledge object in the process.
+    fastembed embeds synchronously inside the client calls, so texts are embedded
+    on a worker thread and the vectors sent with ``query_points`` and ``upsert``
+    instead, keeping the event loop free during inference. Stories are assigned
+    by QdrantNewsKnowledge only.
+    """
+
+    def __init__(
+        self,
+        db: AsyncQdrantClient,
+        embedding_model_name: str,
+        sparse_embedding_model_name: str,
+        vector_dim: int = 1024,
+        cache_dir: str = MODEL_CACHE_DIR,
+        optimize_onnx: bool = False,
+        cold_store: "AsyncDatabase" = None,
+    ):
+        super().__init__(db)
+        self.collection_name = COLLECTION_NAME
+        self.embedding_model_name = embedding_model_name
+        self.db: AsyncQdrantClient = db
+        self.vector_dim = vector_dim
+        self.cold_store = cold_store
+
+        # The embedding models are set on first use
+        self.models = LazyModels(
+            db,
+            embedding_model_name,
+            sparse_embedding_model_name,
+            cache_dir=cache_dir,
+            optimize_onnx=optimize_onnx,
+        )
+        self._indexed = False
+
+    def _embed(self, texts: List[str], query: bool = False) -> tuple[list, list]:
+        """Dense and sparse vectors of the texts, run on a worker thread."""
+        self.models.ensure()
+        dense = self.db.embedding_models[self.models.embedding_model_name]
+        sparse = self.db.sparse_embedding_models[
+            self.models.sparse_embedding_model_name
+        ]
+        if query:
+            dense_vectors = dense.query_embed(texts)
+            sparse_vectors = sparse.query_embed(texts)
+        else:
+            dense_vectors = dense.passage_embed(texts)
+            sparse_vectors = sparse.embed(texts)
+        return [vector.tolist() for vector in dense_vectors], [
+            SparseVector(indices=vector.indices.tolist(), values=vector.values.tolist())
+            for vector in sparse_vectors
+        ]
+
+    async def _ensure_collection(self):
+        if await self.db.collection_exists(self.collection_name):
+            return
+        await self.db.create_collection(
+            collection_name=self.collection_name,
+            vectors_config=self.db.get_fastembed_vector_params(),
+            sparse_vectors_config=self.db.get_fastembed_sparse_vector_params(),
+        )
+
+    async def _ensure_payload_indexes(self):
+        if self._indexed or not await self.db.collection_exists(self.collection_name):
+            return
+        for field in INDEXED_FIELDS:
+            await self.db.create_payload_index(
+                collection_name=self.collection_name,
+                field_name=field,
+                field_schema=PayloadSchemaType.KEYWORD,
+            )
+        self._indexed = True
+
+    async def exists(
+        self, id: str, metadata: dict | None = None, *args, **kwargs
+    ) -> bool:
+        with span("knowledge_exists"):
+            if not await self.db.collection_exists(self.collection_name):
+                return False
+            count = await self.db.count(
+                collection_name=self.collection_name,
+                count_filter=id_filter(id),
+                exact=True,
+            )
+        return count.count > 0
+
+    async def retrieve(
+        self,
+        query: str,
+        metadata: dict | None = None,
+        top_k=10,
+        per_story: bool = False,
+        *args,
+        **kwargs,
+    ) -> List[EnrichedData]:
+        query_filter = build_filter(metadata or {})
+        limit = top_k * STORY_OVERFETCH if per_story else top_k
+
+        with span("qdrant_query", "embed"):
+            (dense,), (sparse,) = await asyncio.to_thread(self._embed, [query], True)
+        # Dense and sparse hits are fused with reciprocal rank fusion, as
+        # QdrantClient.query does on the client side
+        with span("qdrant_query", "search", top_k=limit):
+            response = await self.db.query_points(
+                collection_name=self.collection_name,
+                prefetch=[
+                    Prefetch(
+                        query=dense,
+                        using=self.db.get_vector_field_name(),
+                        filter=query_filter,
+                        limit=limit,
+                    ),
+                    Prefetch(
+                        query=sparse,
+                        using=self.db.get_sparse_vector_field_name(),
+                        filter=query_filter,
+                        limit=limit,
+                    ),
+                ],
+                query=FusionQuery(fusion=Fusion.RRF),
+                limit=limit,
+                with_payload=True,
+            )
+
+        results = [decode_payload(point.payload) for point in response.points]
+        if per_story:
+            results = one_per_story(results)[:top_k]
+        return results
+
+    async def store(
+        self, data: List[EnrichedData], metadata: List[dict], *args, **kwargs
+    ) -> bool:
+        for doc in data:
+            await self.delete(doc.id)
+
+        payloads, cold = build_payloads(
+            data, metadata, compact=self.cold_store is not None
+        )
+        if cold:
+            await self.cold_store.bulk_update(cold, collection=COLD_COLLECTION_NAME)
+
+        documents = [item.summary for item in data]
+        with span("qdrant_add", "embed", documents=len(documents)):
+            dense, sparse = await asyncio.to_thread(self._embed, documents)
+        await self._ensure_collection()
+        with span("qdrant_add", "upsert", documents=len(documents)):
+            await self.db.upsert(
+                collection_name=self.collection_name,
+                points=[
+                    PointStruct(
+                        id=point_id(item.id),
+                        # The summary is the document the client would store
+                        payload={"document": document, **payload},
+                        vector={
+                            self.db.get_vector_field_name(): dense_vector,
+                            self.db.get_sparse_vector_field_name(): sparse_vector,
+                        },
+                    )
+                    for item, document, payload, dense_vector, sparse_vector in zip(
+                        data, documents, payloads, dense, sparse
+                    )
+                ],
+            )
+        await self._ensure_payload_indexes()
+
+        return True
+
+    async def update(
+        self, data: EnrichedData, metadata: dict, *args, **kwargs
+    ) -> bool:
+        return await self.store([data], [metadata])
+
+    async def delete(self, id: str) -> bool:
+        if not await self.db.collection_exists(self.collection_name):
+            return False
+
+        result = await self.db.delete(
+            collection_name=self.collection_name,
+            points_selector=FilterSelector(filter=id_filter(id)),
+        )
+
+        return result is not None
+
+    async def search(
+        self, query: str, metadata: dict | None = None, top_k=10, *args, **kwargs
+    ) -> List[EnrichedData]:
+        return await self.retrieve(query, metadata, top_k=top_k, *args, **kwargs)
+
+    async def list(self, metadata: dict, *args, **kwargs) -> List[EnrichedData]:
+        points, _ = await self.db.scroll(
+            collection_name=self.collection_name,
+            scroll_filter=build_filter(metadata),
+            limit=100,
+        )
+
+        return [decode_payload(point.payload) for point in points]
+
+    async def count(self, metadata: dict, exact: bool = True, *args, **kwargs) -> int:
+        if not await self.db.collection_exists(self.collection_name):
+            return 0
+        count = await self.db.count(
+            collection_name=self.collection_name,
+            count_filter=build_filter(metadata),
+            exact=exact,
+        )
+
+        return count.count
+
+    async def facet(
+        self, key: str, metadata: dict = None, limit: int = 10
+    ) -> dict[str, int]:
+        """Most frequent values of a payload field among the matching points."""
+        if not await self.db.collection_exists(self.collection_name):
+            return {}
+        await self._ensure_payload_indexes()
+        result = await self.db.facet(
+            collection_name=self.collection_name,
+            key=key,
+            facet_filter=build_filter(metadata or {}),
+            limit=limit,
+        )
+        return {hit.value: hit.count for hit in result.hits}
+
+    async def close(self):
+        await self.db.close()
@@ -0,0 +1,139 @@
+import hashlib
+import logging
+import math
+import os
+import pickle
+import threading
+
+from src.dataclasses.news import News
+from src.dataclasses.payload import published_parsed, published_timestamp
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+class ScalableBloomFilter:
+    """Bloom filter that grows by chaining filters with tighter error rates."""
+
+    def __init__(
+        self,
+        initial_capacity: int = 100_000,
+        error_rate: float = 0.001,
+        growth: int = 2,
+        tightening: float = 0.5,
+    ):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.filters: list[BloomFilter] = []
+
+    def __contains__(self, key: str) -> bool:
+        return any(key in f for f in reversed(self.filters))
+
+    def __len__(self) -> int:
+        return sum(f.count for f in self.filters)
+
+    def add(self, key: str):
+        if key in self:
+            return
+        if not self.filters or self.filters[-1].count >= self.filters[-1].capacity:
+            self.filters.append(
+                BloomFilter(
+                    capacity=self.initial_capacity * self.growth ** len(self.filters),
+                    error_rate=self.error_rate
+                    * (1 - self.tightening)
+                    * self.tightening ** len(self.filters),
+                )
+            )
+        self.filters[-1].add(key)
+
+
+class SeenFilter:
+    """Local, persistent set of stored article ids with per-country watermarks.
+
+    Articles published at or before their country's watermark that the filter
+    has already seen are skipped without any remote lookup; everything else is
+    a probable new article and still goes through ``Knowledge.exists``.
+    """
+
+    def __init__(
+        self, path: str, initial_capacity: int = 100_000, error_rate: float = 0.001
+    ):
+        self.path = path
+        self._lock = threading.Lock()
+        self.cold = not os.path.exists(path)
+        if self.cold:
+            self.filter = ScalableBloomFilter(initial_capacity, error_rate)
+            self.watermarks: dict[str, float] = {}
+        else:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+            self.filter = state["filter"]
+            self.watermarks = state["watermarks"]
+
+    def add(self, id: str, country: str = None, published_parsed=None):
+        with self._lock:
+            self.filter.add(id)
+            published = published_timestamp(published_parsed)
+            if country and published is not None:
+                self.watermarks[country] = max(
+                    self.watermarks.get(country, published), published
+                )
+
+    def is_stale(self, country: str, article: News) -> bool:
+        published = published_timestamp(article.published_parsed)
+        watermark = self.watermarks.get(country)
+        if published is None or watermark is None or published > watermark:
+            return False
+        return article.id in self.filter
+
+    def rebuild(self, knowledge):
+        """Fill a cold filter from the ids already stored in the knowledge base."""
+        logger.info("Rebuilding seen filter from the knowledge base...")
+        for payload in knowledge.iter_payloads(
+            fields=["id", "country", "published_parsed", "published_ts"]
+        ):
+            # Compact payloads only keep the timestamp
+            self.add(
+                payload["id"],
+                payload.get("country"),
+                payload.get("published_parsed")
+                or published_parsed(payload.get("published_ts")),
+            )
+        self.cold = False
+        self.save()
+        logger.info(f"Seen filter rebuilt with {len(self.filter)} articles")
+
+    def save(self):
+        with self._lock:
+            state = {"filter": self.filter, "watermarks": dict(self.watermarks)}
+            with open(f"{self.path}.tmp", "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{self.path}.tmp", self.path)
@@ -0,0 +1,145 @@
+import logging
+import math
+import time
+from datetime import timedelta
+from typing import List
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    Distance,
+    FieldCondition,
+    Filter,
+    FilterSelector,
+    PayloadSchemaType,
+    PointStruct,
+    Range,
+    VectorParams,
+)
+
+from src.knowledge.news_knowledge import point_id
+from src.telemetry.telemetry import span
+
+logger = logging.getLogger(__name__)
+
+STORIES_COLLECTION_NAME = "news_stories"
+
+
+def normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else vector
+
+
+class StoryClusterer:
+    """Assigns articles to stories by their nearest recent story centroid.
+
+    Each story is a point of a small Qdrant collection holding the normalized
+    mean of its articles' vectors. An article joins the most similar story
+    updated within ``window`` if the cosine similarity is at least
+    ``min_similarity``, and the centroid is moved towards it; otherwise it starts
+    a new story, identified by the article id. Stories older than the window are
+    dropped, so lookups stay cheap.
+
+    The centroid update is a read-modify-write with no lock or version check
+    (Qdrant has no conditional upsert): when replicas add articles to the same
+    story at the same time, the last upsert wins and the others' articles are
+    missing from its size and centroid. Story ids stay correct, the centroid is
+    only slightly off; cluster on a single replica if that matters.
+    """
+
+    def __init__(
+        self,
+        db: QdrantClient,
+        min_similarity: float = 0.8,
+        window: timedelta = timedelta(days=3),
+        collection_name: str = STORIES_COLLECTION_NAME,
+    ):
+        self.db = db
+        self.min_similarity = min_similarity
+        self.window = window
+        self.collection_name = collection_name
+        self._ready = False
+
+    def _ensure_collection(self, vector_dim: int):
+        if self._ready:
+            return
+        if not self.db.collection_exists(self.collection_name):
+            self.db.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=VectorParams(size=vector_dim, distance=Distance.COSINE),
+            )
+            self.db.create_payload_index(
+                collection_name=self.collection_name,
+                field_name="updated_ts",
+                field_schema=PayloadSchemaType.FLOAT,
+            )
+        self._ready = True
+
+    def prune(self, now: float = None):
+        """Drop the stories not updated within the window."""
+        oldest = (now or time.time()) - self.window.total_seconds()
+        self.db.delete(
+            collection_name=self.collection_name,
+            points_selector=FilterSelector(
+                filter=Filter(
+                    must=[FieldCondition(key="updated_ts", range=Range(lt=oldest))]
+                )
+            ),
+        )
+
+    def _nearest(self, vector: List[float]):
+        points = self.db.query_points(
+            collection_name=self.collection_name,
+            query=vector,
+            limit=1,
+            score_threshold=self.min_similarity,
+            with_payload=True,
+            with_vectors=True,
+        ).points
+        return points[0] if points else None
+
+    def assign(self, vectors: dict[str, List[float]]) -> dict[str, str]:
+        """Story id of each article, given the article vectors by article id.
+
+        Articles are assigned one at a time, so articles of the same batch can
+        join the stories started by the previous ones.
+        """
+        if not vectors:
+            return {}
+        now = time.time()
+        self._ensure_collection(len(next(iter(vectors.values()))))
+        with span("story_assign", size=len(vectors)):
+            self.prune(now)
+            stories = {}
+            for id, vector in vectors.items():
+                vector = normalize(vector)
+                story = self._nearest(vector)
+                if story is None:
+                    story_id, size, centroid = id, 1, vector
+                else:
+                    story_id = story.payload["story_id"]
+                    size = story.payload["size"] + 1
+                    centroid = normalize(
+                        [
+                            c + (v - c) / size
+                            for c, v in zip(story.vector, vector, strict=True)
+                        ]
+                    )
+                self.db.upsert(
+                    collection_name=self.collection_name,
+                    points=[
+                        PointStruct(
+                            id=point_id(story_id),
+                            vector=centroid,
+                            payload={
+                                "story_id": story_id,
+                                "size": size,
+                                "updated_ts": now,
+                            },
+                        )
+                    ],
+                )
+                stories[id] = story_id
+        logger.info(
+            f"Assigned {len(stories)} articles to {len(set(stories.values()))} stories"
+        )
+        return stories
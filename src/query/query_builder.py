@@ -1,37 +1,45 @@
+import asyncio
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 
-from src.databases.database import Database
-from src.dataclasses.aggregators import KeywordsAggregation, SentimentAggregation
+from src.aggregators.materialized import (
+    WINDOWS_COLLECTION,
+    load_window,
+    parse_window,
+    window_id,
+)
+from src.databases.database import AsyncDatabase, Database
+from src.dataclasses.aggregators import (
+    ARTICLES_NODE,
+    EntityGraph,
+    KeywordsAggregation,
+    KeywordTrends,
+    SentimentAggregation,
+    SentimentScoreAggregation,
+)
 from src.dataclasses.enriched_data import EnrichedData
-from src.knowledge.knowledge import Knowledge
+from src.dataclasses.facets import FacetedResults
+from src.knowledge.knowledge import AsyncKnowledge, Knowledge
+from src.telemetry.telemetry import traced
 
+DEFAULT_FACETS = ("sentiment", "country", "categories")
 
-class QueryBuilder:
-    def __init__(self, knowledge: Knowledge, database: Database):
-        self.knowledge = knowledge
-        self.database = database
 
-    def run(
-        self,
-        query: str,
-        country: str = "all",
-        keyword: str = None,
-        sentiment: str = None,
-        limit: int = 10,
-    ) -> list[EnrichedData]:
+class BaseQueryBuilder:
+    """Query and aggregation helpers shared by the sync and async builders."""
+
+    def _metadata(
+        self, country: str = "all", keyword: str = None, sentiment: str = None
+    ) -> dict:
         metadata = {}
         if country != "all":
             metadata["country"] = country
         if keyword:
-            metadata["keyword"] = keyword
+            metadata["keywords"] = keyword
         if sentiment:
             metadata["sentiment"] = sentiment
-
-        return self.knowledge.retrieve(
-            query=query,
-            metadata=metadata,
-            top_k=limit,
-        )
+        return metadata
 
     def _aggregate_keywords(self, keywords: list[KeywordsAggregation]):
         aggregation = KeywordsAggregation.empty()
@@ -44,6 +52,113 @@ class QueryBuilder:
 
         return aggregation
 
+    def _aggregate_sentiments(self, sentiments: list[SentimentAggregation]):
+        aggregation = SentimentAggregation.empty()
+
+        for sentiment_aggregation in sentiments:
+            for sentiment, count in sentiment_aggregation.sentiment.items():
+                aggregation.sentiment[sentiment] = (
+                    aggregation.sentiment.get(sentiment, 0) + count
+                )
+
+        return aggregation
+
+    def _window_keywords(self, view, window: str, country: str, top_k: int):
+        return (
+            KeywordsAggregation(
+                _id=view._id,
+                date_time=view.updated_at,
+                keywords=dict(view.keywords),
+                metadata={"window": window, "country": country},
+            )
+            .sort(reverse=True)
+            .limit(top_k)
+        )
+
+    def _window_sentiments(self, view, window: str, country: str, top_k: int):
+        return (
+            SentimentAggregation(
+                _id=view._id,
+                date_time=view.updated_at,
+                sentiment=dict(view.sentiment),
+                metadata={"window": window, "country": country},
+            )
+            .sort(reverse=True)
+            .limit(top_k)
+        )
+
+
+class QueryBuilder(BaseQueryBuilder):
+    def __init__(self, knowledge: Knowledge, database: Database, max_workers: int = 8):
+        self.knowledge = knowledge
+        self.database = database
+        # Runs the sub-queries of a faceted search concurrently
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="facets"
+        )
+
+    def _submit(self, fn, *args, **kwargs) -> Future:
+        # Copies the context so that the sub-query spans belong to the caller's
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, fn, *args, **kwargs)
+
+    @traced("query")
+    def run(
+        self,
+        query: str,
+        country: str = "all",
+        keyword: str = None,
+        sentiment: str = None,
+        limit: int = 10,
+        per_story: bool = False,
+    ) -> list[EnrichedData]:
+        """Top hits, or with ``per_story`` the top hit of each story."""
+        return self.knowledge.retrieve(
+            query=query,
+            metadata=self._metadata(country, keyword, sentiment),
+            top_k=limit,
+            per_story=per_story,
+        )
+
+    @traced("query")
+    def faceted_search(
+        self,
+        query: str,
+        country: str = "all",
+        keyword: str = None,
+        sentiment: str = None,
+        limit: int = 10,
+        facets: tuple[str, ...] = DEFAULT_FACETS,
+        facet_limit: int = 10,
+        per_story: bool = False,
+    ) -> FacetedResults:
+        """Top hits plus the total and facet counts under the same filter.
+
+        The search, the count and one facet query per field run in parallel.
+        ``per_story`` applies to the hits only: counts are of articles.
+        """
+        metadata = self._metadata(country, keyword, sentiment)
+        hits = self._submit(
+            self.knowledge.retrieve,
+            query=query,
+            metadata=metadata,
+            top_k=limit,
+            per_story=per_story,
+        )
+        # Exact: approximate counts can be far off under a selective filter
+        total = self._submit(self.knowledge.count, metadata, exact=True)
+        counts = {
+            facet: self._submit(self.knowledge.facet, facet, metadata, facet_limit)
+            for facet in facets
+        }
+
+        return FacetedResults(
+            hits=hits.result(),
+            total=total.result(),
+            facets={facet: future.result() for facet, future in counts.items()},
+        )
+
+    @traced("query")
     def get_keywords(self, start_date: datetime, end_date: datetime, top_k: int = 10):
         query = {
             "date_time": {
@@ -65,26 +180,209 @@ class QueryBuilder:
             .limit(top_k)
         )
 
-    def _aggregate_sentiments(self, sentiments: list[SentimentAggregation]):
-        aggregation = SentimentAggregation.empty()
+    @traced("query")
+    def get_sentiments(self, start_date: datetime, end_date: datetime, top_k: int = 10):
+        query = {
+            "date_time": {
+                "$gte": start_date,
+                "$lt": end_date,
+            }
+        }
 
-        for sentiment_aggregation in sentiments:
-            for sentiment, count in sentiment_aggregation.sentiment.items():
-                aggregation.sentiment[sentiment] = (
-                    aggregation.sentiment.get(sentiment, 0) + count
-                )
+        result = self.database.query(
+            query=query,
+            collection="sentiment_aggregations",
+        )
+
+        return (
+            self._aggregate_sentiments(
+                [SentimentAggregation.from_dict(data) for data in result]
+            )
+            .sort(reverse=True)
+            .limit(top_k)
+        )
+
+    def _aggregate_sentiment_scores(self, scores: list[SentimentScoreAggregation]):
+        aggregation = SentimentScoreAggregation.empty()
+
+        for score_aggregation in scores:
+            aggregation.merge(score_aggregation)
 
         return aggregation
 
-    def get_sentiments(self, start_date: datetime, end_date: datetime, top_k: int = 10):
+    @traced("query")
+    def get_sentiment_scores(
+        self, start_date: datetime, end_date: datetime, country: str = "all"
+    ) -> SentimentScoreAggregation:
         query = {
             "date_time": {
                 "$gte": start_date,
                 "$lt": end_date,
             }
         }
+        if country != "all":
+            query["metadata.country"] = country
 
         result = self.database.query(
+            query=query,
+            collection="sentiment_score_aggregations",
+        )
+
+        return self._aggregate_sentiment_scores(
+            [SentimentScoreAggregation.from_dict(data) for data in result]
+        )
+
+    @traced("query")
+    def get_trending_keywords(self, country: str = "all", top_k: int = 10):
+        result = self.database.get(country, collection="keyword_trends")
+        if not result:
+            return KeywordTrends.empty(id=country)
+
+        return KeywordTrends.from_dict(result).limit(top_k)
+
+    @traced("query")
+    def get_cooccurrences(
+        self,
+        entity: str,
+        start_date: datetime,
+        end_date: datetime,
+        country: str = "all",
+        with_pmi: bool = False,
+    ) -> EntityGraph:
+        query = {
+            "entity": entity,
+            "bucket": {
+                "$gte": start_date,
+                "$lt": end_date,
+            },
+        }
+        if country != "all":
+            query["country"] = country
+
+        graph = EntityGraph()
+        for data in self.database.query(
+            query=query, collection="entity_cooccurrences"
+        ):
+            graph.add_document(data)
+
+        if with_pmi and graph.neighbors.get(entity):
+            # Marginal counts of the neighbors and the article total for PMI
+            query["entity"] = {"$in": [*graph.neighbors[entity], ARTICLES_NODE]}
+            for data in self.database.query(
+                query=query, collection="entity_cooccurrences"
+            ):
+                graph.add_document({**data, "neighbors": {}})
+
+        return graph
+
+    def get_window(self, window: str = "24h", country: str = "all"):
+        # Expired buckets are subtracted by MaterializedWindows when it writes
+        return load_window(self.database, window, country)
+
+    @traced("query")
+    def get_window_keywords(
+        self, window: str = "24h", country: str = "all", top_k: int = 10
+    ):
+        view = self.get_window(window, country)
+        return self._window_keywords(view, window, country, top_k)
+
+    @traced("query")
+    def get_window_sentiments(
+        self, window: str = "24h", country: str = "all", top_k: int = 10
+    ):
+        view = self.get_window(window, country)
+        return self._window_sentiments(view, window, country, top_k)
+
+
+class AsyncQueryBuilder(BaseQueryBuilder):
+    """Event-loop counterpart of QueryBuilder, for the search service queries."""
+
+    def __init__(self, knowledge: AsyncKnowledge, database: AsyncDatabase):
+        self.knowledge = knowledge
+        self.database = database
+
+    @traced("query")
+    async def run(
+        self,
+        query: str,
+        country: str = "all",
+        keyword: str = None,
+        sentiment: str = None,
+        limit: int = 10,
+        per_story: bool = False,
+    ) -> list[EnrichedData]:
+        """Top hits, or with ``per_story`` the top hit of each story."""
+        return await self.knowledge.retrieve(
+            query=query,
+            metadata=self._metadata(country, keyword, sentiment),
+            top_k=limit,
+            per_story=per_story,
+        )
+
+    @traced("query")
+    async def faceted_search(
+        self,
+        query: str,
+        country: str = "all",
+        keyword: str = None,
+        sentiment: str = None,
+        limit: int = 10,
+        facets: tuple[str, ...] = DEFAULT_FACETS,
+        facet_limit: int = 10,
+        per_story: bool = False,
+    ) -> FacetedResults:
+        """Top hits plus the total and facet counts under the same filter.
+
+        The search, the count and one facet query per field run concurrently.
+        ``per_story`` applies to the hits only: counts are of articles.
+        """
+        metadata = self._metadata(country, keyword, sentiment)
+        hits, total, *counts = await asyncio.gather(
+            self.knowledge.retrieve(
+                query=query, metadata=metadata, top_k=limit, per_story=per_story
+            ),
+            self.knowledge.count(metadata, exact=True),
+            *[self.knowledge.facet(facet, metadata, facet_limit) for facet in facets],
+        )
+
+        return FacetedResults(hits=hits, total=total, facets=dict(zip(facets, counts)))
+
+    @traced("query")
+    async def get_keywords(
+        self, start_date: datetime, end_date: datetime, top_k: int = 10
+    ):
+        query = {
+            "date_time": {
+                "$gte": start_date,
+                "$lt": end_date,
+            }
+        }
+
+        result = await self.database.query(
+            query=query,
+            collection="keywords_aggregations",
+        )
+
+        return (
+            self._aggregate_keywords(
+                [KeywordsAggregation.from_dict(data) for data in result]
+            )
+            .sort(reverse=True)
+            .limit(top_k)
+        )
+
+    @traced("query")
+    async def get_sentiments(
+        self, start_date: datetime, end_date: datetime, top_k: int = 10
+    ):
+        query = {
+            "date_time": {
+                "$gte": start_date,
+                "$lt": end_date,
+            }
+        }
+
+        result = await self.database.query(
             query=query,
             collection="sentiment_aggregations",
         )
@@ -96,3 +394,26 @@ class QueryBuilder:
             .sort(reverse=True)
             .limit(top_k)
         )
+
+    async def get_window(self, window: str = "24h", country: str = "all"):
+        data = await self.database.get(
+            window_id(window, country), collection=WINDOWS_COLLECTION
+        )
+        return parse_window(window, country, data)
+
+    @traced("query")
+    async def get_window_keywords(
+        self, window: str = "24h", country: str = "all", top_k: int = 10
+    ):
+        view = await self.get_window(window, country)
+        return self._window_keywords(view, window, country, top_k)
+
+    @traced("query")
+    async def get_window_sentiments(
+        self, window: str = "24h", country: str = "all", top_k: int = 10
+    ):
+        view = await self.get_window(window, country)
+        return self._window_sentiments(view, window, country, top_k)
+
+    async def close(self):
+        await asyncio.gather(self.knowledge.close(), self.database.close())
@@ -0,0 +1,287 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from functools import partial
+from time import perf_counter
+from typing import Any, Callable, Hashable
+
+from aiohttp import web
+
+from src.knowledge.news_knowledge import INDEXED_FIELDS
+from src.query.query_builder import DEFAULT_FACETS, AsyncQueryBuilder
+from src.telemetry.telemetry import cache_lookup, metrics_text, span
+
+logger = logging.getLogger(__name__)
+
+# Upper bound of the number of hits per search, each one costs a payload fetch
+MAX_LIMIT = 100
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, default=str)
+
+
+def _flag(value: str) -> bool:
+    if value.lower() not in ("1", "0", "true", "false"):
+        raise ValueError(value)
+    return value.lower() in ("1", "true")
+
+
+def _percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+class LatencyTracker:
+    """Request latencies over a sliding window of the last requests per route."""
+
+    def __init__(self, window: int = 10_000):
+        self.window = window
+        self.latencies: dict[str, deque] = {}
+        self.counts: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+
+    def record(self, route: str, seconds: float, error: bool = False):
+        self.latencies.setdefault(route, deque(maxlen=self.window)).append(seconds)
+        self.counts[route] = self.counts.get(route, 0) + 1
+        if error:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    def to_dict(self) -> dict:
+        stats = {}
+        for route, latencies in self.latencies.items():
+            values = list(latencies)
+            stats[route] = {
+                "count": self.counts[route],
+                "errors": self.errors.get(route, 0),
+                **{
+                    f"p{int(q * 100)}_ms": round(_percentile(values, q) * 1000, 2)
+                    for q in (0.5, 0.9, 0.99)
+                },
+            }
+        return stats
+
+
+class SearchService:
+    """Async HTTP front end for ``AsyncQueryBuilder``.
+
+    Queries run on the event loop, at most ``max_concurrency`` at a time; only
+    embedding happens on a worker thread. Identical requests that arrive while
+    one is in flight share its result, and requests are rejected with 503 once
+    ``max_pending`` are waiting.
+    """
+
+    def __init__(
+        self,
+        query_builder: AsyncQueryBuilder,
+        max_concurrency: int = 16,
+        max_pending: int = 256,
+    ):
+        self.query_builder = query_builder
+        self.max_pending = max_pending
+        self.latency = LatencyTracker()
+        self.coalesced = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self._pending = 0
+
+    async def _run(self, fn: Callable, *args, **kwargs):
+        async with self._semaphore:
+            return await fn(*args, **kwargs)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        self._pending -= 1
+        self._inflight.pop(key, None)
+
+    async def call(self, key: Hashable, fn: Callable, *args, **kwargs):
+        task = self._inflight.get(key)
+        cache_lookup("search_coalescing", hit=task is not None)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            if self._pending >= self.max_pending:
+                raise web.HTTPServiceUnavailable(text="Too many pending requests")
+            self._pending += 1
+            task = asyncio.ensure_future(self._run(fn, *args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(partial(self._done, key))
+        # A cancelled client must not cancel the request shared with others
+        return await asyncio.shield(task)
+
+    @web.middleware
+    async def _track_latency(self, request: web.Request, handler):
+        start = perf_counter()
+        error = False
+        route = request.match_info.route.resource
+        # Unmatched paths share a label, so that scanners cannot grow the stats
+        name = route.canonical if route else "unmatched"
+        try:
+            with span("http_request", name):
+                return await handler(request)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.latency.record(name, perf_counter() - start, error)
+
+    @staticmethod
+    def _param(request: web.Request, name: str, parse: Callable, default: Any):
+        if name not in request.query:
+            return default
+        try:
+            return parse(request.query[name])
+        except ValueError:
+            raise web.HTTPBadRequest(text=f"Invalid value for {name}")
+
+    def _date_range(self, request: web.Request) -> tuple[datetime, datetime]:
+        # Defaults are rounded up to the minute so that identical requests coalesce
+        now = datetime.now().replace(second=0, microsecond=0) + timedelta(minutes=1)
+        end = self._param(request, "end", datetime.fromisoformat, now)
+        start = self._param(
+            request, "start", datetime.fromisoformat, end - timedelta(days=7)
+        )
+        return start, end
+
+    async def search(self, request: web.Request) -> web.Response:
+        query = request.query.get("q", "")
+        country = request.query.get("country", "all")
+        keyword = request.query.get("keyword") or None
+        sentiment = request.query.get("sentiment") or None
+        limit = min(max(self._param(request, "limit", int, 10), 1), MAX_LIMIT)
+        per_story = self._param(request, "per_story", _flag, False)
+
+        if "facets" in request.query:
+            facets = tuple(f for f in request.query["facets"].split(",") if f)
+            unknown = [facet for facet in facets if facet not in INDEXED_FIELDS]
+            if unknown:
+                raise web.HTTPBadRequest(text=f"Unknown facets: {', '.join(unknown)}")
+            facet_limit = min(
+                max(self._param(request, "facet_limit", int, 10), 1), MAX_LIMIT
+            )
+            results = await self.call(
+                ("faceted", query, country, keyword, sentiment, limit)
+                + (facets, facet_limit, per_story),
+                self.query_builder.faceted_search,
+                query=query,
+                country=country,
+                keyword=keyword,
+                sentiment=sentiment,
+                limit=limit,
+                facets=facets or DEFAULT_FACETS,
+                facet_limit=facet_limit,
+                per_story=per_story,
+            )
+            return web.json_response(results.to_dict(), dumps=_dumps)
+
+        results = await self.call(
+            ("search", query, country, keyword, sentiment, limit, per_story),
+            self.query_builder.run,
+            query=query,
+            country=country,
+            keyword=keyword,
+            sentiment=sentiment,
+            limit=limit,
+            per_story=per_story,
+        )
+        return web.json_response(
+            [result.to_dict() for result in results], dumps=_dumps
+        )
+
+    async def keywords(self, request: web.Request) -> web.Response:
+        top_k = self._param(request, "top_k", int, 10)
+        if "window" in request.query:
+            window = request.query["window"]
+            country = request.query.get("country", "all")
+            result = await self.call(
+                ("keywords", window, country, top_k),
+                self.query_builder.get_window_keywords,
+                window=window,
+                country=country,
+                top_k=top_k,
+            )
+        else:
+            start, end = self._date_range(request)
+            result = await self.call(
+                ("keywords", start, end, top_k),
+                self.query_builder.get_keywords,
+                start_date=start,
+                end_date=end,
+                top_k=top_k,
+            )
+        return web.json_response(result.keywords, dumps=_dumps)
+
+    async def sentiments(self, request: web.Request) -> web.Response:
+        top_k = self._param(request, "top_k", int, 10)
+        if "window" in request.query:
+            window = request.query["window"]
+            country = request.query.get("country", "all")
+            result = await self.call(
+                ("sentiments", window, country, top_k),
+                self.query_builder.get_window_sentiments,
+                window=window,
+                country=country,
+                top_k=top_k,
+            )
+        else:
+            start, end = self._date_range(request)
+            result = await self.call(
+                ("sentiments", start, end, top_k),
+                self.query_builder.get_sentiments,
+                start_date=start,
+                end_date=end,
+                top_k=top_k,
+            )
+        return web.json_response(result.sentiment, dumps=_dumps)
+
+    async def healthz(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "routes": self.latency.to_dict(),
+                "in_flight": len(self._inflight),
+                "pending": self._pending,
+                "coalesced": self.coalesced,
+            }
+        )
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        body, content_type = metrics_text()
+        return web.Response(body=body, headers={"Content-Type": content_type})
+
+    async def warm_up(self, app: web.Application):
+        """Load the embedding models and open the connections before serving."""
+        logger.info("Warming up search service...")
+        start = perf_counter()
+        now = datetime.now()
+        await asyncio.gather(
+            self._run(self.query_builder.run, query="warm up", limit=1),
+            self._run(
+                self.query_builder.get_keywords, now - timedelta(hours=1), now, 1
+            ),
+        )
+        logger.info(f"Search service ready in {perf_counter() - start:.2f}s")
+
+    async def close(self, app: web.Application):
+        await self.query_builder.close()
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._track_latency])
+        app.add_routes(
+            [
+                web.get("/search", self.search),
+                web.get("/keywords", self.keywords),
+                web.get("/sentiments", self.sentiments),
+                web.get("/healthz", self.healthz),
+                web.get("/stats", self.stats),
+                web.get("/metrics", self.metrics),
+            ]
+        )
+        app.on_startup.append(self.warm_up)
+        app.on_cleanup.append(self.close)
+        return app
@@ -0,0 +1,468 @@
+import json
+import logging
+import os
+import threading
+from dataclasses import asdict, is_dataclass
+from datetime import datetime
+from time import monotonic, sleep
+from typing import Any, Iterator, List
+from uuid import uuid4
+
+from src.databases.database import Database
+from src.dataclasses.enriched_data import EnrichedData
+from src.knowledge.knowledge import Knowledge
+
+logger = logging.getLogger(__name__)
+
+# Errors that replaying the same record raises every time (bad data, unknown
+# records); anything else, such as connection errors and timeouts, is retried
+DETERMINISTIC_ERRORS = (ValueError, TypeError, KeyError)
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    if is_dataclass(value):
+        return asdict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def _object_hook(value: dict):
+    if len(value) == 1 and "$date" in value:
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+
+def encode(record: dict) -> bytes:
+    return json.dumps(record, default=_default).encode() + b"\n"
+
+
+def decode(line: bytes) -> dict:
+    return json.loads(line, object_hook=_object_hook)
+
+
+class Spool:
+    """Append-only, segmented write-ahead log on local disk.
+
+    Records are appended to the active segment and fsynced in batches (every
+    ``fsync_every`` records or ``fsync_interval`` seconds). A single consumer reads
+    them back from the committed position; fully consumed segments are removed.
+    ``append`` blocks once more than ``max_pending_bytes`` are waiting to be
+    drained.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        segment_max_bytes: int = 64 * 1024 * 1024,
+        fsync_every: int = 64,
+        fsync_interval: float = 1.0,
+        max_pending_bytes: int = 1024 * 1024 * 1024,
+    ):
+        self.path = path
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.max_pending_bytes = max_pending_bytes
+        self._condition = threading.Condition()
+        os.makedirs(path, exist_ok=True)
+
+        self.position = self._read_checkpoint()
+        segments = self.segments()
+        self._active = segments[-1] if segments else self.position[0]
+        self._file = open(self._segment_path(self._active), "ab")
+        self._unsynced = 0
+        self._last_sync = monotonic()
+        self.pending_bytes = sum(
+            os.path.getsize(self._segment_path(s))
+            for s in segments
+            if s >= self.position[0]
+        ) - (self.position[1] if self.position[0] in segments else 0)
+
+        # Article ids appended but not drained yet, so that callers can treat
+        # them as already stored
+        self.pending_ids: dict[str, int] = {}
+        for record, _, _ in self.read(self.position):
+            self._track(record, 1)
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, f"segment-{segment:08d}.log")
+
+    def _checkpoint_path(self) -> str:
+        return os.path.join(self.path, "checkpoint.json")
+
+    def _dead_letter_path(self) -> str:
+        return os.path.join(self.path, "dead-letter.log")
+
+    def _read_checkpoint(self) -> tuple[int, int]:
+        if os.path.exists(self._checkpoint_path()):
+            with open(self._checkpoint_path()) as f:
+                data = json.load(f)
+            return data["segment"], data["offset"]
+        segments = self.segments()
+        return (segments[0] if segments else 0), 0
+
+    def segments(self) -> list[int]:
+        return sorted(
+            int(name[len("segment-") : -len(".log")])
+            for name in os.listdir(self.path)
+            if name.startswith("segment-") and name.endswith(".log")
+        )
+
+    def _track(self, record: dict, sign: int):
+        if record.get("kind") != "knowledge":
+            return
+        for data in record["data"]:
+            count = self.pending_ids.get(data["id"], 0) + sign
+            if count > 0:
+                self.pending_ids[data["id"]] = count
+            else:
+                self.pending_ids.pop(data["id"], None)
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = monotonic()
+
+    def append(self, record: dict):
+        line = encode(record)
+        with self._condition:
+            while self.pending_bytes + len(line) > self.max_pending_bytes:
+                logger.warning("Spool is full, waiting for the drainer...")
+                self._condition.wait(timeout=1.0)
+
+            self._file.write(line)
+            # Make the record visible to the reader without waiting for fsync
+            self._file.flush()
+            self.pending_bytes += len(line)
+            self._unsynced += 1
+            self._track(record, 1)
+
+            if (
+                self._unsynced >= self.fsync_every
+                or monotonic() - self._last_sync >= self.fsync_interval
+            ):
+                self._sync()
+            if self._file.tell() >= self.segment_max_bytes:
+                self._sync()
+                self._file.close()
+                self._active += 1
+                self._file = open(self._segment_path(self._active), "ab")
+
+    def flush(self):
+        with self._condition:
+            if self._unsynced:
+                self._sync()
+
+    def close(self):
+        with self._condition:
+            self._sync()
+            self._file.close()
+
+    def read(
+        self, position: tuple[int, int]
+    ) -> Iterator[tuple[dict, tuple[int, int], int]]:
+        """Yield ``(record, next_position, size)`` for complete records after position."""
+        segment, offset = position
+        for current in self.segments():
+            if current < segment:
+                continue
+            if current > segment:
+                offset = 0
+            with open(self._segment_path(current), "rb") as f:
+                f.seek(offset)
+                for line in iter(f.readline, b""):
+                    if not line.endswith(b"\n"):
+                        # Partially written record, still being appended
+                        return
+                    offset += len(line)
+                    yield decode(line), (current, offset), len(line)
+            if current >= self._active:
+                return
+
+    def commit(self, position: tuple[int, int], records: List[dict], size: int):
+        tmp_path = f"{self._checkpoint_path()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"segment": position[0], "offset": position[1]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._checkpoint_path())
+
+        with self._condition:
+            self.position = position
+            self.pending_bytes -= size
+            for record in records:
+                self._track(record, -1)
+            self._condition.notify_all()
+
+        for segment in self.segments():
+            if segment < position[0]:
+                os.remove(self._segment_path(segment))
+
+    def dead_letter(self, record: dict, position: tuple[int, int], error: Exception):
+        """Set aside a record that cannot be applied, to be inspected by hand."""
+        with open(self._dead_letter_path(), "ab") as f:
+            f.write(
+                encode({"position": position, "error": repr(error), "record": record})
+            )
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class SpoolDrainer(threading.Thread):
+    """Replays spooled records into the downstream knowledge base and database.
+
+    Knowledge writes are idempotent (``store`` replaces documents by id),
+    database stores/updates are replayed as upserts and increments carry an op id
+    that documents remember, so replaying records after a crash is idempotent.
+    A record failing ``max_failures`` times in a row with a deterministic error
+    (``DETERMINISTIC_ERRORS``) is moved to the spool dead-letter file and
+    skipped. Other errors, e.g. while Qdrant or Mongo are down, are retried with
+    a backoff capped at ``max_backoff`` for as long as they last.
+    """
+
+    def __init__(
+        self,
+        spool: Spool,
+        knowledge: Knowledge,
+        database: Database,
+        batch_size: int = 64,
+        poll_interval: float = 1.0,
+        max_backoff: float = 60.0,
+        max_failures: int = 5,
+    ):
+        super().__init__(daemon=True, name="spool-drainer")
+        self.spool = spool
+        self.knowledge = knowledge
+        self.database = database
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.max_failures = max_failures
+        self._stop_event = threading.Event()
+        # Position of the record that last failed and its consecutive failures
+        self._failure = (None, 0)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def apply(self, record: dict):
+        if record["kind"] == "knowledge":
+            self.knowledge.store(
+                [EnrichedData.from_dict(data) for data in record["data"]],
+                metadata=record["metadata"],
+            )
+        elif record["op"] in ("store", "update"):
+            self.database.update(
+                id=record["id"], data=record["data"], collection=record["collection"]
+            )
+        elif record["op"] == "bulk_update":
+            self.database.bulk_update(record["data"], collection=record["collection"])
+        elif record["op"] == "bulk_increment":
+            self.database.bulk_increment(
+                record["data"],
+                collection=record["collection"],
+                defaults=record.get("defaults"),
+                op_id=record.get("op_id"),
+            )
+        else:
+            raise ValueError(f"Unknown spool record: {record}")
+
+    def _failed(self, position: tuple[int, int]) -> int:
+        failed, count = self._failure
+        self._failure = (position, count + 1 if failed == position else 1)
+        return self._failure[1]
+
+    def drain(self) -> int:
+        records, position, size, error = [], self.spool.position, 0, None
+        for record, next_position, record_size in self.spool.read(position):
+            try:
+                self.apply(record)
+            except Exception as e:
+                if (
+                    not isinstance(e, DETERMINISTIC_ERRORS)
+                    or self._failed(position) < self.max_failures
+                ):
+                    error = e
+                    break
+                logger.error(f"Moving spool record at {position} to the dead letters")
+                self.spool.dead_letter(record, position, e)
+            records.append(record)
+            position, size = next_position, size + record_size
+            if len(records) >= self.batch_size:
+                break
+        if records:
+            # Commit what was applied before a failure, so that it is not
+            # replayed on every retry
+            self.database.flush()
+            self.spool.commit(position, records, size)
+        if error is not None:
+            raise error
+        return len(records)
+
+    def run(self):
+        backoff = self.poll_interval
+        while not self._stop_event.is_set():
+            try:
+                drained = self.drain()
+                backoff = self.poll_interval
+            except Exception as e:
+                logger.error(f"Error draining spool, retrying in {backoff}s")
+                logger.error(e)
+                sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            if not drained:
+                self._stop_event.wait(self.poll_interval)
+
+
+class SpooledKnowledge(Knowledge):
+    """Knowledge whose writes go through the spool first."""
+
+    def __init__(self, knowledge: Knowledge, spool: Spool):
+        super().__init__(knowledge.db)
+        self.knowledge = knowledge
+        self.spool = spool
+
+    def exists(self, id: str, metadata: dict = None, *args, **kwargs):
+        if id in self.spool.pending_ids:
+            return True
+        return self.knowledge.exists(id, metadata, *args, **kwargs)
+
+    def retrieve(self, query: Any, metadata: dict, top_k: int = 10, *args, **kwargs):
+        return self.knowledge.retrieve(query, metadata, top_k, *args, **kwargs)
+
+    def store(self, data: List[Any], metadata: List[dict], *args, **kwargs):
+        """Spool the articles, after setting their ``story_id``.
+
+        Stories are assigned here rather than by the drainer, so that the
+        aggregators running next count stories. If that fails, e.g. while Qdrant
+        is down, the articles are spooled without and the drainer assigns them.
+        """
+        if not data:
+            return True
+        try:
+            self.knowledge.assign_stories(data)
+        except Exception as e:
+            logger.error("Could not assign stories before spooling")
+            logger.error(e)
+        self.spool.append(
+            {
+                "kind": "knowledge",
+                "data": [item.to_dict() for item in data],
+                "metadata": metadata,
+            }
+        )
+        return True
+
+    def update(self, data: Any, metadata: dict, *args, **kwargs):
+        return self.store([data], [metadata])
+
+    def delete(self, id: str, *args, **kwargs):
+        return self.knowledge.delete(id, *args, **kwargs)
+
+    def search(self, query: str, metadata: dict, *args, **kwargs):
+        return self.knowledge.search(query, metadata, *args, **kwargs)
+
+    def list(self, metadata: dict, *args, **kwargs):
+        return self.knowledge.list(metadata, *args, **kwargs)
+
+    def count(self, metadata: dict, *args, **kwargs):
+        return self.knowledge.count(metadata, *args, **kwargs)
+
+    def iter_payloads(self, *args, **kwargs):
+        return self.knowledge.iter_payloads(*args, **kwargs)
+
+    def iter_pages(self, *args, **kwargs):
+        return self.knowledge.iter_pages(*args, **kwargs)
+
+    def facet(self, *args, **kwargs):
+        return self.knowledge.facet(*args, **kwargs)
+
+    def hydrate(self, *args, **kwargs):
+        return self.knowledge.hydrate(*args, **kwargs)
+
+
+class SpooledDatabase(Database):
+    """Database whose writes go through the spool first.
+
+    Reads are served by the wrapped database and only see drained writes.
+    """
+
+    def __init__(self, database: Database, spool: Spool):
+        super().__init__()
+        self.database = database
+        self.spool = spool
+
+    def get(self, id: str, *args, **kwargs):
+        return self.database.get(id, *args, **kwargs)
+
+    def store(self, id: str, data: Any, collection: str, *args, **kwargs):
+        self.spool.append(
+            {
+                "kind": "database",
+                "op": "store",
+                "id": id,
+                "data": data,
+                "collection": collection,
+            }
+        )
+
+    def update(self, id: str, data: Any, collection: str, *args, **kwargs):
+        self.spool.append(
+            {
+                "kind": "database",
+                "op": "update",
+                "id": id,
+                "data": data,
+                "collection": collection,
+            }
+        )
+
+    def bulk_update(self, updates: dict[str, Any], collection: str, *args, **kwargs):
+        self.spool.append(
+            {
+                "kind": "database",
+                "op": "bulk_update",
+                "data": updates,
+                "collection": collection,
+            }
+        )
+
+    def bulk_increment(
+        self,
+        increments: dict[str, dict],
+        collection: str,
+        defaults: dict[str, dict] = None,
+        op_id: str = None,
+        *args,
+        **kwargs
+    ):
+        self.spool.append(
+            {
+                "kind": "database",
+                "op": "bulk_increment",
+                # Without an op id from the caller, replays of this record are
+                # still applied once
+                "op_id": op_id or uuid4().hex,
+                "data": increments,
+                "defaults": defaults,
+                "collection": collection,
+            }
+        )
+
+    def bulk_compare_and_set(
+        self, updates: dict[str, tuple[dict, int | None]], *args, **kwargs
+    ):
+        # Needs the current versions, so it cannot wait for the drainer
+        return self.database.bulk_compare_and_set(updates, *args, **kwargs)
+
+    def delete(self, id: str, *args, **kwargs):
+        return self.database.delete(id, *args, **kwargs)
+
+    def query(self, query: Any, *args, **kwargs):
+        return self.database.query(query, *args, **kwargs)
+
+    def flush(self, *args, **kwargs):
+        self.spool.flush()
@@ -0,0 +1,190 @@
+import functools
+import inspect
+import logging
+import os
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+# Both are optional: without them metrics and spans are no-ops
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs) -> "_NoopMetric":
+        return self
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def _metric(kind: str, name: str, documentation: str, labels=(), **kwargs):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return getattr(prometheus_client, kind)(name, documentation, labels, **kwargs)
+
+
+OPERATION_SECONDS = _metric(
+    "Histogram",
+    "notiziario_operation_seconds",
+    "Duration of the traced operations",
+    ("operation", "component"),
+    buckets=LATENCY_BUCKETS,
+)
+OPERATION_ERRORS = _metric(
+    "Counter",
+    "notiziario_operation_errors_total",
+    "Traced operations that raised, by exception type",
+    ("operation", "component", "error"),
+)
+IN_FLIGHT = _metric(
+    "Gauge",
+    "notiziario_in_flight",
+    "Traced operations currently running",
+    ("operation", "component"),
+)
+RETRIES = _metric(
+    "Counter",
+    "notiziario_retries_total",
+    "Retried calls (rate limits, server errors, invalid outputs)",
+    ("operation", "component", "reason"),
+)
+CACHE_LOOKUPS = _metric(
+    "Counter",
+    "notiziario_cache_lookups_total",
+    "Cache lookups by result (hit or miss)",
+    ("cache", "result"),
+)
+QUEUE_DEPTH = _metric(
+    "Gauge", "notiziario_queue_depth", "Items waiting in a queue", ("queue",)
+)
+PIPELINE_ERRORS = _metric(
+    "Counter",
+    "notiziario_pipeline_errors_total",
+    "Errors caught by the ingestion pipeline stages",
+    ("stage",),
+)
+MODEL_ROUTES = _metric(
+    "Counter",
+    "notiziario_model_routes_total",
+    "LLM calls by route: cheap model, escalated to the main model, or direct",
+    ("component", "route"),
+)
+OUTPUT_REPAIRS = _metric(
+    "Counter",
+    "notiziario_output_repairs_total",
+    "LLM outputs that were not plain JSON, by whether repairing them worked",
+    ("component", "result"),
+)
+LLM_TOKENS = _metric(
+    "Counter",
+    "notiziario_llm_tokens_total",
+    "Tokens used by the LLM calls",
+    ("component", "kind"),
+)
+
+
+def cache_lookup(cache: str, hit: bool):
+    CACHE_LOOKUPS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+@contextmanager
+def span(operation: str, component: str = "", **attributes):
+    """Time an operation into the metrics and trace it as a span."""
+    in_flight = IN_FLIGHT.labels(operation=operation, component=component)
+    in_flight.inc()
+    start = perf_counter()
+    current = (
+        trace.get_tracer(__name__).start_as_current_span(
+            f"{operation} {component}".strip(), attributes=attributes
+        )
+        if trace
+        else nullcontext()
+    )
+    try:
+        with current as s:
+            yield s
+    except Exception as e:
+        OPERATION_ERRORS.labels(
+            operation=operation, component=component, error=type(e).__name__
+        ).inc()
+        raise
+    finally:
+        in_flight.dec()
+        OPERATION_SECONDS.labels(operation=operation, component=component).observe(
+            perf_counter() - start
+        )
+
+
+def traced(operation: str, component: str = ""):
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(operation, component or fn.__name__):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(operation, component or fn.__name__):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def start_metrics_server(port: int = None) -> bool:
+    """Serve the metrics on ``port`` (``NOTIZIARIO_METRICS_PORT`` by default)."""
+    port = port or int(os.getenv("NOTIZIARIO_METRICS_PORT", "0"))
+    if not port:
+        return False
+    if prometheus_client is None:
+        logger.warning("prometheus_client is not installed, metrics are disabled")
+        return False
+    prometheus_client.start_http_server(port)
+    logger.info(f"Serving metrics on port {port}")
+    return True
+
+
+def metrics_text() -> tuple[bytes, str]:
+    """The metrics in the Prometheus text format and their content type."""
+    if prometheus_client is None:
+        return b"", "text/plain"
+    return prometheus_client.generate_latest(), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def setup_tracing(service_name: str) -> bool:
+    """Export spans over OTLP when ``OTEL_EXPORTER_OTLP_ENDPOINT`` is set."""
+    if not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return False
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning("opentelemetry-sdk is not installed, tracing is disabled")
+        return False
+
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    logger.info(f"Exporting traces of {service_name}")
+    return True
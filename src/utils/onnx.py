@@ -0,0 +1,96 @@
+import logging
+import os
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+OPTIMIZED_DIR = "optimized"
+
+
+def optimized_model_dir(cache_dir: str, model_dir: str) -> str:
+    """Where the optimized copy of a cached model directory is kept."""
+    relative = os.path.relpath(os.path.realpath(model_dir), os.path.realpath(cache_dir))
+    if relative.startswith(os.pardir):
+        relative = os.path.basename(os.path.realpath(model_dir))
+    return os.path.join(cache_dir, OPTIMIZED_DIR, relative)
+
+
+def _mirror(model_dir: str, target_dir: str, model_file: str):
+    """Link every file of the model directory but the model itself into target."""
+    for root, _, files in os.walk(model_dir, followlinks=True):
+        for name in files:
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, model_dir)
+            if relative == model_file:
+                continue
+            link = os.path.join(target_dir, relative)
+            if not os.path.lexists(link):
+                os.makedirs(os.path.dirname(link), exist_ok=True)
+                os.symlink(os.path.realpath(path), link)
+
+
+def optimize_onnx_model(cache_dir: str, model_dir: str, model_file: str) -> str | None:
+    """Save the graph-optimized version of a cached ONNX model.
+
+    The optimized graph goes into a copy of the model directory under
+    ``<cache_dir>/optimized`` (the other files are symlinked), so the shared
+    Hugging Face cache is never modified. Returns that directory, or None if
+    the model could not be optimized.
+    """
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        logger.warning("onnxruntime is not installed, skipping ONNX optimization")
+        return None
+
+    target_dir = optimized_model_dir(cache_dir, model_dir)
+    target = os.path.join(target_dir, model_file)
+    if os.path.exists(target):
+        return target_dir
+
+    tmp_path = f"{target}.tmp"
+    options = ort.SessionOptions()
+    # Extended optimizations stay portable across CPUs, unlike "all"
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    options.optimized_model_filepath = tmp_path
+    try:
+        _mirror(model_dir, target_dir, model_file)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        ort.InferenceSession(
+            os.path.join(model_dir, model_file),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        # The model file is written last: its presence marks a complete copy
+        os.replace(tmp_path, target)
+        logger.info(f"Saved optimized ONNX model {target}")
+        return target_dir
+    except Exception as e:
+        logger.error(f"Could not optimize ONNX model {model_file} in {model_dir}")
+        logger.error(e)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+
+def use_optimized_models(cache_dir: str, models: list):
+    """Point lazily loaded fastembed models at their optimized copy.
+
+    fastembed optimizes every model graph each time it creates a session;
+    loading the saved optimized graph instead makes that mostly free. The
+    models must be created with ``lazy_load=True`` and not used yet.
+    """
+    for wrapper in models:
+        # TextEmbedding and SparseTextEmbedding wrap the actual ONNX model
+        model = getattr(wrapper, "model", None)
+        description = getattr(model, "model_description", None)
+        model_dir = getattr(model, "_model_dir", None)
+        if not description or model_dir is None:
+            continue
+        if getattr(model, "model", None) is not None:
+            continue
+        target_dir = optimize_onnx_model(
+            cache_dir, str(model_dir), description["model_file"]
+        )
+        if target_dir:
+            model._model_dir = Path(target_dir)
@@ -0,0 +1,31 @@
+import logging
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Wall-clock time of the startup phases of a process.
+
+    ``mark`` closes the phase that started at the previous mark (or when the
+    timer was created), so importing this module first makes the first phase
+    measure the imports of the entry point.
+    """
+
+    def __init__(self):
+        self.started = self._last = perf_counter()
+        self.phases: list[tuple[str, float]] = []
+
+    def mark(self, phase: str):
+        now = perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self):
+        total = self._last - self.started
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases)
+        logger.info(f"Started in {total:.2f}s ({phases})")
+        return dict(self.phases)
+
+
+startup = StartupTimer()
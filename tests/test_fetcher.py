@@ -0,0 +1,71 @@
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("feedparser")
+pytest.importorskip("bs4")
+
+from benchmarks.feeds import FeedServer, generate_feed  # noqa: E402
+from src.databases.database import InMemoryDatabase  # noqa: E402
+from src.feeds.fetcher import FeedFetcher  # noqa: E402
+
+
+class Country:
+    def __init__(self, name: str):
+        self._name = name
+
+    def name(self):
+        return self._name
+
+    def language(self):
+        return "en"
+
+
+ITALY = Country("ITALY")
+
+
+@pytest.fixture
+def server(tmp_path):
+    feed = generate_feed(ITALY.name(), page=0, items=5)
+    # The same entry twice in one feed
+    first = feed[feed.index(b"<item>") : feed.index(b"</item>") + len(b"</item>")]
+    feed = feed.replace(first, first * 2, 1)
+    (tmp_path / "ITALY.xml").write_bytes(feed)
+
+    server = FeedServer(fixtures_dir=str(tmp_path)).start()
+    yield server
+    server.stop()
+
+
+def test_duplicate_entries_are_returned_once(server):
+    fetcher = FeedFetcher(url_template=server.url_template)
+    news = fetcher.fetch(ITALY)
+    assert len(news) == 5
+    assert len({article.id for article in news}) == 5
+
+
+def test_conditional_get_after_acknowledge(server):
+    database = InMemoryDatabase()
+    fetcher = FeedFetcher(database, url_template=server.url_template)
+    news = fetcher.fetch(ITALY)
+
+    # Leftovers: the validators are dropped so the next request is not a 304
+    fetcher.acknowledge(ITALY, news[:3])
+    leftovers = fetcher.fetch(ITALY)
+    assert [article.id for article in leftovers] == [article.id for article in news[3:]]
+    assert not server.not_modified
+
+    fetcher.acknowledge(ITALY, leftovers)
+    assert fetcher.fetch(ITALY) == []
+    assert server.not_modified == {"ITALY": 1}
+
+    # The state is persisted: a new fetcher sends the ETag and skips seen entries
+    restarted = FeedFetcher(database, url_template=server.url_template)
+    assert restarted.fetch(ITALY) == []
+    assert server.not_modified == {"ITALY": 2}
+    restarted._states.clear()
+    database.update(
+        id=restarted.url(ITALY),
+        data={"etag": None, "last_modified": None},
+        collection=FeedFetcher.collection,
+    )
+    assert restarted.fetch(ITALY) == []
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from src.aggregators.materialized import MaterializedWindows  # noqa: E402
+from src.databases.database import InMemoryDatabase  # noqa: E402
+from src.dataclasses.aggregators import KeywordsAggregation  # noqa: E402
+from src.query.query_builder import QueryBuilder  # noqa: E402
+
+
+def aggregate(database, windows, id, date_time, keywords, country):
+    aggregation = KeywordsAggregation(_id=id, date_time=date_time, keywords=keywords)
+    database.store(id, aggregation.to_dict(), collection="keywords_aggregations")
+    windows.update({"keywords": aggregation}, {"country": country})
+
+
+def test_quiet_countries_expire_on_any_write():
+    database = InMemoryDatabase()
+    windows = MaterializedWindows(database, windows={"1h": timedelta(hours=1)})
+    query_builder = QueryBuilder(None, database)
+    now = datetime.now()
+
+    aggregate(database, windows, "it", now - timedelta(minutes=50), {"pizza": 2}, "IT")
+    aggregate(database, windows, "us", now, {"pizza": 1, "nba": 1}, "US")
+    assert query_builder.get_window("1h", "IT").keywords == {"pizza": 2}
+
+    # What the next write, from any country, does once IT fell out of the window
+    windows.expire(now + timedelta(minutes=30))
+    assert query_builder.get_window("1h", "IT").keywords == {}
+    assert query_builder.get_window("1h", "all").keywords == {"pizza": 1, "nba": 1}
+    # Replaying an expiry does not subtract twice
+    windows.expire(now + timedelta(minutes=30))
+    assert query_builder.get_window("1h", "all").keywords == {"pizza": 1, "nba": 1}
+
+
+def test_window_read_is_a_single_lookup():
+    database = InMemoryDatabase()
+    windows = MaterializedWindows(database)
+    aggregate(database, windows, "a", datetime.now(), {"pizza": 1}, "IT")
+
+    database.query = None
+    view = QueryBuilder(None, database).get_window("24h", "IT")
+    assert view.keywords == {"pizza": 1}
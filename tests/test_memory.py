@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.databases.memory import MemoryCollection, match
+
+START = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def collection():
+    collection = MemoryCollection(
+        [("date_time", "sorted"), ("metadata.country", "hash")]
+    )
+    for i, (id, country) in enumerate(
+        [("c", "us"), ("a", "fr"), ("e", "us"), ("b", "de"), ("d", "us")]
+    ):
+        collection.insert(
+            id,
+            {
+                "date_time": START + timedelta(hours=i),
+                "metadata": {"country": country},
+                "count": i,
+            },
+        )
+    return collection
+
+
+def ids(documents):
+    return [document["_id"] for document in documents]
+
+
+def test_match_operators():
+    document = {"a": 1, "tags": ["x", "y"], "nested": {"b": "z"}}
+    assert match(document, {"a": {"$gte": 1, "$lt": 2}})
+    assert match(document, {"tags": "x", "nested.b": {"$in": ["z"]}})
+    assert match(document, {"missing": None, "a": {"$exists": True}})
+    assert match(document, {"$or": [{"a": 2}, {"nested.b": "z"}]})
+    assert not match(document, {"$nor": [{"a": 1}]})
+    assert not match(document, {"a": {"$ne": 1}})
+    with pytest.raises(ValueError):
+        match(document, {"a": {"$regex": "1"}})
+
+
+def test_find_by_id_in_is_sorted(collection):
+    query = {"_id": {"$in": ["c", "a", "b"]}}
+    assert ids(collection.find(query, sort_by="_id", limit=1)) == ["a"]
+    assert ids(collection.find(query, sort_by="_id", ascending=False)) == [
+        "c",
+        "b",
+        "a",
+    ]
+
+
+def test_find_by_hash_index_is_sorted(collection):
+    query = {"metadata.country": {"$in": ["us", "de"]}}
+    result = collection.find(query, sort_by="metadata.country", limit=1)
+    assert [d["metadata"]["country"] for d in result] == ["de"]
+    result = collection.find({"metadata.country": "us"}, sort_by="count")
+    assert ids(result) == ["c", "e", "d"]
+
+
+def test_find_by_sorted_index(collection):
+    query = {"date_time": {"$gte": START + timedelta(hours=1)}}
+    assert ids(collection.find(query, sort_by="date_time", limit=2)) == ["a", "e"]
+    result = collection.find(query, sort_by="date_time", ascending=False, limit=2)
+    assert ids(result) == ["d", "b"]
+
+
+def test_find_scans_sort_index_without_filter(collection):
+    collection.insert("undated", {"count": 9})
+    assert ids(collection.find({}, sort_by="date_time", limit=2)) == ["undated", "c"]
+    result = collection.find({}, sort_by="date_time", ascending=False)
+    assert ids(result) == ["d", "b", "e", "a", "c", "undated"]
+
+
+def test_modify_keeps_indexes_current(collection):
+    collection.modify("c", {"metadata.country": "fr"})
+    collection.modify("a", {"count": 10}, increment=True)
+    collection.modify("new", {"count": 1}, increment=True, defaults={"kind": "x"})
+    assert ids(collection.find({"metadata.country": "fr"}, sort_by="_id")) == [
+        "a",
+        "c",
+    ]
+    assert collection.get("a")["count"] == 11
+    assert collection.get("new") == {"_id": "new", "kind": "x", "count": 1}
+
+
+def test_remove(collection):
+    collection.remove("e")
+    assert ids(collection.find({"metadata.country": "us"}, sort_by="_id")) == [
+        "c",
+        "d",
+    ]
+    assert "e" not in ids(collection.find({}, sort_by="date_time"))
@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+from src.agents.pipeline import IngestionPipeline
+
+
+def article(id: str):
+    return SimpleNamespace(id=id)
+
+
+def test_only_stored_and_skipped_articles_are_handled():
+    news = [article(id) for id in ("seen", "ok", "failed", "unwritten", "extra")]
+    handled = {}
+
+    def enrich(country, item):
+        if item.id == "failed":
+            # Enrichers swallow LLM errors and return None
+            return None
+        return item
+
+    def store(country, batch):
+        if any(item.id == "unwritten" for item in batch):
+            raise ConnectionError("knowledge is down")
+
+    pipeline = IngestionPipeline(
+        fetch=lambda country: news,
+        is_new=lambda country, item: item.id != "seen",
+        enrich=enrich,
+        store=store,
+        aggregate=lambda country, batch: None,
+        max_per_country=3,
+        on_handled=lambda country, items: handled.update(
+            {country: [item.id for item in items]}
+        ),
+        write_batch_size=1,
+    )
+    stats = pipeline.run(["IT"])
+
+    # "extra" is past max_per_country and is left for the next poll too
+    assert handled == {"IT": ["seen", "ok"]}
+    assert stats["IT"].stored == 1
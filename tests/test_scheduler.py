@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta
+
+from src.agents.scheduler import AdaptiveScheduler
+
+
+def test_slots_are_aligned_to_interval_boundaries():
+    start = datetime.fromtimestamp(1_700_000_000)  # 22:13:20 UTC
+    interval = timedelta(minutes=10)
+    scheduler = AdaptiveScheduler(["IT"], base_interval=interval, jitter=0)
+    schedule = scheduler.schedules["IT"]
+    boundary = datetime.fromtimestamp(1_700_000_400)  # 22:20:00 UTC
+
+    # Polled at start, then at the next boundary instead of start + interval
+    scheduler.record("IT", new=3, capacity=10, now=start)
+    assert schedule.slot == boundary
+
+    # A slow poll does not delay the following slot
+    scheduler.record("IT", new=3, capacity=10, now=boundary + timedelta(minutes=4))
+    assert schedule.slot == boundary + interval
+
+    # An overrun poll skips to the next boundary
+    scheduler.record("IT", new=3, capacity=10, now=boundary + timedelta(minutes=25))
+    assert schedule.slot == boundary + 3 * interval
+
+    # A new interval is aligned to its own boundaries
+    scheduler.record("IT", new=8, capacity=10, now=boundary + timedelta(minutes=31))
+    assert schedule.interval == timedelta(minutes=5)
+    assert schedule.slot == boundary + timedelta(minutes=35)
+    assert schedule.next_run == schedule.slot
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("pymongo")
+pytest.importorskip("qdrant_client")
+
+from aiohttp.test_utils import TestClient, TestServer  # noqa: E402
+
+from src.dataclasses.aggregators import KeywordsAggregation  # noqa: E402
+from src.query.query_builder import AsyncQueryBuilder  # noqa: E402
+from src.service.search_service import SearchService  # noqa: E402
+
+
+class SlowDatabase:
+    def __init__(self):
+        self.queries = 0
+        self.closed = False
+
+    async def query(self, query, collection, *args, **kwargs):
+        self.queries += 1
+        # Yields to the loop, so that other requests are served meanwhile
+        await asyncio.sleep(0.05)
+        aggregation = KeywordsAggregation.empty()
+        aggregation.keywords = {"pizza": 2, "nba": 1}
+        return [aggregation.to_dict()]
+
+    async def close(self):
+        self.closed = True
+
+
+class Knowledge:
+    async def retrieve(self, *args, **kwargs):
+        return []
+
+    async def close(self):
+        pass
+
+
+def test_requests_are_served_on_the_event_loop():
+    database = SlowDatabase()
+    service = SearchService(AsyncQueryBuilder(Knowledge(), database))
+
+    async def main():
+        async with TestClient(TestServer(service.app())) as client:
+            warm_up = database.queries
+            url = "/keywords?start=2025-01-01&end=2025-02-01&top_k=1"
+            responses = await asyncio.gather(*[client.get(url) for _ in range(5)])
+            assert [await response.json() for response in responses] == [
+                {"pizza": 2}
+            ] * 5
+            return database.queries - warm_up
+
+    # Identical requests in flight share one query
+    assert asyncio.run(main()) == 1
+    assert service.coalesced == 4
+    assert database.closed
@@ -0,0 +1,132 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from src.databases.database import InMemoryDatabase  # noqa: E402
+from src.spool.spool import (  # noqa: E402
+    Spool,
+    SpoolDrainer,
+    SpooledDatabase,
+    SpooledKnowledge,
+)
+
+
+@pytest.fixture
+def spool(tmp_path):
+    spool = Spool(str(tmp_path))
+    yield spool
+    spool.close()
+
+
+def test_replayed_increments_are_applied_once(spool, tmp_path):
+    database = InMemoryDatabase()
+    spooled = SpooledDatabase(database, spool)
+    spooled.bulk_increment({"a": {"count": 1}}, collection="c", defaults={"a": {}})
+    spooled.bulk_increment({"a": {"count": 2}, "b": {"count": 5}}, collection="c")
+
+    assert SpoolDrainer(spool, None, database).drain() == 2
+    # Crash before the checkpoint was written: everything is replayed
+    os.remove(os.path.join(tmp_path, "checkpoint.json"))
+    assert SpoolDrainer(Spool(str(tmp_path)), None, database).drain() == 2
+
+    assert database.get("a", collection="c")["count"] == 3
+    assert database.get("b", collection="c")["count"] == 5
+
+
+def test_failing_record_is_dead_lettered(spool, tmp_path):
+    database = InMemoryDatabase()
+    spooled = SpooledDatabase(database, spool)
+    spooled.bulk_increment({"a": {"count": 1}}, collection="c")
+    spool.append({"kind": "database", "op": "unknown"})
+    spooled.bulk_increment({"a": {"count": 1}}, collection="c")
+
+    drainer = SpoolDrainer(spool, None, database, max_failures=3)
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            drainer.drain()
+    # The records before the failing one are committed once
+    assert database.get("a", collection="c")["count"] == 1
+    assert drainer.drain() == 2
+
+    assert database.get("a", collection="c")["count"] == 2
+    assert not spool.pending_bytes
+    with open(os.path.join(tmp_path, "dead-letter.log")) as f:
+        assert '"op": "unknown"' in f.read()
+
+
+class Outage(InMemoryDatabase):
+    """Database that is unreachable for the first ``failures`` increments."""
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    def bulk_increment(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database is down")
+        return super().bulk_increment(*args, **kwargs)
+
+
+def test_outage_is_retried_not_dead_lettered(spool, tmp_path):
+    database = Outage(failures=10)
+    SpooledDatabase(database, spool).bulk_increment({"a": {"count": 1}}, collection="c")
+
+    drainer = SpoolDrainer(spool, None, database, max_failures=3)
+    for _ in range(10):
+        with pytest.raises(ConnectionError):
+            drainer.drain()
+    assert drainer.drain() == 1
+
+    assert database.get("a", collection="c")["count"] == 1
+    assert not os.path.exists(os.path.join(tmp_path, "dead-letter.log"))
+
+
+def test_caller_op_id_is_kept(spool):
+    database = InMemoryDatabase()
+    spooled = SpooledDatabase(database, spool)
+    # A caller retrying the same increment
+    for _ in range(2):
+        spooled.bulk_increment({"a": {"count": 1}}, collection="c", op_id="op-1")
+
+    assert SpoolDrainer(spool, None, database).drain() == 2
+    assert database.get("a", collection="c")["count"] == 1
+
+
+class Article(SimpleNamespace):
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class Stories:
+    """Knowledge that puts the articles of the same topic in one story."""
+
+    db = None
+
+    def __init__(self, down: bool = False):
+        self.down = down
+
+    def assign_stories(self, data):
+        if self.down:
+            raise ConnectionError("qdrant is down")
+        first = {}
+        for item in data:
+            item.story_id = first.setdefault(item.topic, item.id)
+
+
+def test_stories_are_assigned_before_spooling(spool):
+    articles = [Article(id=id, topic=topic) for id, topic in (("a", 1), ("b", 1))]
+    SpooledKnowledge(Stories(), spool).store(articles, [{}, {}])
+    # Aggregators run on the articles right after store, before the drain
+    assert [item.story_id for item in articles] == ["a", "a"]
+
+    late = [Article(id="c", topic=2, story_id=None)]
+    SpooledKnowledge(Stories(down=True), spool).store(late, [{}])
+
+    records = [record for record, _, _ in spool.read(spool.position)]
+    assert [item["story_id"] for item in records[0]["data"]] == ["a", "a"]
+    # Left to the drainer when stories cannot be assigned
+    assert records[1]["data"][0]["story_id"] is None
@@ -0,0 +1,38 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from src.aggregators.aggregator import KeywordTrendAggregator  # noqa: E402
+from src.databases.database import InMemoryDatabase  # noqa: E402
+
+
+def articles(*keywords):
+    return [
+        SimpleNamespace(id=str(i), story_id=None, keywords=[keyword])
+        for i, keyword in enumerate(keywords)
+    ]
+
+
+def test_batches_of_a_period_are_one_cycle():
+    database = InMemoryDatabase()
+    trends = KeywordTrendAggregator(database, warmup_cycles=0)
+    metadata = {"country": "IT"}
+
+    for period in (100, 200):
+        # Several batches per period, as aggregated by the agents
+        trends.add_to_period(articles("pizza"), metadata, period)
+        trends.add_to_period(articles("pizza", "nba"), metadata, period)
+    trends.add_to_period(articles("pizza"), metadata, 300)
+
+    result = trends.close_periods(metadata, before=300)
+    assert result.cycle == 2
+    state = database.get("IT::pizza", collection="keyword_trend_state")
+    assert state["cycle"] == 2
+    assert state["mean"] == pytest.approx(0.3 * 2 + 0.7 * 0.3 * 2)
+
+    # A retried close does not fold the same periods again
+    trends.add_to_period(articles("pizza"), metadata, 200)
+    assert trends.close_periods(metadata, before=300).cycle == 2
+    assert trends.close_periods(metadata, before=400).cycle == 3